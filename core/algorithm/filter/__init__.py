@@ -1 +1,3 @@
-from kalman_filter import AdaptionKalmanFilter
+from .kalman_filter import AdaptionKalmanFilter, MultiChannelAdaptionKalmanFilter
+from .linear_kalman_filter import LinearKalmanFilter, ExtendedKalmanFilter, JointKalmanFilter
+from .window_stats import SlidingWindowStats
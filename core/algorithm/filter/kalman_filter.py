@@ -19,13 +19,210 @@ Parameters.
 Methods: apply_filter(data)
 - apply_filter(data): applies a Kalman filter to the given one-dimensional data and returns the filtered result.
 - demo(): A static method that demonstrates how to use the Kalman filter on random data and plot the results.
+  matplotlib is only imported by the demo (see plot_demo), the filters do not need it.
 """
 
-import matplotlib
-import matplotlib.pyplot as plt
 import numpy as np
+from algorithm.filter.window_stats import SlidingWindowStats
 
-matplotlib.use('TkAgg')
+# Rows of MultiChannelAdaptionKalmanFilter._state, the state of the kernel
+_X_HAT, _P, _Q, _R, _K, _LAST_ME, _ME_MEAN, _LAST_INNOV, _INNOV_MEAN, _INNOV_M2 = range(10)
+# Tuning parameters in the order of the params of the kernel
+_TUNING_PARAMS = ("measurement_error_adapt_rate", "max_q", "max_r", "min_q", "min_r", "innovation_adapt_rate",
+                  "target_cov", "residual_adapt_rate")
+
+
+def _adaption_kalman_kernel(data, out, state, me_ring, innov_ring, counters, params, process_types,
+                            use_me, use_innov):
+    """
+    All the channels over many samples, the same steps as AdaptionKalmanFilter.process_measurement per channel.
+    Only indexing is used, so numba compiles it, it still runs in Python to debug it.
+    The windows are updated like SlidingWindowStats.push, in the same order of operations.
+    :param data: (N, n) samples, one row per channel
+    :param out: (N, n) filtered samples
+    :param state: (10, N) x_hat, P, Q, R, K, last measurement error, measurement error window mean, last innovation,
+    innovation window mean / M2, one column per channel, the way 0 only reads the mean of its window
+    :param me_ring: (mean_width, N) measurement error trend windows
+    :param innov_ring: (cov_width, N) innovation trend windows
+    :param counters: has last measurement error, me_ring index / count, has last innovation, innov_ring index / count,
+    the windows of all the channels move together
+    :param params: (8, N) measurement_error_adapt_rate, max_q, max_r, min_q, min_r, innovation_adapt_rate, target_cov,
+    residual_adapt_rate
+    :param process_types: (N,) -1 (fixed Q and R) / 0 / 1 / 2 of every channel
+    :param use_me: some channel uses the way 0, the window is kept for it
+    :param use_innov: some channel uses the way 1, the window is kept for it
+    """
+    me_width = len(me_ring)
+    innov_width = len(innov_ring)
+    # Every channel starts from the counters, they are also set here for numba, which needs them after the loop
+    has_last_me = counters[0]
+    me_index = counters[1]
+    me_count = counters[2]
+    has_last_innov = counters[3]
+    innov_index = counters[4]
+    innov_count = counters[5]
+    for channel in range(len(process_types)):
+        channel_data = data[channel]
+        channel_out = out[channel]
+        process_type = process_types[channel]
+        x_hat = state[0][channel]
+        p = state[1][channel]
+        q = state[2][channel]
+        r = state[3][channel]
+        k = state[4][channel]
+        last_me = state[5][channel]
+        me_mean = state[6][channel]
+        last_innov = state[7][channel]
+        innov_mean = state[8][channel]
+        innov_m2 = state[9][channel]
+        has_last_me = counters[0]
+        me_index = counters[1]
+        me_count = counters[2]
+        has_last_innov = counters[3]
+        innov_index = counters[4]
+        innov_count = counters[5]
+        me_rate = params[0][channel]
+        max_q = params[1][channel]
+        max_r = params[2][channel]
+        min_q = params[3][channel]
+        min_r = params[4][channel]
+        innov_rate = params[5][channel]
+        target_cov = params[6][channel]
+        residual_rate = params[7][channel]
+        for i in range(len(channel_data)):
+            value = channel_data[i]
+            p_minus = p + q
+            k = p_minus / (p_minus + r)
+            innovation = value - x_hat
+            correction = k * innovation
+            x_hat = x_hat + correction
+            # Like the single channel filter, k * r would give 0 * inf once R overflows
+            p = (1 - k) * p_minus
+            error = innovation - correction
+            channel_out[i] = x_hat
+
+            if use_me:
+                error_abs = abs(error)
+                if has_last_me:
+                    trend = error_abs - last_me
+                    if me_count < me_width:
+                        me_ring[me_index][channel] = trend
+                        me_count += 1
+                        me_mean = me_mean + (trend - me_mean) / me_count
+                    else:
+                        delta = trend - me_ring[me_index][channel]
+                        me_ring[me_index][channel] = trend
+                        me_mean = me_mean + delta / me_width
+                    me_index = (me_index + 1) % me_width
+                    if me_index == 0:
+                        total = 0.0
+                        for j in range(me_width):
+                            total += me_ring[j][channel]
+                        me_mean = total / me_width
+                    if process_type == 0:
+                        factor = 1.0 + me_rate * (me_mean > 0) - me_rate * (me_mean < 0)
+                        q = max(min(q * factor, max_q), min_q)
+                        r = max(min(r * factor, max_r), min_r)
+                last_me = error_abs
+                has_last_me = 1
+            if use_innov:
+                if has_last_innov:
+                    trend = error - last_innov
+                    if innov_count < innov_width:
+                        innov_ring[innov_index][channel] = trend
+                        innov_count += 1
+                        delta = trend - innov_mean
+                        innov_mean = innov_mean + delta / innov_count
+                        innov_m2 = innov_m2 + delta * (trend - innov_mean)
+                    else:
+                        old = innov_ring[innov_index][channel]
+                        innov_ring[innov_index][channel] = trend
+                        delta = trend - old
+                        mean = innov_mean + delta / innov_width
+                        innov_m2 = innov_m2 + delta * ((trend - mean) + (old - innov_mean))
+                        innov_mean = mean
+                    innov_index = (innov_index + 1) % innov_width
+                    if innov_index == 0:
+                        total = 0.0
+                        for j in range(innov_width):
+                            total += innov_ring[j][channel]
+                        innov_mean = total / innov_width
+                        innov_m2 = 0.0
+                        for j in range(innov_width):
+                            innov_m2 += (innov_ring[j][channel] - innov_mean) * (innov_ring[j][channel] - innov_mean)
+                    if process_type == 1:
+                        if max(innov_m2 / innov_count, 0.0) > target_cov:
+                            q = q * (1 + innov_rate)
+                            r = r * (1 - innov_rate)
+                        else:
+                            q = q * ((1 - innov_rate) * (1 - innov_rate))
+                            r = r * (1 + innov_rate)
+                        q = max(min(q, max_q), min_q)
+                        r = max(min(r, max_r), min_r)
+                last_innov = error
+                has_last_innov = 1
+            if process_type == 2:
+                residual_q = k * error
+                residual_r = error - residual_q
+                q = q + residual_rate * (residual_q * residual_q - q)
+                r = r + residual_rate * (residual_r * residual_r - r)
+
+        state[0][channel] = x_hat
+        state[1][channel] = p
+        state[2][channel] = q
+        state[3][channel] = r
+        state[4][channel] = k
+        state[5][channel] = last_me
+        state[6][channel] = me_mean
+        state[7][channel] = last_innov
+        state[8][channel] = innov_mean
+        state[9][channel] = innov_m2
+    # Every channel ends with the same counters
+    counters[0] = has_last_me
+    counters[1] = me_index
+    counters[2] = me_count
+    counters[3] = has_last_innov
+    counters[4] = innov_index
+    counters[5] = innov_count
+
+
+def _resize_ring(ring, index, count, width):
+    """(ring, index, count, mean, M2) of a window of width with the newest values, like SlidingWindowStats.resize"""
+    window = SlidingWindowStats(width, ring.shape[1:])
+    values = ring[:count] if count < len(ring) else np.concatenate((ring[index:], ring[:index]))
+    for value in values[len(values) - width:] if len(values) > width else values:
+        window.push(value)
+    return window.get_state()
+
+# numba takes longer to import than the rest, it is loaded by the first MultiChannelAdaptionKalmanFilter
+_compiled_kernel = None
+
+
+def _get_compiled_kernel():
+    """The kernel compiled by numba"""
+    global _compiled_kernel
+    if _compiled_kernel is None:
+        try:
+            from numba import njit
+        except ImportError as e:
+            raise ImportError("MultiChannelAdaptionKalmanFilter needs numba, "
+                              "run python -m pip install -r requirements.txt") from e
+        _compiled_kernel = njit(cache=True)(_adaption_kalman_kernel)
+    return _compiled_kernel
+
+
+def _fixed_loop(values, Q, R):
+    """The Python loop complete_measurement had, for the fixed Q and R"""
+    x_hat = np.zeros(len(values))
+    P = np.zeros(len(values))
+    x_hat[0] = values[0]
+    P[0] = 1.0
+    for k in range(1, len(values)):
+        p_minus = P[k - 1] + Q
+        K = p_minus / (p_minus + R)
+        x_hat[k] = x_hat[k - 1] + K * (values[k] - x_hat[k - 1])
+        P[k] = (1 - K) * p_minus
+    return x_hat
 
 
 class AdaptionKalmanFilter:
@@ -42,7 +239,6 @@ class AdaptionKalmanFilter:
 
         # update Way0 Suitable for large fluctuations
         self.last_measurement_error = None
-        self.measurement_error_sequence = []
         self.mean_width = 10
         self.measurement_error_adapt_rate = 0.15
         self.max_q = 1e-2
@@ -52,7 +248,6 @@ class AdaptionKalmanFilter:
 
         # update Way1 Suitable for processing with small fluctuations
         self.last_innovation = None
-        self.innovation_sequence = []
         self.cov_width = 10
         self.target_cov = 1
         self.innovation_adapt_rate = 0.2
@@ -60,6 +255,18 @@ class AdaptionKalmanFilter:
         # update Way2 Balance fluctuations and responses
         self.residual_adapt_rate = 1e-3
 
+        # Sliding windows of the trends, their width follows mean_width and cov_width
+        self._measurement_error_window = SlidingWindowStats(self.mean_width)
+        self._innovation_window = SlidingWindowStats(self.cov_width)
+
+    @property
+    def measurement_error_sequence(self) -> list:
+        return self._measurement_error_window.values()
+
+    @property
+    def innovation_sequence(self) -> list:
+        return self._innovation_window.values()
+
     def print_info(self):
         print(f'Q: {self.Q}, R: {self.R} '
               f' \n WAY0 \n '
@@ -94,17 +301,16 @@ class AdaptionKalmanFilter:
         """
         Dynamically update the Q and R parameters based on the trend of the measurement error.
         """
-        # Add the current error to the trend list
+        # Add the current error to the trend window, considering only the N most recent measurements
+        window = self._measurement_error_window
+        if window.width != self.mean_width:
+            window.resize(self.mean_width)
         if self.last_measurement_error is not None:
-            self.measurement_error_sequence.append(measurement_error - self.last_measurement_error)
-
-        # Maintain the length of the error trend list, considering only the N most recent measurements
-        if len(self.measurement_error_sequence) > self.mean_width:
-            self.measurement_error_sequence.pop(0)
+            window.push(measurement_error - self.last_measurement_error)
 
-        # Calculate the mean of the error trend
-        if self.measurement_error_sequence:
-            avg_trend = sum(self.measurement_error_sequence) / len(self.measurement_error_sequence)
+        # The running mean of the error trend
+        if len(window):
+            avg_trend = window.mean
 
             # Adjust Q and R for error trend
             if avg_trend > 0:
@@ -122,17 +328,16 @@ class AdaptionKalmanFilter:
         """
         Dynamically update the Q and R parameters based on the cov of the innovation.
         """
-        # Add the current error to the trend list
+        # Add the current error to the trend window, considering only the N most recent measurements
+        window = self._innovation_window
+        if window.width != self.cov_width:
+            window.resize(self.cov_width)
         if self.last_innovation is not None:
-            self.innovation_sequence.append(innovation - self.last_innovation)
+            window.push(innovation - self.last_innovation)
 
-        # Maintain the length of the error trend list, considering only the N most recent measurements
-        if len(self.innovation_sequence) > self.cov_width:
-            self.innovation_sequence.pop(0)
-
-        # Calculate the mean of the error trend
-        if self.innovation_sequence:
-            innovate_var = np.var(self.innovation_sequence[-len(self.innovation_sequence):])
+        # The running variance of the error trend
+        if len(window):
+            innovate_var = window.var
 
             # Adjust Q and R for error trend
             if innovate_var > self.target_cov:
@@ -143,8 +348,11 @@ class AdaptionKalmanFilter:
                 self.Q *= 1 - self.innovation_adapt_rate
                 self.Q *= 1 - self.innovation_adapt_rate  # Instead, decrease the process noise estimate
                 self.R *= 1 + self.innovation_adapt_rate  # and increase the observation noise estimate
+            # Keep them in the Way0 bounds, unbounded Q goes to 0 and R to inf and the output freezes
+            self.Q = max(min(self.Q, self.max_q), self.min_q)
+            self.R = max(min(self.R, self.max_r), self.min_r)
 
-        self.last_innovations = innovation
+        self.last_innovation = innovation
 
     def _update_parameters_residual(self, data, K):
         """
@@ -186,62 +394,356 @@ class AdaptionKalmanFilter:
 
         return self.x_hat
 
-    def complete_measurement(self, data):
+    def complete_measurement(self, data, process_type=None, chunk_size=0x10000):
         """
         Processes complete measurements and updates Q and R dynamically.
+        The filter itself is not changed, every call starts from data[0].
+        :param data: (n,) samples, or (n, channels) samples of many channels
+        :param process_type: None keeps Q and R fixed, 0 / 1 / 2 adapts them like process_measurement
+        :param chunk_size: samples filtered at once, see MultiChannelAdaptionKalmanFilter.process_chunks
+        :return: filtered samples, same shape as data
         """
-        n = len(data)
-        x_hat = np.zeros(n)  # Filtered state estimate
-        P = np.zeros(n)  # Filtered state covariance matrix
-        x_hat_minus = np.zeros(n)  # Predicted state estimate
-        p_minus = np.zeros(n)  # Predicted state covariance matrix
-        K = np.zeros(n)  # Kalman gain
+        data = np.asarray(data, dtype=float)
+        samples = data.reshape(len(data), -1)
+        batch_filter = MultiChannelAdaptionKalmanFilter(samples.shape[1])
+        for attr_name in ("Q", "R", "mean_width", "measurement_error_adapt_rate", "max_q", "max_r", "min_q", "min_r",
+                          "cov_width", "target_cov", "innovation_adapt_rate", "residual_adapt_rate"):
+            batch_filter.update_value(attr_name, getattr(self, attr_name))
+        x_hat = np.empty_like(samples)
+        for start in range(0, len(samples), chunk_size):
+            batch_filter.process_batch(samples[start:start + chunk_size], process_type,
+                                       out=x_hat[start:start + chunk_size])
+        return x_hat.reshape(data.shape)
 
-        x_hat[0] = data[0]
-        P[0] = 1.0
+    @staticmethod
+    def demo():
+        # Loaded here, so importing the filter does not import matplotlib and Tk
+        from algorithm.filter.plot_demo import adaption_kalman_filter_demo
+        adaption_kalman_filter_demo()
 
-        for k in range(1, n):
-            x_hat_minus[k] = x_hat[k - 1]
-            p_minus[k] = P[k - 1] + self.Q
-            K[k] = p_minus[k] / (p_minus[k] + self.R)
-            x_hat[k] = x_hat_minus[k] + K[k] * (data[k] - x_hat_minus[k])
-            P[k] = (1 - K[k]) * p_minus[k]
 
-        return x_hat
+class MultiChannelAdaptionKalmanFilter:
+    """
+    AdaptionKalmanFilter over N channels at once, e.g. six joint angles and six torques.
+    Q, R, P, x_hat and K are arrays with one value per channel, one process_measurement call updates all the
+    channels. Every channel adapts its own Q and R, the tuning parameters are shared (they could also be set to arrays
+    of N values). The Way0 and Way1 updates keep Q and R in [min, max], like AdaptionKalmanFilter.
+    The state of all the channels is one (10, N) array in the layout of the kernel, Q, R, P, x_hat and K are views of
+    its rows, so process_measurement and process_batch work on it in place and could be mixed.
+    Both run in the kernel compiled by numba (see requirements.txt), the first call of a process_type compiles it or
+    loads it from the cache, so call it once before the control loop.
+    """
+    def __init__(self, channels: int):
+        if channels <= 0:
+            raise ValueError("channels must be greater than 0")
+        self._kernel = _get_compiled_kernel()
+        self.channels = channels
+        # x_hat, P, Q, R, K, last measurement error, measurement error window mean, last innovation,
+        # innovation window mean / M2, one column per channel
+        self._state = np.zeros((10, channels))
+        self._state[_Q] = 1e-5  # State transfer covariance matrix
+        self._state[_R] = 0.1  # Observation noise covariance matrix
+        self._initialized = False
+
+        # update Way0 Suitable for large fluctuations
+        self.mean_width = 10
+        self.measurement_error_adapt_rate = 0.15
+        self.max_q = 1e-2
+        self.max_r = 10
+        self.min_q = 1e-6
+        self.min_r = 1e-4
+
+        # update Way1 Suitable for processing with small fluctuations
+        self.cov_width = 10
+        self.target_cov = 1
+        self.innovation_adapt_rate = 0.2
+
+        # update Way2 Balance fluctuations and responses
+        self.residual_adapt_rate = 1e-3
+
+        # Sliding windows of the trends, one column per channel, and their counters: has last measurement error,
+        # index, count, has last innovation, index, count
+        self._me_ring = np.zeros((self.mean_width, channels))
+        self._innov_ring = np.zeros((self.cov_width, channels))
+        self._counters = np.zeros(6, dtype=np.int64)
+
+        # Tuning parameters as the (8, N) array of the kernel, rebuilt after one of them is set
+        self._params = np.zeros((8, channels))
+        self._params_stale = True
+        # process_type -> (types per channel, use_me, use_innov)
+        self._process_type_key = None
+        self._process_type_value = None
+
+        # Rows of the state, and the (N, 1) samples of one tick, so a tick allocates only the returned copy
+        self._rows = tuple(self._state)
+        self._qr = self._state[_Q:_R + 1]
+        self._tick_in = np.empty((channels, 1))
+        self._tick_out = np.empty((channels, 1))
+
+    @property
+    def Q(self) -> np.ndarray:
+        return self._rows[_Q]
+
+    @Q.setter
+    def Q(self, value):
+        self._state[_Q] = value
+
+    @property
+    def R(self) -> np.ndarray:
+        return self._rows[_R]
+
+    @R.setter
+    def R(self, value):
+        self._state[_R] = value
+
+    @property
+    def x_hat(self):
+        """Estimated state, None before the first measurement, changed in place by the next one"""
+        return self._rows[_X_HAT] if self._initialized else None
+
+    @property
+    def P(self):
+        return self._rows[_P] if self._initialized else None
+
+    @property
+    def K(self):
+        return self._rows[_K] if self._initialized else None
+
+    @property
+    def last_measurement_error(self):
+        return self._rows[_LAST_ME] if self._counters[0] else None
+
+    @property
+    def last_innovation(self):
+        return self._rows[_LAST_INNOV] if self._counters[3] else None
+
+    def __setattr__(self, name, value):
+        super().__setattr__(name, value)
+        if name in _TUNING_PARAMS:
+            # Copied into the arrays of the kernel by the next call, a tick does not read them one by one
+            super().__setattr__("_params_stale", True)
+
+    def update_value(self, attr_name, new_value):
+        """
+        :param attr_name: same as AdaptionKalmanFilter.update_value, Q and R could be a scalar or N values
+        :param new_value:
+        :return: None
+        """
+        setattr(self, attr_name, new_value)
+
+    def reset(self):
+        """Forget the state and the windows, Q and R are kept"""
+        qr = self._qr.copy()
+        self._state[:] = 0.0
+        self._qr[:] = qr
+        self._initialized = False
+        self._me_ring[:] = 0.0
+        self._innov_ring[:] = 0.0
+        self._counters[:] = 0
+
+    def _initialize(self, initial_value, P=1.0):
+        self._state[_X_HAT] = initial_value
+        self._state[_P] = P
+        self._initialized = True
+
+    def _windows(self):
+        # Follow the mean_width and cov_width set by update_value
+        state = self._state
+        counters = self._counters
+        if len(self._me_ring) != self.mean_width:
+            self._me_ring, counters[1], counters[2], state[_ME_MEAN], _ = _resize_ring(
+                self._me_ring, counters[1], counters[2], self.mean_width)
+        if len(self._innov_ring) != self.cov_width:
+            self._innov_ring, counters[4], counters[5], state[_INNOV_MEAN], state[_INNOV_M2] = _resize_ring(
+                self._innov_ring, counters[4], counters[5], self.cov_width)
+
+    def _tuning_params(self) -> np.ndarray:
+        if self._params_stale:
+            params = self._params
+            for row, name in enumerate(_TUNING_PARAMS):
+                params[row] = getattr(self, name)
+            self._params_stale = False
+        return self._params
+
+    def _process_types(self, process_type):
+        """
+        :param process_type: see process_batch
+        :return: (N,) int64 types of the kernel (-1 for None), use_me, use_innov
+        """
+        if process_type is self._process_type_key and self._process_type_value is not None:
+            return self._process_type_value
+        if process_type is None or isinstance(process_type, (int, np.integer)):
+            key = process_type if process_type is None else int(process_type)
+        else:
+            key = tuple(process_type)
+        if self._process_type_value is None or key != self._process_type_key:
+            if key is None:
+                types = [-1] * self.channels
+            else:
+                types = [key] * self.channels if isinstance(key, int) else list(key)
+                if len(types) != self.channels or any(way not in (0, 1, 2) for way in types):
+                    raise ValueError("Input the Wrong Process Type")
+            types = np.array(types, dtype=np.int64)
+            self._process_type_value = (types, bool(0 in types), bool(1 in types))
+            self._process_type_key = key
+        return self._process_type_value
+
+    def process_measurement(self, data, process_type=0):
+        """
+        Processes one real-time measurement of every channel and dynamically updates Q and R.
+        The tick is one call of the compiled kernel, most of its cost is the call itself, so 12 channels cost about
+        as much as one. Measured by benchmark, per tick against one AdaptionKalmanFilter per channel
+        (process_type 0 / 1 / 2, Python 3.11, numba 0.68):
+        12 channels: 4.5 / 4.4 / 4.2 us against 34 / 49 / 15 us
+        1 channel: 3.5 / 3.6 / 3.6 us against 3.5 / 4.5 / 2.0 us
+        :param data: N values
+        :param process_type: 0 / 1 / 2 for all the channels, one of them per channel, or None to keep Q and R fixed
+        :return: N filtered values, the array is not changed by the next call
+        """
+        tick_in = self._tick_in
+        tick_in[:, 0] = data
+        types, use_me, use_innov = self._process_types(process_type)
+        # update the first data
+        if not self._initialized:
+            self._initialize(tick_in[:, 0])
+            return tick_in[:, 0].copy()
+        self._windows()
+        self._kernel(tick_in, self._tick_out, self._state, self._me_ring, self._innov_ring, self._counters,
+                     self._tuning_params(), types, use_me, use_innov)
+        return self._rows[_X_HAT].copy()
+
+    def process_batch(self, data, process_type=0, out=None) -> np.ndarray:
+        """
+        Processes many samples of every channel, the same as one process_measurement call per sample.
+        The filter state is kept, so a long recording could be fed chunk by chunk.
+        The samples run in the compiled kernel. Measured by benchmark_batch (6 channels), per sample of a channel
+        against one process_measurement call per sample (process_type None / 0 / 1 / 2):
+        16-23 / 40 / 50 / 25 ns against 1.2-1.4 / 3.0 / 4.3-4.8 / 1.3-1.4 us, 50 to 95 times faster
+        :param data: (n, N) samples
+        :param process_type: 0 / 1 / 2 for all the channels, one of them per channel, or None to keep Q and R fixed
+        :param out: (n, N) buffer for the filtered samples
+        :return: (n, N) filtered samples
+        """
+        data = np.asarray(data, dtype=float)
+        if data.ndim != 2 or data.shape[1] != self.channels:
+            raise ValueError(f"The data must be (n, {self.channels})")
+        if out is None:
+            out = np.empty_like(data)
+        if len(data) == 0:
+            return out
+        types, use_me, use_innov = self._process_types(process_type)
+        if not self._initialized:
+            self._initialize(data[0])
+            out[0] = data[0]
+            data = data[1:]
+            out_rest = out[1:]
+        else:
+            out_rest = out
+        if len(data) == 0:
+            return out
+        self._windows()
+        params = self._tuning_params()
+
+        channel_out = np.empty((self.channels, len(data)))
+        self._kernel(np.ascontiguousarray(data.T), channel_out, self._state, self._me_ring, self._innov_ring,
+                     self._counters, params, types, use_me, use_innov)
+        out_rest[:] = channel_out.T
+        return out
+
+    def process_chunks(self, chunks, process_type=0):
+        """
+        Filter a long recording chunk by chunk, the memory is bounded by the chunk size
+        :param chunks: iterable of (n, N) samples, e.g. a memory mapped file read in slices
+        :param process_type: see process_batch
+        :return: generator of the (n, N) filtered chunks
+        """
+        for chunk in chunks:
+            yield self.process_batch(chunk, process_type)
 
     @staticmethod
-    def demo():
+    def benchmark_batch(samples: int = 200000, channels: int = 6):
+        """process_batch against one process_measurement call per sample of scalar filters"""
+        import time
+        np.random.seed(42)
+        data = (np.sin(np.linspace(0, 200, samples))[:, None] * np.arange(1, channels + 1) +
+                np.random.normal(0, 0.05, size=(samples, channels)))
+
+        for process_type in (None, 0, 1, 2):
+            loop_samples = min(samples, 20000)
+            scalar_filters = [AdaptionKalmanFilter() for _ in range(channels)]
+            start_time = time.perf_counter()
+            if process_type is None:
+                for channel in range(channels):
+                    _fixed_loop(data[:loop_samples, channel], scalar_filters[channel].Q, scalar_filters[channel].R)
+            else:
+                for row in data[:loop_samples].tolist():
+                    for akf, value in zip(scalar_filters, row):
+                        akf.process_measurement(value, process_type)
+            loop_cost = (time.perf_counter() - start_time) / (loop_samples * channels)
+            batch_filter = MultiChannelAdaptionKalmanFilter(channels)
+            # The first call compiles the kernel
+            batch_filter.process_batch(data[:10], process_type)
+            batch_filter.reset()
+            start_time = time.perf_counter()
+            for _ in batch_filter.process_chunks((data[i:i + 0x10000] for i in range(0, samples, 0x10000)),
+                                                 process_type):
+                pass
+            batch_cost = (time.perf_counter() - start_time) / (samples * channels)
+            print(f"process_type: {process_type}, Python loop: {loop_cost * 1e9:.0f} ns/sample, "
+                  f"batch: {batch_cost * 1e9:.0f} ns/sample, speed up: {loop_cost / batch_cost:.1f}")
+
+    @staticmethod
+    def check(samples: int = 6000, channels: int = 3):
+        """process_measurement and process_batch of the compiled kernel against one AdaptionKalmanFilter per channel"""
+        np.random.seed(42)
+        data = (np.sin(np.linspace(0, 60, samples))[:, None] * np.arange(1, channels + 1) +
+                np.random.normal(0, 0.05, size=(samples, channels)))
+        for process_type in (None, 0, 1, 2):
+            if process_type is None:
+                expected = np.stack([_fixed_loop(data[:, channel], 1e-5, 0.1) for channel in range(channels)], axis=1)
+            else:
+                scalar_filters = [AdaptionKalmanFilter() for _ in range(channels)]
+                expected = np.array([[akf.process_measurement(value, process_type)
+                                      for akf, value in zip(scalar_filters, row)] for row in data.tolist()])
+            tick_filter = MultiChannelAdaptionKalmanFilter(channels)
+            tick = np.array([tick_filter.process_measurement(row, process_type) for row in data])
+            batch_filter = MultiChannelAdaptionKalmanFilter(channels)
+            # Chunks of odd sizes, the windows carry over between them
+            batch = np.concatenate([batch_filter.process_batch(data[i:i + 777], process_type)
+                                    for i in range(0, samples, 777)])
+            print(f"process_type: {process_type}, "
+                  f"tick matches: {np.allclose(tick, expected, rtol=1e-9, atol=1e-12)}, "
+                  f"batch matches: {np.allclose(batch, expected, rtol=1e-9, atol=1e-12)}, "
+                  f"tick and batch equal: {np.array_equal(tick, batch)}, "
+                  f"finite: {np.isfinite(batch).all()}")
+
+    @staticmethod
+    def benchmark(channels: int = 12, steps: int = 2000):
+        """Per tick cost of one multi channel filter against the same channels as scalar filters"""
+        import time
         np.random.seed(42)
-        true_values = np.random.uniform(10, 100, size=100)
-        additional_values = np.random.uniform(900, 1000, size=200)
-        additional_values2 = np.random.uniform(-300, -200, size=100)
-        true_values = np.concatenate((true_values, additional_values))
-        true_values = np.concatenate((true_values, additional_values2))
-        noisy_measurements = true_values + np.random.normal(0, 0.05, size=true_values.shape)
-        akf = AdaptionKalmanFilter()
-
-        fig, ax = plt.subplots(figsize=(10, 6))
-        ax.plot(true_values, label='True Values', color='g')
-        ax.scatter(np.arange(len(noisy_measurements)), noisy_measurements, label='Noisy Measurements', color='r', s=10)
-        line, = ax.plot([], [], label='Filtered Values', color='b')
-        plt.xlabel('Time step')
-        plt.ylabel('Value')
-        plt.title('Adaptive Kalman Filter Demonstration')
-        plt.legend()
-
-        filtered_values = []
-        for i, measurement in enumerate(noisy_measurements):
-            filtered_value = akf.process_measurement(measurement, process_type=2)
-            filtered_values.append(filtered_value)
-            print(f"Filtered value at step {i}: {filtered_value}")  # Print filtered value
-            line.set_data(np.arange(i + 1), filtered_values)
-            ax.relim()
-            ax.autoscale_view()
-            plt.pause(0.0001)  # Reduce delay between updates
-
-        plt.show()
-        print(f"Final Q: {akf.Q}, Final R: {akf.R}")
+        measurements = (np.sin(np.linspace(0, 20, steps))[:, None] * np.arange(1, channels + 1) +
+                        np.random.normal(0, 0.05, size=(steps, channels)))
+        for process_type in (0, 1, 2):
+            scalar_filters = [AdaptionKalmanFilter() for _ in range(channels)]
+            start_time = time.perf_counter()
+            for row in measurements.tolist():
+                for akf, value in zip(scalar_filters, row):
+                    akf.process_measurement(value, process_type)
+            scalar_cost = (time.perf_counter() - start_time) / steps
+            # The first calls compile the kernel
+            MultiChannelAdaptionKalmanFilter(channels).process_batch(measurements[:10], process_type)
+            multi_filter = MultiChannelAdaptionKalmanFilter(channels)
+            start_time = time.perf_counter()
+            for row in measurements:
+                multi_filter.process_measurement(row, process_type)
+            multi_cost = (time.perf_counter() - start_time) / steps
+            print(f"process_type: {process_type}, channels: {channels}, "
+                  f"{channels} scalar filters: {scalar_cost * 1e6:.2f} us/tick, "
+                  f"multi channel: {multi_cost * 1e6:.2f} us/tick, "
+                  f"max diff: {np.max(np.abs(multi_filter.x_hat - [f.x_hat for f in scalar_filters])):.3e}")
 
 
 if __name__ == "__main__":
+    MultiChannelAdaptionKalmanFilter.check()
     AdaptionKalmanFilter.demo()
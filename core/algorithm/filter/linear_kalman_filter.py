@@ -0,0 +1,384 @@
+"""
+Kalman filters with a state vector, for systems which move between two samples.
+
+- LinearKalmanFilter: x' = F x (+ B u), z = H x. The inverse of the innovation covariance is written out for 1 to 3
+  measurements, np.linalg.inv is only used for more.
+- ExtendedKalmanFilter: the same steps with the functions f(x, u), h(x) and their jacobians.
+- JointKalmanFilter: many joints at once, the state of a joint is [position, velocity] (model "cv", constant velocity)
+  or [position, velocity, acceleration] (model "ca", constant acceleration), one position is measured per joint.
+  The innovation covariance is a scalar per joint, so there is no matrix inverse at all. Q and R could adapt with the
+  three ways of AdaptionKalmanFilter.
+
+The random walk of AdaptionKalmanFilter predicts x_hat_minus = x_hat, so a moving joint is always behind. The models
+here predict the next position from the velocity, which is estimated at the same time.
+
+Example:
+    >>> jkf = JointKalmanFilter(6, dt=0.002)
+    >>> encoder_samples = np.linspace(0, 1, 501)[:, None] * np.arange(1, 7)  # 1 s of 6 joints at 1 to 6 rad/s
+    >>> for positions in encoder_samples:  # (6,) positions at 500 Hz
+    ...     filtered = jkf.process_measurement(positions)
+    >>> print(np.round(jkf.velocity, 2))
+    [1. 2. 3. 4. 5. 6.]
+"""
+
+import time
+import numpy as np
+from algorithm.filter.window_stats import SlidingWindowStats
+
+
+def _inverse(S):
+    """Inverse of a small symmetric matrix, written out up to 3 x 3"""
+    match len(S):
+        case 1:
+            return 1.0 / S
+        case 2:
+            a, b, d = S[0, 0], S[0, 1], S[1, 1]
+            det = a * d - b * b
+            return np.array([[d, -b], [-b, a]]) / det
+        case 3:
+            a, b, c = S[0]
+            e, f = S[1, 1], S[1, 2]
+            i = S[2, 2]
+            co_a = e * i - f * f
+            co_b = c * f - b * i
+            co_c = b * f - c * e
+            det = a * co_a + b * co_b + c * co_c
+            return np.array([[co_a, co_b, co_c],
+                             [co_b, a * i - c * c, b * c - a * f],
+                             [co_c, b * c - a * f, a * e - b * b]]) / det
+        case _:
+            return np.linalg.inv(S)
+
+
+class LinearKalmanFilter:
+    def __init__(self, F, H, Q, R, x0=None, P0=None, B=None):
+        """
+        :param F: (n, n) state transition
+        :param H: (m, n) measurement
+        :param Q: (n, n) process noise covariance
+        :param R: (m, m) measurement noise covariance
+        :param x0: (n,) initial state, zeros by default
+        :param P0: (n, n) initial state covariance, identity by default
+        :param B: (n, k) control input, optional
+        """
+        self.F = np.asarray(F, dtype=float)
+        self.H = np.atleast_2d(np.asarray(H, dtype=float))
+        self.Q = np.asarray(Q, dtype=float)
+        self.R = np.atleast_2d(np.asarray(R, dtype=float))
+        self.B = None if B is None else np.asarray(B, dtype=float)
+        n = len(self.F)
+        self.x_hat = np.zeros(n) if x0 is None else np.array(x0, dtype=float)  # Estimated state
+        self.P = np.eye(n) if P0 is None else np.array(P0, dtype=float)  # State Covariance
+        self.K = None  # Kalman gain
+        self.innovation = None
+        self.S = None  # Innovation covariance
+        self._identity = np.eye(n)
+
+    def _predict_state(self, u):
+        """:return: (predicted state, jacobian of the transition)"""
+        x_hat_minus = self.F @ self.x_hat
+        if u is not None:
+            x_hat_minus += self.B @ np.asarray(u, dtype=float)
+        return x_hat_minus, self.F
+
+    def _predict_measurement(self):
+        """:return: (predicted measurement, jacobian of the measurement)"""
+        return self.H @ self.x_hat, self.H
+
+    def predict(self, u=None):
+        self.x_hat, F = self._predict_state(u)
+        self.P = F @ self.P @ F.T + self.Q
+        return self.x_hat
+
+    def update(self, z):
+        z_hat, H = self._predict_measurement()
+        self.innovation = np.atleast_1d(np.asarray(z, dtype=float)) - z_hat
+        PHt = self.P @ H.T
+        self.S = H @ PHt + self.R
+        self.K = PHt @ _inverse(self.S)
+        self.x_hat = self.x_hat + self.K @ self.innovation
+        # Joseph form keeps P symmetric and positive
+        IKH = self._identity - self.K @ H
+        self.P = IKH @ self.P @ IKH.T + self.K @ self.R @ self.K.T
+        return self.x_hat
+
+    def process_measurement(self, z, u=None):
+        """Predict to the time of z and update with it"""
+        self.predict(u)
+        return self.update(z)
+
+
+class ExtendedKalmanFilter(LinearKalmanFilter):
+    def __init__(self, f, F_jacobian, h, H_jacobian, Q, R, x0=None, P0=None):
+        """
+        :param f: f(x, u) -> next state
+        :param F_jacobian: F_jacobian(x, u) -> (n, n) jacobian of f
+        :param h: h(x) -> (m,) measurement
+        :param H_jacobian: H_jacobian(x) -> (m, n) jacobian of h
+        :param Q: (n, n) process noise covariance
+        :param R: (m, m) measurement noise covariance
+        :param x0: (n,) initial state, zeros by default
+        :param P0: (n, n) initial state covariance, identity by default
+        """
+        n = len(np.asarray(Q))
+        super().__init__(np.eye(n), np.zeros((len(np.atleast_2d(R)), n)), Q, R, x0, P0)
+        self.f = f
+        self.F_jacobian = F_jacobian
+        self.h = h
+        self.H_jacobian = H_jacobian
+
+    def _predict_state(self, u):
+        F = np.asarray(self.F_jacobian(self.x_hat, u), dtype=float)
+        return np.asarray(self.f(self.x_hat, u), dtype=float), F
+
+    def _predict_measurement(self):
+        H = np.atleast_2d(np.asarray(self.H_jacobian(self.x_hat), dtype=float))
+        return np.atleast_1d(np.asarray(self.h(self.x_hat), dtype=float)), H
+
+
+class JointKalmanFilter:
+    """
+    Need the set those parameter carefully, the units are the ones of the positions (e.g. degrees and seconds).
+    Q is built from q, the variance of the acceleration ("cv") or of the jerk ("ca") in one sample, as q * G G^T.
+    """
+    MODELS = {"cv": 2, "ca": 3}
+
+    def __init__(self, joints: int, dt: float = 0.002, model: str = "cv"):
+        if joints <= 0:
+            raise ValueError("joints must be greater than 0")
+        if model not in self.MODELS:
+            raise ValueError(f"The model must be one of {list(self.MODELS)}")
+        self.joints = joints
+        self.model = model
+        self.states = self.MODELS[model]
+        self.q = np.full(joints, 1e4)  # Process noise intensity
+        self.R = np.full(joints, 1e-4)  # Observation noise covariance
+        self.initial_covariance = 1.0
+
+        self.x_hat = None  # (joints, states) estimated state
+        self.P = None  # (joints, states, states) state covariance
+        self.K = None  # (joints, states) Kalman gain
+        self.dt = None
+        self.F = None
+        self.Q = None  # (joints, states, states) process noise covariance
+        self._Q_unit = None
+        self._set_dt(dt)
+
+        # update Way0 Suitable for large fluctuations
+        self.last_measurement_error = None
+        self.mean_width = 10
+        self.measurement_error_adapt_rate = 0.15
+        self.max_q = 1e10
+        self.max_r = 1.0
+        self.min_q = 1e-2
+        self.min_r = 1e-8
+
+        # update Way1 Normalised innovation squared over the window against the target
+        self.cov_width = 10
+        self.target_nis = 1.0
+        self.innovation_adapt_rate = 0.05
+
+        # update Way2 Residual based covariance matching
+        self.residual_adapt_rate = 1e-3
+
+        self._measurement_error_window = SlidingWindowStats(self.mean_width, (joints,))
+        self._nis_window = SlidingWindowStats(self.cov_width, (joints,))
+
+    @property
+    def position(self) -> np.ndarray:
+        return self.x_hat[:, 0]
+
+    @property
+    def velocity(self) -> np.ndarray:
+        return self.x_hat[:, 1]
+
+    @property
+    def acceleration(self) -> np.ndarray | None:
+        return self.x_hat[:, 2] if self.states == 3 else None
+
+    def update_value(self, attr_name, new_value):
+        """
+        :param attr_name:
+        q, R, initial_covariance,
+        mean_width, measurement_error_adapt_rate, max_q, max_r, min_q, min_r
+        cov_width, target_nis, innovation_adapt_rate,
+        residual_adapt_rate
+        :param new_value: q and R could be a scalar or one value per joint
+        :return: None
+        """
+        if attr_name in ("q", "R"):
+            new_value = np.broadcast_to(np.asarray(new_value, dtype=float), (self.joints,)).copy()
+        setattr(self, attr_name, new_value)
+        if attr_name == "q":
+            self.Q = self.q[:, None, None] * self._Q_unit
+
+    def reset(self):
+        """Forget the state and the windows, q and R are kept"""
+        self.x_hat = None
+        self.P = None
+        self.K = None
+        self.last_measurement_error = None
+        self._measurement_error_window.clear()
+        self._nis_window.clear()
+
+    def _set_dt(self, dt):
+        # Q follows q again when dt changes
+        self.dt = dt
+        if self.states == 2:
+            self.F = np.array([[1.0, dt], [0.0, 1.0]])
+            G = np.array([dt * dt / 2, dt])
+        else:
+            self.F = np.array([[1.0, dt, dt * dt / 2], [0.0, 1.0, dt], [0.0, 0.0, 1.0]])
+            G = np.array([dt * dt * dt / 6, dt * dt / 2, dt])
+        self._Q_unit = np.outer(G, G)
+        self.Q = self.q[:, None, None] * self._Q_unit
+
+    def _initialize(self, initial_value):
+        self.x_hat = np.zeros((self.joints, self.states))
+        self.x_hat[:, 0] = initial_value
+        self.P = np.broadcast_to(np.eye(self.states) * self.initial_covariance,
+                                 (self.joints, self.states, self.states)).copy()
+
+    def _set_qr(self, q, r):
+        # Keep q and R in [min, max]
+        np.minimum(q, self.max_q, out=q)
+        np.maximum(q, self.min_q, out=q)
+        np.minimum(r, self.max_r, out=r)
+        np.maximum(r, self.min_r, out=r)
+        self.q = q
+        self.R = r
+        self.Q = q[:, None, None] * self._Q_unit
+
+    def _update_parameters_measurement_error(self, measurement_error):
+        """
+        Dynamically update q and R based on the trend of the measurement error, per joint.
+        """
+        if self.last_measurement_error is not None:
+            window = self._measurement_error_window
+            if window.width != self.mean_width:
+                window.resize(self.mean_width)
+            window.push(measurement_error - self.last_measurement_error)
+            # Error increases, increase q and R to accommodate uncertainty
+            # Error reduction, reduce q and R to improve estimation accuracy
+            factor = np.sign(window.mean)
+            factor *= self.measurement_error_adapt_rate
+            factor += 1
+            self._set_qr(self.q * factor, self.R * factor)
+        self.last_measurement_error = measurement_error
+
+    def _update_parameters_innovation(self, innovation, S):
+        """
+        Dynamically update q based on the normalised innovation squared, per joint.
+        Over the target the filter trusts its model too much: increase q, otherwise decrease it. R is kept, changing it
+        moves the normalised innovation the wrong way.
+        """
+        window = self._nis_window
+        if window.width != self.cov_width:
+            window.resize(self.cov_width)
+        window.push(innovation * innovation / S)
+        rate = self.innovation_adapt_rate
+        high = window.mean > self.target_nis
+        self._set_qr(self.q * np.where(high, 1 + rate, 1 - rate), self.R.copy())
+
+    def _update_parameters_residual(self, innovation, residual):
+        """
+        Based on residual dynamically updates Q and R, per joint.
+        R -> residual^2 + P[0, 0], Q -> K innovation^2 K^T
+        """
+        rate = self.residual_adapt_rate
+        self.R = self.R + rate * (residual * residual + self.P[:, 0, 0] - self.R)
+        Kv = self.K * innovation[:, None]
+        self.Q = self.Q + rate * (Kv[:, :, None] * Kv[:, None, :] - self.Q)
+
+    def process_measurement(self, data, process_type=None, dt=None):
+        """
+        Processes one measured position of every joint.
+        :param data: joints positions
+        :param process_type: None keeps q and R fixed, 0 / 1 / 2 adapts them like AdaptionKalmanFilter
+        :param dt: seconds since the last sample, if it is not the dt of the filter
+        :return: (joints, states) estimated [position, velocity(, acceleration)], not changed by the next call
+        """
+        data = np.asarray(data, dtype=float)
+        if data.shape != (self.joints,):
+            raise ValueError(f"The data must have {self.joints} values")
+        if self.x_hat is None:
+            self._initialize(data)
+            return self.x_hat
+        if dt is not None and dt != self.dt:
+            self._set_dt(dt)
+
+        # Prediction steps, x F^T and F P F^T for all the joints
+        x_hat_minus = self.x_hat @ self.F.T
+        P_minus = self.F @ self.P @ self.F.T
+        P_minus += self.Q
+
+        # Update step, H = [1, 0(, 0)] so S is P_minus[0, 0] + R of every joint
+        S = P_minus[:, 0, 0] + self.R
+        self.K = P_minus[:, :, 0] / S[:, None]
+        innovation = data - x_hat_minus[:, 0]
+        x_hat_minus += self.K * innovation[:, None]
+        self.x_hat = x_hat_minus
+        # (I - K H) P_minus
+        P_minus -= self.K[:, :, None] * P_minus[:, None, 0, :]
+        self.P = P_minus
+
+        match process_type:
+            case None:
+                pass
+            case 0:
+                self._update_parameters_measurement_error(np.abs(data - self.x_hat[:, 0]))
+            case 1:
+                self._update_parameters_innovation(innovation, S)
+            case 2:
+                self._update_parameters_residual(innovation, data - self.x_hat[:, 0])
+            case _:
+                raise ValueError("Input the Wrong Process Type")
+
+        return self.x_hat
+
+    @staticmethod
+    def benchmark(joints: int = 6, rate: float = 500.0, seconds: float = 10.0, noise: float = 0.01):
+        """
+        Velocity estimation of moving joints sampled at rate Hz: finite difference of the samples, finite difference of
+        AdaptionKalmanFilter and the velocity of JointKalmanFilter, with the per tick cost
+        """
+        from algorithm.filter.kalman_filter import AdaptionKalmanFilter
+        np.random.seed(42)
+        dt = 1.0 / rate
+        t = np.arange(0, seconds, dt)
+        frequencies = np.linspace(0.2, 1.0, joints)
+        true_positions = 30 * np.sin(2 * np.pi * t[:, None] * frequencies)
+        true_velocities = 30 * 2 * np.pi * frequencies * np.cos(2 * np.pi * t[:, None] * frequencies)
+        measurements = true_positions + np.random.normal(0, noise, size=true_positions.shape)
+
+        def rms(velocities):
+            # Skip the first second, the filters are settling
+            return np.sqrt(np.mean((velocities[int(rate):] - true_velocities[int(rate):]) ** 2))
+
+        difference = np.gradient(measurements, dt, axis=0)
+        print(f"finite difference: velocity rms error {rms(difference):.3f}")
+
+        scalar_filters = [AdaptionKalmanFilter() for _ in range(joints)]
+        filtered = np.array([[akf.process_measurement(value, 2) for akf, value in zip(scalar_filters, row)]
+                             for row in measurements.tolist()])
+        print(f"AdaptionKalmanFilter + difference: velocity rms error "
+              f"{rms(np.gradient(filtered, dt, axis=0)):.3f}")
+
+        for model in ("cv", "ca"):
+            for process_type in (None, 0, 1, 2):
+                jkf = JointKalmanFilter(joints, dt, model)
+                jkf.update_value("R", noise * noise)
+                # About the square of the largest acceleration / jerk of the motion
+                jkf.update_value("q", 1e6 if model == "cv" else 5e7)
+                velocities = np.empty_like(measurements)
+                start_time = time.perf_counter()
+                for i, row in enumerate(measurements):
+                    velocities[i] = jkf.process_measurement(row, process_type)[:, 1]
+                cost = (time.perf_counter() - start_time) / len(measurements)
+                print(f"JointKalmanFilter {model}, process_type: {process_type}: velocity rms error "
+                      f"{rms(velocities):.3f}, {cost * 1e6:.1f} us/tick for {joints} joints "
+                      f"({cost * rate * 100:.2f}% of the {rate:.0f} Hz period)")
+
+
+if __name__ == "__main__":
+    JointKalmanFilter.benchmark()
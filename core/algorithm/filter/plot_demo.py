@@ -0,0 +1,51 @@
+"""
+Plotting demos of the filters, they need matplotlib with Tk.
+
+The filter modules import this module only inside their demo(), so the filters start without matplotlib and run on
+headless machines.
+"""
+
+import matplotlib
+import matplotlib.pyplot as plt
+import numpy as np
+from algorithm.filter.kalman_filter import AdaptionKalmanFilter
+
+matplotlib.use('TkAgg')
+
+
+def adaption_kalman_filter_demo():
+    """AdaptionKalmanFilter on random data, the filtered values are plotted while they come"""
+    np.random.seed(42)
+    true_values = np.random.uniform(10, 100, size=100)
+    additional_values = np.random.uniform(900, 1000, size=200)
+    additional_values2 = np.random.uniform(-300, -200, size=100)
+    true_values = np.concatenate((true_values, additional_values))
+    true_values = np.concatenate((true_values, additional_values2))
+    noisy_measurements = true_values + np.random.normal(0, 0.05, size=true_values.shape)
+    akf = AdaptionKalmanFilter()
+
+    fig, ax = plt.subplots(figsize=(10, 6))
+    ax.plot(true_values, label='True Values', color='g')
+    ax.scatter(np.arange(len(noisy_measurements)), noisy_measurements, label='Noisy Measurements', color='r', s=10)
+    line, = ax.plot([], [], label='Filtered Values', color='b')
+    plt.xlabel('Time step')
+    plt.ylabel('Value')
+    plt.title('Adaptive Kalman Filter Demonstration')
+    plt.legend()
+
+    filtered_values = []
+    for i, measurement in enumerate(noisy_measurements):
+        filtered_value = akf.process_measurement(measurement, process_type=2)
+        filtered_values.append(filtered_value)
+        print(f"Filtered value at step {i}: {filtered_value}")  # Print filtered value
+        line.set_data(np.arange(i + 1), filtered_values)
+        ax.relim()
+        ax.autoscale_view()
+        plt.pause(0.0001)  # Reduce delay between updates
+
+    plt.show()
+    print(f"Final Q: {akf.Q}, Final R: {akf.R}")
+
+
+if __name__ == "__main__":
+    adaption_kalman_filter_demo()
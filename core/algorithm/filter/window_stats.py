@@ -0,0 +1,175 @@
+"""
+Mean and variance of the last width values, O(1) per push.
+
+The values are kept in a ring buffer. The mean and the sum of squared deviations (M2) are updated by Welford's method:
+a value is added while the window fills up, afterwards the oldest value is replaced. Once per turn of the ring both
+are recomputed from the buffer, so the rounding error does not grow with the number of pushes.
+
+The values could be floats, or arrays of one shape (one window per channel, updated by the same NumPy calls).
+
+Example:
+    >>> window = SlidingWindowStats(3)
+    >>> for value in [1.0, 2.0, 3.0, 4.0]:
+    ...     window.push(value)
+    >>> window.values(), window.mean, round(window.var, 12)
+    ([2.0, 3.0, 4.0], 3.0, 0.666666666667)
+"""
+
+import time
+import numpy as np
+
+
+class SlidingWindowStats:
+    def __init__(self, width: int, shape: tuple = ()):
+        """
+        :param width: max values in the window
+        :param shape: shape of one value, () for floats
+        """
+        if width <= 0:
+            raise ValueError("width must be greater than 0")
+        self._shape = tuple(shape)
+        self._scalar = self._shape == ()
+        self._width = width
+        self.clear()
+
+    def __len__(self):
+        return self._count
+
+    @property
+    def width(self) -> int:
+        return self._width
+
+    @property
+    def mean(self):
+        return self._mean
+
+    @property
+    def var(self):
+        """Population variance, like np.var"""
+        if self._count == 0:
+            return 0.0 if self._scalar else np.zeros(self._shape)
+        if self._scalar:
+            return max(self._m2 / self._count, 0.0)
+        return np.maximum(self._m2 / self._count, 0.0)
+
+    def clear(self) -> None:
+        if self._scalar:
+            self._ring = [0.0] * self._width
+            self._mean = 0.0
+            self._m2 = 0.0
+        else:
+            self._ring = np.zeros((self._width,) + self._shape)
+            self._mean = np.zeros(self._shape)
+            self._m2 = np.zeros(self._shape)
+        self._index = 0
+        self._count = 0
+
+    def values(self):
+        """Values in the window, oldest first"""
+        if self._count < self._width:
+            ordered = self._ring[:self._count]
+        else:
+            ordered = self._ring[self._index:] + self._ring[:self._index] if self._scalar else \
+                np.concatenate((self._ring[self._index:], self._ring[:self._index]))
+        return list(ordered) if self._scalar else np.array(ordered)
+
+    def resize(self, width: int) -> None:
+        """Change the width, the newest values are kept"""
+        if width == self._width:
+            return None
+        if width <= 0:
+            raise ValueError("width must be greater than 0")
+        values = self.values()[-width:] if self._count else []
+        self._width = width
+        self.clear()
+        for value in values:
+            self.push(value)
+
+    def push(self, value) -> None:
+        """Add the value, the oldest one is dropped when the window is full"""
+        index = self._index
+        if self._count < self._width:
+            self._ring[index] = value
+            self._count += 1
+            delta = value - self._mean
+            self._mean = self._mean + delta / self._count
+            self._m2 = self._m2 + delta * (value - self._mean)
+        elif self._scalar:
+            old = self._ring[index]
+            self._ring[index] = value
+            delta = value - old
+            mean = self._mean + delta / self._width
+            self._m2 = self._m2 + delta * ((value - mean) + (old - self._mean))
+            self._mean = mean
+        else:
+            # The same steps in place, every NumPy call costs more than the arithmetic of a few channels
+            old = self._ring[index].copy()
+            self._ring[index] = value
+            delta = value - old
+            mean = delta / self._width
+            mean += self._mean
+            old -= self._mean
+            correction = value - mean
+            correction += old
+            correction *= delta
+            self._m2 += correction
+            self._mean = mean
+        self._index = (index + 1) % self._width
+        if self._index == 0:
+            self._recompute()
+
+    def _recompute(self) -> None:
+        # The window is full here
+        if self._scalar:
+            total = 0.0
+            for value in self._ring:
+                total += value
+            self._mean = total / self._width
+            m2 = 0.0
+            for value in self._ring:
+                m2 += (value - self._mean) * (value - self._mean)
+            self._m2 = m2
+        else:
+            self._mean = np.add.reduce(self._ring, axis=0) / self._width
+            deviation = self._ring - self._mean
+            deviation *= deviation
+            self._m2 = np.add.reduce(deviation, axis=0)
+
+    def get_state(self) -> tuple:
+        """(ring, index, count, mean, M2), the ring is not copied"""
+        return self._ring, self._index, self._count, self._mean, self._m2
+
+    def set_state(self, index: int, count: int, mean, m2) -> None:
+        """Restore the counters after the ring of get_state is changed in place"""
+        self._index = index
+        self._count = count
+        self._mean = mean
+        self._m2 = m2
+
+    @staticmethod
+    def benchmark(widths=(10, 100, 1000), samples: int = 100000):
+        """Per sample cost of push + mean + var against the list with pop(0), sum and np.var"""
+        values = np.random.normal(0, 1, samples).tolist()
+        for width in widths:
+            sequence = []
+            start_time = time.perf_counter()
+            for value in values[:samples // 10]:
+                sequence.append(value)
+                if len(sequence) > width:
+                    sequence.pop(0)
+                sum(sequence) / len(sequence)
+                np.var(sequence)
+            list_cost = (time.perf_counter() - start_time) / (samples // 10)
+            window = SlidingWindowStats(width)
+            start_time = time.perf_counter()
+            for value in values:
+                window.push(value)
+                window.mean
+                window.var
+            window_cost = (time.perf_counter() - start_time) / samples
+            print(f"width: {width}, list: {list_cost * 1e6:.2f} us/sample, window: {window_cost * 1e6:.2f} us/sample, "
+                  f"var diff: {abs(window.var - np.var(values[-width:])):.2e}")
+
+
+if __name__ == "__main__":
+    SlidingWindowStats.benchmark()
@@ -0,0 +1,3 @@
+from .forward_kinematics import ForwardKinematics
+from .inverse_kinematics import InverseKinematics
+from .jacobian import ArmJacobian, geometric_jacobian, manipulability, condition_number
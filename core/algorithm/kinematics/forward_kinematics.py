@@ -0,0 +1,231 @@
+"""
+Forward kinematics of a serial arm from its standard DH parameters (devices.configuration.DHParam).
+
+The joint angles are in degrees and the lengths in the unit of the DH parameters (mm for the UR3E config), one joint
+vector is (J,) and a batch is (..., J). The frame of the link i is
+    F_i = F_(i-1) @ Rz(theta_i) @ Tz(d_i) @ Tx(a_i) @ Rx(alpha_i)
+and it is not multiplied as 4 x 4 matrices: Rz turns the x and y axes of the previous frame, Rx turns the new y and z,
+so one joint is a few multiply-adds of the axis components. The same code runs on floats for one joint vector and on
+(N,) arrays for a batch, the constant twists of 0 and +-90 degrees skip their terms.
+
+Example:
+    >>> from devices.UR3E import config
+    >>> kinematics = ForwardKinematics.from_config(config)
+    >>> tool = kinematics.tool_matrix([0, -90, 0, -90, 0, 0])  # (4, 4), mm
+    >>> np.allclose(tool[:3, 3], [0, -223.15, 693.95])  # upright: -(d4 + d6), d1 - a2 - a3 + d5
+    True
+    >>> kinematics.tool_matrix(np.random.uniform(-180, 180, (10000, 6))).shape
+    (10000, 4, 4)
+    >>> kinematics.link_frames([0, -90, 0, -90, 0, 0]).shape  # base, link1 ... link6, tool
+    (8, 4, 4)
+"""
+
+import math
+import time
+import numpy as np
+from algorithm.transfer.pose_batch import PoseBatch
+from algorithm.transfer.transform_matrix import TransformMatrix
+from devices.configuration import DHParam, RoboticArmConfig
+
+
+def _fixed_columns(transform):
+    """(x, y, z, p) columns of a TransformMatrix (or 4 x 4 matrix) as float tuples, identity for None"""
+    if transform is None:
+        return (1.0, 0.0, 0.0), (0.0, 1.0, 0.0), (0.0, 0.0, 1.0), (0.0, 0.0, 0.0)
+    matrix = transform.get_transform_matrix() if isinstance(transform, TransformMatrix) else np.asarray(transform)
+    return tuple(tuple(float(value) for value in matrix[:3, column]) for column in range(4))
+
+
+class ForwardKinematics:
+    def __init__(self, dh_param: DHParam, base=None, tool=None):
+        """
+        :param dh_param: DH parameters of the arm
+        :param base: TransformMatrix (or 4 x 4 matrix) of the arm base in the world, None for the identity
+        :param tool: TransformMatrix (or 4 x 4 matrix) of the tool in the flange frame, None for the flange
+        """
+        self.dh_param = dh_param
+        # (cos alpha, sin alpha, a, d) per joint, cos/sin rounded so 90 degrees gives exactly 0
+        self._links = tuple((round(math.cos(math.radians(alpha)), 15), round(math.sin(math.radians(alpha)), 15),
+                             float(a), float(d))
+                            for alpha, a, d in zip(dh_param.alpha, dh_param.a, dh_param.d))
+        self._theta_offset = np.asarray(dh_param.theta_offset, dtype=np.float64)
+        self._has_offset = bool(np.any(self._theta_offset))
+        self._base = _fixed_columns(base)
+        self._tool = None if tool is None else _fixed_columns(tool)
+        # Joint angles and read only frames of the last link_frames, a Jacobian of the same tick reuses them
+        self._cached_angles = None
+        self._cached_frames = None
+
+    @classmethod
+    def from_config(cls, config: RoboticArmConfig, base=None, tool=None) -> "ForwardKinematics":
+        """Kinematics of a device config, e.g. devices.UR3E.config"""
+        if config.armDHParam is None:
+            raise ValueError("The config has no DH parameters")
+        return cls(config.armDHParam, base, tool)
+
+    @property
+    def joints_num(self) -> int:
+        return len(self._links)
+
+    def _angles(self, joint_angles):
+        """cos and sin of every joint, floats for one joint vector or contiguous (J, N) rows for a batch"""
+        joint_angles = np.asarray(joint_angles, dtype=np.float64)
+        if joint_angles.shape[-1:] != (self.joints_num,):
+            raise ValueError(f"The last dimension of the joint angles must be {self.joints_num}")
+        if self._has_offset:
+            joint_angles = joint_angles + self._theta_offset
+        if joint_angles.ndim == 1:
+            radians = [math.radians(angle) for angle in joint_angles.tolist()]
+            return [math.cos(angle) for angle in radians], [math.sin(angle) for angle in radians], None
+        batch_shape = joint_angles.shape[:-1]
+        radians = np.radians(joint_angles.reshape(-1, self.joints_num).T)
+        return np.cos(radians), np.sin(radians), batch_shape
+
+    def _chain(self, cos, sin):
+        """Yield the (x, y, z, p) columns of the link frames, the base first and the tool last"""
+        (x0, x1, x2), (y0, y1, y2), (z0, z1, z2), (p0, p1, p2) = self._base
+        yield (x0, x1, x2), (y0, y1, y2), (z0, z1, z2), (p0, p1, p2)
+        for (ca, sa, a, d), ct, st in zip(self._links, cos, sin):
+            # Rz(theta) turns x and y, z stays. Written out per component, zip and lists cost more than the products
+            x0, x1, x2, y0, y1, y2 = (ct * x0 + st * y0, ct * x1 + st * y1, ct * x2 + st * y2,
+                                      ct * y0 - st * x0, ct * y1 - st * x1, ct * y2 - st * x2)
+            if d:
+                p0, p1, p2 = p0 + d * z0, p1 + d * z1, p2 + d * z2
+            if a:
+                p0, p1, p2 = p0 + a * x0, p1 + a * x1, p2 + a * x2
+            # Rx(alpha) turns y and z
+            if sa == 0:
+                if ca < 0:
+                    y0, y1, y2, z0, z1, z2 = -y0, -y1, -y2, -z0, -z1, -z2
+            elif ca == 0:
+                if sa > 0:
+                    y0, y1, y2, z0, z1, z2 = z0, z1, z2, -y0, -y1, -y2
+                else:
+                    y0, y1, y2, z0, z1, z2 = -z0, -z1, -z2, y0, y1, y2
+            else:
+                y0, y1, y2, z0, z1, z2 = (ca * y0 + sa * z0, ca * y1 + sa * z1, ca * y2 + sa * z2,
+                                          ca * z0 - sa * y0, ca * z1 - sa * y1, ca * z2 - sa * y2)
+            yield (x0, x1, x2), (y0, y1, y2), (z0, z1, z2), (p0, p1, p2)
+        if self._tool is not None:
+            (t00, t10, t20), (t01, t11, t21), (t02, t12, t22), (t03, t13, t23) = self._tool
+            p0, p1, p2 = (p0 + t03 * x0 + t13 * y0 + t23 * z0, p1 + t03 * x1 + t13 * y1 + t23 * z1,
+                          p2 + t03 * x2 + t13 * y2 + t23 * z2)
+            x0, x1, x2, y0, y1, y2, z0, z1, z2 = (
+                t00 * x0 + t10 * y0 + t20 * z0, t00 * x1 + t10 * y1 + t20 * z1, t00 * x2 + t10 * y2 + t20 * z2,
+                t01 * x0 + t11 * y0 + t21 * z0, t01 * x1 + t11 * y1 + t21 * z1, t01 * x2 + t11 * y2 + t21 * z2,
+                t02 * x0 + t12 * y0 + t22 * z0, t02 * x1 + t12 * y1 + t22 * z1, t02 * x2 + t12 * y2 + t22 * z2)
+        yield (x0, x1, x2), (y0, y1, y2), (z0, z1, z2), (p0, p1, p2)
+
+    @staticmethod
+    def _fill(out, columns):
+        for column, values in enumerate(columns):
+            out[..., 0, column] = values[0]
+            out[..., 1, column] = values[1]
+            out[..., 2, column] = values[2]
+        out[..., 3, 3] = 1.0
+
+    def tool_matrix(self, joint_angles):
+        """
+        Tool pose in the world (base) frame
+        :param joint_angles: (J,) or (..., J) joint angles in degrees
+        :return: (4, 4) or (..., 4, 4) transforms
+        """
+        joint_angles = np.asarray(joint_angles, dtype=np.float64)
+        frames = self._cached(joint_angles)
+        if frames is not None:
+            return frames[..., -1, :, :].copy()
+        cos, sin, batch_shape = self._angles(joint_angles)
+        for columns in self._chain(cos, sin):
+            pass
+        if batch_shape is None:
+            x, y, z, p = columns
+            return np.array([[x[0], y[0], z[0], p[0]], [x[1], y[1], z[1], p[1]], [x[2], y[2], z[2], p[2]],
+                             [0.0, 0.0, 0.0, 1.0]])
+        out = np.zeros((cos.shape[1], 4, 4))
+        self._fill(out, columns)
+        return out.reshape(batch_shape + (4, 4))
+
+    def link_frames(self, joint_angles):
+        """
+        All the frames in the world (base) frame
+        :param joint_angles: (J,) or (..., J) joint angles in degrees
+        :return: (J + 2, 4, 4) or (..., J + 2, 4, 4), [0] is the base, [i] the link i and [-1] the tool (the flange
+        when there is no tool), read only and kept for the next call with the same joint angles
+        """
+        joint_angles = np.asarray(joint_angles, dtype=np.float64)
+        frames = self._cached(joint_angles)
+        if frames is not None:
+            return frames
+        cos, sin, batch_shape = self._angles(joint_angles)
+        if batch_shape is None:
+            # One flat list per frame is faster for np.array than the nested rows
+            frames = np.array([[x[0], y[0], z[0], p[0], x[1], y[1], z[1], p[1], x[2], y[2], z[2], p[2],
+                                0.0, 0.0, 0.0, 1.0] for x, y, z, p in self._chain(cos, sin)]).reshape(-1, 4, 4)
+        else:
+            frames = np.zeros((cos.shape[1], self.joints_num + 2, 4, 4))
+            for index, columns in enumerate(self._chain(cos, sin)):
+                self._fill(frames[:, index], columns)
+            frames = frames.reshape(batch_shape + frames.shape[1:])
+        frames.flags.writeable = False
+        self._cached_angles = joint_angles.copy()
+        self._cached_frames = frames
+        return frames
+
+    def _cached(self, joint_angles):
+        """Frames of the last link_frames if the joint angles are the same"""
+        cached_angles = self._cached_angles
+        if cached_angles is not None and cached_angles.shape == joint_angles.shape \
+                and np.array_equal(cached_angles, joint_angles):
+            return self._cached_frames
+        return None
+
+    def tool_pose(self, joint_angles):
+        """TransformMatrix of one joint vector, PoseBatch of (N, J) joint vectors"""
+        matrices = self.tool_matrix(joint_angles)
+        if matrices.ndim == 2:
+            return TransformMatrix.from_matrix(matrices)
+        return PoseBatch.from_matrices(matrices)
+
+    @staticmethod
+    def benchmark(batch_size: int = 10000):
+        """Vectorised FK against 4 x 4 DH matrices multiplied joint by joint"""
+        from devices.UR3E import config
+        kinematics = ForwardKinematics.from_config(config)
+        dh_param = config.armDHParam
+        np.random.seed(42)
+        joints = np.random.uniform(-180, 180, (batch_size, kinematics.joints_num))
+
+        def dh_matrices(joint_angles):
+            matrix = np.eye(4)
+            for theta, d, a, alpha in zip(np.radians(joint_angles), dh_param.d, dh_param.a, np.radians(dh_param.alpha)):
+                ct, st, ca, sa = np.cos(theta), np.sin(theta), np.cos(alpha), np.sin(alpha)
+                matrix = matrix @ np.array([[ct, -st * ca, st * sa, a * ct], [st, ct * ca, -ct * sa, a * st],
+                                            [0, sa, ca, d], [0, 0, 0, 1]])
+            return matrix
+
+        loop_num = batch_size // 10
+        start_time = time.perf_counter()
+        loop_matrices = np.array([dh_matrices(joint_angles) for joint_angles in joints[:loop_num]])
+        loop_cost = (time.perf_counter() - start_time) / loop_num
+
+        start_time = time.perf_counter()
+        for joint_angles in joints[:loop_num]:
+            kinematics.tool_matrix(joint_angles)
+        single_cost = (time.perf_counter() - start_time) / loop_num
+
+        start_time = time.perf_counter()
+        batch_matrices = kinematics.tool_matrix(joints)
+        batch_cost = (time.perf_counter() - start_time) / batch_size
+
+        start_time = time.perf_counter()
+        kinematics.link_frames(joints)
+        frames_cost = (time.perf_counter() - start_time) / batch_size
+
+        print(f"4 x 4 DH matrices: {loop_cost * 1e6:.2f} us/pose, one joint vector: {single_cost * 1e6:.2f} us/pose")
+        print(f"batch of {batch_size}: tool {batch_cost * 1e6:.3f} us/pose ({1 / batch_cost:.0f} poses/s), "
+              f"all frames {frames_cost * 1e6:.3f} us/pose")
+        print(f"max diff {np.max(np.abs(loop_matrices - batch_matrices[:loop_num])):.2e} mm")
+
+
+if __name__ == "__main__":
+    ForwardKinematics.benchmark()
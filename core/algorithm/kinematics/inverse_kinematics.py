@@ -0,0 +1,295 @@
+"""
+Inverse kinematics of a serial arm, closed form for the UR layout of the DH parameters and numeric for other arms.
+
+The UR arms (alpha = 90, 0, 0, 90, -90, 0 and only d1, a2, a3, d4, d5, d6) have up to 8 solutions: shoulder left /
+right (theta1), wrist up / down (theta5) and elbow up / down (theta3), see K. P. Hawkins, "Analytic Inverse Kinematics
+for the Universal Robots UR-5/UR-10 Arms". All of them are computed for a batch of target poses by a few NumPy calls,
+then the one closest to the current joint vector is taken, the angles are moved by 360 degrees to be next to it.
+A few us per pose in batches of thousands, one pose per call is about a hundred NumPy calls, so batch the targets.
+
+Other arms are solved by damped least squares (Levenberg-Marquardt) on the forward kinematics, started from the
+previous solution, which is close to the next target for the poses of a path.
+
+Example:
+    >>> from devices.UR3E import config
+    >>> kinematics = InverseKinematics.from_config(config)
+    >>> target = kinematics.forward.tool_matrix([10, -80, 30, -60, 45, 20])  # (4, 4) tool pose, mm
+    >>> joint_angles, reached = kinematics.solve(target, current=[0, -90, 0, -90, 0, 0])  # (6,), degrees
+    >>> bool(reached), np.allclose(kinematics.forward.tool_matrix(joint_angles), target)
+    (True, True)
+    >>> targets = kinematics.forward.tool_matrix(np.random.default_rng(0).uniform(-180, 180, (1000, 6)))
+    >>> joint_angles, reached = kinematics.solve(targets)  # (N, 4, 4) targets -> (N, 6), (N,)
+    >>> joint_angles.shape, bool(reached.all())
+    ((1000, 6), True)
+    >>> kinematics.all_solutions(target).shape  # NaN rows for the missing ones
+    (8, 6)
+"""
+
+import time
+import numpy as np
+from algorithm.kinematics.forward_kinematics import ForwardKinematics
+from algorithm.kinematics.jacobian import geometric_jacobian
+from algorithm.transfer.pose_batch import PoseBatch
+from algorithm.transfer.rotation import matrix_to_quaternion, quaternion_to_rotation_vector
+from algorithm.transfer.transform_matrix import TransformMatrix
+from devices.configuration import DHParam, DynamicArmParam, RoboticArmConfig
+
+_UR_ALPHA = (90.0, 0.0, 0.0, 90.0, -90.0, 0.0)
+# sin(theta5) under it is a wrist singularity, theta6 is then taken from the reference
+_WRIST_SINGULAR = 1e-9
+
+
+def _as_matrices(targets):
+    if isinstance(targets, TransformMatrix):
+        return targets.get_transform_matrix()
+    if isinstance(targets, PoseBatch):
+        return targets.get_transform_matrices()
+    targets = np.asarray(targets, dtype=np.float64)
+    if targets.shape[-2:] != (4, 4):
+        raise ValueError("The targets must be (4, 4) or (..., 4, 4) transforms")
+    return targets
+
+
+def _rigid_inverse(matrices):
+    inverses = np.zeros_like(matrices)
+    rotations_t = np.swapaxes(matrices[..., :3, :3], -1, -2)
+    inverses[..., :3, :3] = rotations_t
+    inverses[..., :3, 3] = -np.matmul(rotations_t, matrices[..., :3, 3, None])[..., 0]
+    inverses[..., 3, 3] = 1.0
+    return inverses
+
+
+def _arccos(values):
+    # Rounding could put a reachable value just out of [-1, 1], further out is NaN
+    return np.arccos(np.where(np.abs(values) <= 1 + 1e-9, np.clip(values, -1.0, 1.0), np.nan))
+
+
+def _wrap(angles):
+    """Degrees to [-180, 180]"""
+    return angles - 360.0 * np.round(angles / 360.0)
+
+
+class InverseKinematics:
+    def __init__(self, dh_param: DHParam, base=None, tool=None, dynamic_param: DynamicArmParam = None):
+        """
+        :param dh_param: DH parameters of the arm
+        :param base: TransformMatrix (or 4 x 4 matrix) of the arm base in the world, None for the identity
+        :param tool: TransformMatrix (or 4 x 4 matrix) of the tool in the flange frame, None for the flange
+        :param dynamic_param: its joint_angle is the current joint vector the closest solution is picked for
+        """
+        self.dh_param = dh_param
+        self.dynamic_param = dynamic_param
+        self.forward = ForwardKinematics(dh_param, base, tool)
+        self._base = None if base is None else _as_matrices(base)
+        self._tool = None if tool is None else _as_matrices(tool)
+        self._d = np.asarray(dh_param.d, dtype=np.float64)
+        self._a = np.asarray(dh_param.a, dtype=np.float64)
+        self._alpha = np.radians(np.asarray(dh_param.alpha, dtype=np.float64))
+        # Solution of the last solve, the numeric solver starts from it
+        self.previous_solution = None
+
+    @classmethod
+    def from_config(cls, config: RoboticArmConfig, base=None, tool=None) -> "InverseKinematics":
+        """Kinematics of a device config, e.g. devices.UR3E.config, its armDynamicParam is the current joint vector"""
+        if config.armDHParam is None:
+            raise ValueError("The config has no DH parameters")
+        return cls(config.armDHParam, base, tool, config.armDynamicParam)
+
+    @property
+    def is_analytic(self) -> bool:
+        """True if the arm has the UR layout which has the closed form"""
+        dh_param = self.dh_param
+        return (dh_param.joints_num == 6 and tuple(dh_param.alpha) == _UR_ALPHA and not any(dh_param.theta_offset)
+                and dh_param.a[0] == dh_param.a[3] == dh_param.a[4] == dh_param.a[5] == 0
+                and dh_param.d[1] == dh_param.d[2] == 0 and dh_param.a[1] != 0 and dh_param.a[2] != 0)
+
+    def _reference(self, current):
+        if current is not None:
+            return np.asarray(current, dtype=np.float64)
+        if self.dynamic_param is not None:
+            return self.dynamic_param.joint_angle
+        if self.previous_solution is not None:
+            return self.previous_solution
+        return np.zeros(self.dh_param.joints_num)
+
+    def _to_flange(self, matrices):
+        """Targets of the tool in the world to the flange in the arm base"""
+        if self._base is not None:
+            matrices = _rigid_inverse(self._base) @ matrices
+        if self._tool is not None:
+            matrices = matrices @ _rigid_inverse(self._tool)
+        return matrices
+
+    def all_solutions(self, targets, current=None):
+        """
+        All the closed form solutions, only for the UR layout
+        :param targets: (4, 4) / (N, 4, 4) tool poses in the world, TransformMatrix or PoseBatch
+        :param current: theta6 at the wrist singularity (theta5 = 0) is taken from it
+        :return: (8, 6) or (N, 8, 6) joint angles in degrees in [-180, 180], NaN rows for the missing solutions
+        """
+        if not self.is_analytic:
+            raise ValueError("The DH parameters have no closed form, use solve()")
+        matrices = _as_matrices(targets)
+        single = matrices.ndim == 2
+        matrices = self._to_flange(matrices.reshape(-1, 4, 4))
+        reference = np.radians(np.broadcast_to(self._reference(current), (len(matrices), 6)))
+        d1, d4, d5, d6 = self._d[0], self._d[3], self._d[4], self._d[5]
+        a2, a3 = self._a[1], self._a[2]
+        rotations = matrices[:, :3, :3]
+        positions = matrices[:, :3, 3]
+
+        # theta1 (N, 2): the wrist centre p05 is d4 away from the plane of the upper arm
+        p05 = positions - d6 * rotations[:, :, 2]
+        psi = np.arctan2(p05[:, 1], p05[:, 0])
+        phi = _arccos(d4 / np.hypot(p05[:, 0], p05[:, 1]))
+        theta1 = psi[:, None] + np.stack((phi, -phi), axis=1) + np.pi / 2
+        s1, c1 = np.sin(theta1), np.cos(theta1)
+
+        # theta5 (N, 2, 2)
+        cos5 = (positions[:, None, 0] * s1 - positions[:, None, 1] * c1 - d4) / d6
+        theta5 = _arccos(cos5)[:, :, None] * np.array([1.0, -1.0])
+        s5 = np.sin(theta5)
+
+        # theta6 (N, 2, 2), from the x and y axes of the base in the flange frame
+        sign5 = np.where(s5 < 0, -1.0, 1.0)
+        y6 = (-rotations[:, None, 0, 1] * s1 + rotations[:, None, 1, 1] * c1)[:, :, None] * sign5
+        x6 = (rotations[:, None, 0, 0] * s1 - rotations[:, None, 1, 0] * c1)[:, :, None] * sign5
+        theta6 = np.where(np.abs(s5) < _WRIST_SINGULAR, reference[:, None, None, 5], np.arctan2(y6, x6))
+        s6, c6 = np.sin(theta6), np.cos(theta6)
+
+        # Joints 2, 3 and 4 turn around the same axis (z of frame 1), a planar arm in the x-y plane of frame 1.
+        # Origin of frame 4 = p - d6 z6 + d5 (s6 x6 + c6 y6), x axis of frame 4 = c5 (c6 x6 - s6 y6) - s5 z6,
+        # both written in frame 1 (x1 = c1 x + s1 y, y1 = z - d1)
+        def in_frame1(column):
+            return (rotations[:, None, None, 0, column] * c1[:, :, None]
+                    + rotations[:, None, None, 1, column] * s1[:, :, None]), rotations[:, None, None, 2, column]
+
+        (x6_x1, x6_y1), (y6_x1, y6_y1), (z6_x1, z6_y1) = in_frame1(0), in_frame1(1), in_frame1(2)
+        p_x1 = (positions[:, None, 0] * c1 + positions[:, None, 1] * s1)[:, :, None]
+        p_y1 = positions[:, None, None, 2] - d1
+        o4_x1 = p_x1 - d6 * z6_x1 + d5 * (s6 * x6_x1 + c6 * y6_x1)
+        o4_y1 = p_y1 - d6 * z6_y1 + d5 * (s6 * x6_y1 + c6 * y6_y1)
+        c5 = np.cos(theta5)
+        theta234 = np.arctan2(c5 * (c6 * x6_y1 - s6 * y6_y1) - s5 * z6_y1,
+                              c5 * (c6 * x6_x1 - s6 * y6_x1) - s5 * z6_x1)
+
+        # theta3, theta2, theta4 (N, 2, 2, 2), elbow up / down
+        cos3 = (o4_x1 * o4_x1 + o4_y1 * o4_y1 - a2 * a2 - a3 * a3) / (2 * a2 * a3)
+        theta3 = _arccos(cos3)[..., None] * np.array([1.0, -1.0])
+        theta2 = (np.arctan2(o4_y1, o4_x1)[..., None]
+                  - np.arctan2(a3 * np.sin(theta3), a2 + a3 * np.cos(theta3)))
+        theta4 = theta234[..., None] - theta2 - theta3
+
+        shape = theta3.shape
+        solutions = np.stack((np.broadcast_to(theta1[:, :, None, None], shape), theta2, theta3, theta4,
+                              np.broadcast_to(theta5[..., None], shape), np.broadcast_to(theta6[..., None], shape)),
+                             axis=-1)
+        solutions = _wrap(np.degrees(solutions.reshape(len(matrices), 8, 6)))
+        solutions[np.isnan(solutions).any(axis=-1)] = np.nan
+        return solutions[0] if single else solutions
+
+    def closest_solution(self, solutions, current=None):
+        """
+        The solution with the smallest joint motion from the current joint vector
+        :param solutions: (8, 6) or (N, 8, 6) solutions of all_solutions
+        :return: (joint angles (6,) / (N, 6) next to the current ones, reached bool / (N,)), NaN if not reached
+        """
+        reference = self._reference(current)
+        difference = _wrap(solutions - reference[..., None, :])
+        distance = np.sum(difference * difference, axis=-1)
+        distance[np.isnan(distance)] = np.inf
+        best = np.argmin(distance, axis=-1)
+        chosen = np.take_along_axis(difference, best[..., None, None], axis=-2)[..., 0, :] + reference
+        return chosen, np.isfinite(np.take_along_axis(distance, best[..., None], axis=-1)[..., 0])
+
+    def _pose_error(self, flange_matrices, targets):
+        """(N, 6) position error and rotation vector error of the targets in the base frame"""
+        position_error = targets[:, :3, 3] - flange_matrices[:, :3, 3]
+        rotation_error = targets[:, :3, :3] @ np.swapaxes(flange_matrices[:, :3, :3], -1, -2)
+        return np.concatenate((position_error, quaternion_to_rotation_vector(matrix_to_quaternion(rotation_error))),
+                              axis=1)
+
+    def solve_numeric(self, targets, seed=None, max_iterations: int = 100, damping: float = 1e-2,
+                      position_tolerance: float = 1e-6, rotation_tolerance: float = 1e-9):
+        """
+        Damped least squares on the forward kinematics, for any DH parameters
+        dq = J^T (J J^T + damping^2 I)^-1 e, J is the geometric Jacobian of the link frames
+        :param targets: (4, 4) / (N, 4, 4) tool poses in the world, TransformMatrix or PoseBatch
+        :param seed: start joint angles in degrees, the previous solution (or the current joints) by default
+        :param position_tolerance: in the unit of the DH parameters
+        :param rotation_tolerance: in radians
+        :return: (joint angles (J,) / (N, J) in degrees, reached bool / (N,))
+        """
+        matrices = _as_matrices(targets)
+        single = matrices.ndim == 2
+        matrices = matrices.reshape(-1, 4, 4)
+        if seed is None:
+            seed = self.previous_solution if self.previous_solution is not None else self._reference(None)
+        joints_num = self.dh_param.joints_num
+        joint_angles = np.radians(np.array(np.broadcast_to(seed, (len(matrices), joints_num)), dtype=np.float64))
+        reached = np.zeros(len(matrices), dtype=bool)
+        active = np.arange(len(matrices))
+        for _ in range(max_iterations):
+            current = joint_angles[active]
+            frames = self.forward.link_frames(np.degrees(current))
+            error = self._pose_error(frames[:, -1], matrices[active])
+            done = ((np.linalg.norm(error[:, :3], axis=1) <= position_tolerance)
+                    & (np.linalg.norm(error[:, 3:], axis=1) <= rotation_tolerance))
+            reached[active[done]] = True
+            active, current, frames, error = active[~done], current[~done], frames[~done], error[~done]
+            if not len(active):
+                break
+            jacobian = geometric_jacobian(frames)
+            damped = jacobian @ np.swapaxes(jacobian, 1, 2) + damping * damping * np.eye(6)
+            delta = np.swapaxes(jacobian, 1, 2) @ np.linalg.solve(damped, error[:, :, None])
+            joint_angles[active] = current + delta[:, :, 0]
+        joint_angles = np.degrees(joint_angles)
+        return (joint_angles[0], reached[0]) if single else (joint_angles, reached)
+
+    def solve(self, targets, current=None):
+        """
+        Joint angles of the tool poses, the closed form solution closest to the current joint vector for the UR
+        layout, else solve_numeric started from the current joint vector (or the previous solution)
+        :param targets: (4, 4) / (N, 4, 4) tool poses in the world, TransformMatrix or PoseBatch
+        :param current: (6,) or (N, 6) current joint angles in degrees, by default the dynamic param joints
+        :return: (joint angles (6,) / (N, 6) in degrees, reached bool / (N,))
+        """
+        if self.is_analytic:
+            joint_angles, reached = self.closest_solution(self.all_solutions(targets, current), current)
+        else:
+            joint_angles, reached = self.solve_numeric(targets, current)
+        self.previous_solution = joint_angles
+        return joint_angles, reached
+
+    @staticmethod
+    def benchmark(targets_num: int = 10000):
+        """Closed form against the numeric solver for random reachable poses of the UR3E"""
+        from devices.UR3E import config
+        kinematics = InverseKinematics.from_config(config)
+        np.random.seed(42)
+        joints = np.random.uniform(-180, 180, (targets_num, 6))
+        targets = kinematics.forward.tool_matrix(joints)
+
+        start_time = time.perf_counter()
+        solutions, reached = kinematics.solve(targets, current=joints + np.random.uniform(-5, 5, joints.shape))
+        analytic_cost = (time.perf_counter() - start_time) / targets_num
+        error = np.max(np.abs(kinematics.forward.tool_matrix(solutions[reached]) - targets[reached]))
+        print(f"closed form, {targets_num} targets: {analytic_cost * 1e6:.2f} us/pose, reached {np.mean(reached):.1%}, "
+              f"max pose error {error:.2e}, same joints {np.mean(np.all(np.abs(solutions - joints) < 1e-6, axis=1)):.1%}")
+
+        start_time = time.perf_counter()
+        for target in targets[:100]:
+            kinematics.solve(target)
+        print(f"closed form, one target per call: {(time.perf_counter() - start_time) / 100 * 1e6:.2f} us")
+
+        numeric_num = targets_num // 10
+        start_time = time.perf_counter()
+        solutions, reached = kinematics.solve_numeric(targets[:numeric_num],
+                                                      joints[:numeric_num] + np.random.uniform(-5, 5, (numeric_num, 6)))
+        numeric_cost = (time.perf_counter() - start_time) / numeric_num
+        print(f"numeric from 5 degrees away, {numeric_num} targets: {numeric_cost * 1e6:.2f} us/pose, "
+              f"reached {np.mean(reached):.1%}")
+
+
+if __name__ == "__main__":
+    InverseKinematics.benchmark()
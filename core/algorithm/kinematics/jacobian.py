@@ -0,0 +1,162 @@
+"""
+Geometric Jacobian of a serial arm from the link frames of the forward kinematics, with the manipulability and the
+condition number for the singularity checks.
+
+The column i is [z_i x (p_tool - o_i), z_i] where z_i and o_i are the axis and the origin of the joint i + 1 (frame i),
+so the tool twist [v, w] = J @ dq, v in the length unit of the DH parameters per second and dq in radians per second.
+ForwardKinematics keeps the frames of its last joint vector, a Jacobian of the joints the tick just ran the forward
+kinematics for takes them without computing the chain again.
+
+Example:
+    >>> from devices.UR3E import config
+    >>> jacobian = ArmJacobian.from_config(config)
+    >>> joint_angles = [10, -80, 30, -60, 45, 20]  # degrees
+    >>> frames = jacobian.forward.link_frames(joint_angles)  # the tool pose of the tick is frames[-1]
+    >>> J = jacobian.jacobian(joint_angles)  # (6, 6), same frames
+    >>> J, manipulability, condition = jacobian.analyse(joint_angles)
+    >>> J, manipulability, condition = jacobian.analyse(np.random.uniform(-180, 180, (10000, 6)))
+    >>> J.shape, manipulability.shape, condition.shape
+    ((10000, 6, 6), (10000,), (10000,))
+"""
+
+import time
+import numpy as np
+from algorithm.kinematics.forward_kinematics import ForwardKinematics
+from devices.configuration import RoboticArmConfig
+
+
+def geometric_jacobian(frames):
+    """
+    :param frames: (J + 2, 4, 4) or (..., J + 2, 4, 4) frames of ForwardKinematics.link_frames
+    :return: (6, J) or (..., 6, J) Jacobians
+    """
+    if frames.ndim == 3:
+        return _single_jacobian(frames)
+    axes = frames[..., :-2, :3, 2]
+    lever = frames[..., -1, None, :3, 3] - frames[..., :-2, :3, 3]
+    jacobians = np.empty(frames.shape[:-3] + (6, frames.shape[-3] - 2))
+    # z x r written out, np.cross costs more for the small arrays
+    jacobians[..., 0, :] = axes[..., 1] * lever[..., 2] - axes[..., 2] * lever[..., 1]
+    jacobians[..., 1, :] = axes[..., 2] * lever[..., 0] - axes[..., 0] * lever[..., 2]
+    jacobians[..., 2, :] = axes[..., 0] * lever[..., 1] - axes[..., 1] * lever[..., 0]
+    jacobians[..., 3:, :] = np.swapaxes(axes, -1, -2)
+    return jacobians
+
+
+def _single_jacobian(frames):
+    # Floats for one joint vector, a dozen NumPy calls on (J, 3) arrays cost more than the products
+    rows = frames.tolist()
+    px, py, pz = rows[-1][0][3], rows[-1][1][3], rows[-1][2][3]
+    columns = []
+    for row0, row1, row2, _ in rows[:-2]:
+        zx, zy, zz = row0[2], row1[2], row2[2]
+        rx, ry, rz = px - row0[3], py - row1[3], pz - row2[3]
+        columns.append((zy * rz - zz * ry, zz * rx - zx * rz, zx * ry - zy * rx, zx, zy, zz))
+    return np.array(columns).T
+
+
+def _singular_values(jacobians, length_scale):
+    """Descending singular values, square roots of the eigenvalues of J J^T which cost less than the SVD"""
+    if length_scale != 1.0:
+        jacobians = jacobians * np.array([1 / length_scale] * 3 + [1.0] * 3)[:, None]
+    eigenvalues = np.linalg.eigvalsh(jacobians @ np.swapaxes(jacobians, -1, -2))
+    return np.sqrt(np.maximum(eigenvalues[..., ::-1], 0.0))
+
+
+def manipulability(jacobians, length_scale: float = 1.0):
+    """
+    Yoshikawa manipulability sqrt(det(J J^T)), the product of the singular values, 0 at a singularity
+    :param length_scale: the linear rows are divided by it (e.g. 1000 for mm to m) so the lengths and the angles weigh
+    the same
+    """
+    return np.prod(_singular_values(jacobians, length_scale), axis=-1)
+
+
+def condition_number(jacobians, length_scale: float = 1.0):
+    """Largest / smallest singular value, inf at a singularity, see manipulability for length_scale"""
+    return _condition_number(_singular_values(jacobians, length_scale))
+
+
+def _condition_number(singular_values):
+    # np.where instead of np.errstate, the context manager costs more than the division
+    smallest = singular_values[..., -1]
+    return np.where(smallest > 0, singular_values[..., 0] / np.maximum(smallest, 1e-300), np.inf)
+
+
+class ArmJacobian:
+    def __init__(self, forward: ForwardKinematics, length_scale: float = 1.0):
+        """
+        :param forward: forward kinematics of the arm, its cached link frames are used
+        :param length_scale: see manipulability
+        """
+        self.forward = forward
+        self.length_scale = length_scale
+
+    @classmethod
+    def from_config(cls, config: RoboticArmConfig, base=None, tool=None, length_scale: float = 1.0) -> "ArmJacobian":
+        return cls(ForwardKinematics.from_config(config, base, tool), length_scale)
+
+    def jacobian(self, joint_angles):
+        """
+        :param joint_angles: (J,) or (..., J) joint angles in degrees
+        :return: (6, J) or (..., 6, J) Jacobians in the world (base) frame
+        """
+        return geometric_jacobian(self.forward.link_frames(joint_angles))
+
+    def manipulability(self, joint_angles):
+        return manipulability(self.jacobian(joint_angles), self.length_scale)
+
+    def condition_number(self, joint_angles):
+        return condition_number(self.jacobian(joint_angles), self.length_scale)
+
+    def analyse(self, joint_angles):
+        """(Jacobians, manipulability, condition number) with one eigenvalue decomposition"""
+        jacobians = self.jacobian(joint_angles)
+        singular_values = _singular_values(jacobians, self.length_scale)
+        return jacobians, np.prod(singular_values, axis=-1), _condition_number(singular_values)
+
+    @staticmethod
+    def benchmark(ticks_num: int = 2000, batch_size: int = 10000):
+        """One control tick (FK, Jacobian, manipulability and condition number) against the 2 ms of 500 Hz"""
+        from devices.UR3E import config
+        arm_jacobian = ArmJacobian.from_config(config, length_scale=1000.0)
+        np.random.seed(42)
+        joints = np.random.uniform(-180, 180, (ticks_num, 6))
+
+        step = 1e-6
+        jacobian = arm_jacobian.jacobian(joints[0])
+        numeric = np.empty((6, 6))
+        tool = arm_jacobian.forward.tool_matrix(joints[0])
+        for joint in range(6):
+            moved = joints[0].copy()
+            moved[joint] += np.degrees(step)
+            moved_tool = arm_jacobian.forward.tool_matrix(moved)
+            numeric[:3, joint] = (moved_tool[:3, 3] - tool[:3, 3]) / step
+            rotation = moved_tool[:3, :3] @ tool[:3, :3].T
+            numeric[3:, joint] = np.array([rotation[2, 1] - rotation[1, 2], rotation[0, 2] - rotation[2, 0],
+                                           rotation[1, 0] - rotation[0, 1]]) / (2 * step)
+        print(f"max diff to finite differences: {np.max(np.abs(jacobian - numeric) / (np.abs(numeric) + 1)):.2e}")
+
+        forward_cost = 0.0
+        jacobian_cost = 0.0
+        for joint_angles in joints:
+            start_time = time.perf_counter()
+            arm_jacobian.forward.link_frames(joint_angles)
+            middle_time = time.perf_counter()
+            arm_jacobian.analyse(joint_angles)
+            end_time = time.perf_counter()
+            forward_cost += middle_time - start_time
+            jacobian_cost += end_time - middle_time
+        forward_cost /= ticks_num
+        jacobian_cost /= ticks_num
+        print(f"one tick: frames {forward_cost * 1e6:.2f} us, Jacobian + manipulability + condition number "
+              f"{jacobian_cost * 1e6:.2f} us, {(forward_cost + jacobian_cost) / 2e-3:.1%} of a 500 Hz tick")
+
+        batch = np.random.uniform(-180, 180, (batch_size, 6))
+        start_time = time.perf_counter()
+        arm_jacobian.analyse(batch)
+        print(f"batch of {batch_size}: {(time.perf_counter() - start_time) / batch_size * 1e6:.2f} us/joint vector")
+
+
+if __name__ == "__main__":
+    ArmJacobian.benchmark()
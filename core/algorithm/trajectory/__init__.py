@@ -0,0 +1 @@
+from .joint_trajectory import JointTrajectory
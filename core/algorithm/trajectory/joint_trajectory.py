@@ -0,0 +1,235 @@
+"""
+Time parameterised joint trajectories through waypoints, with the velocity, acceleration and (for the S-curve) jerk
+limits of every joint.
+
+Every segment moves all the joints together from one waypoint to the next, q(t) = q_k + D_k s(t) with one profile
+s(t) from 0 to 1: trapezoidal (acceleration limited) or 7 phase S-curve (jerk limited). The limits of s are the
+tightest of the joints, max_velocity / |D|, so the slowest joint sets the time and the others are scaled to finish with
+it. With blend > 0 the next segment starts while the previous one still slows down and the two are added, the arm
+does not stop at the waypoint and passes near it. The velocities and accelerations of the two segments add up during
+the blend, so they stay in the limits for the joints which keep their direction, use blend = 0 where a joint reverses
+and the limits must hold.
+
+The whole trajectory could be sampled in one vectorised call, or streamed in chunks from a generator so a long move
+does not build arrays of all its setpoints.
+
+Example:
+    >>> trajectory = JointTrajectory([[0, -90, 0, -90, 0, 0], [30, -60, 20, -90, 10, 0], [60, -90, 0, -90, 0, 30]],
+    ...                              max_velocity=60, max_acceleration=120, max_jerk=600, blend=0.5)
+    >>> times, positions, velocities, accelerations = trajectory.sample(dt=0.002)  # (N,), (N, 6) ...
+    >>> sent = []
+    >>> for time_stamp, joint_angles in trajectory.setpoints(dt=0.002):  # lazily, one (6,) setpoint per tick
+    ...     sent.append(joint_angles)  # e.g. send it to the arm
+    >>> np.allclose(sent, positions)
+    True
+"""
+
+import time
+import numpy as np
+from devices.configuration import DynamicArmParam
+
+_PHASES_NUM = 7
+
+
+def _normalised_profile(velocity, acceleration, jerk=None):
+    """
+    Phases of the fastest s(t) from 0 to 1 in the limits
+    :return: (durations (7,), accelerations at the phase starts (7,), jerks (7,))
+    """
+    if jerk is None:
+        if velocity * velocity / acceleration > 1:
+            # Triangular, the cruise velocity is not reached
+            velocity = np.sqrt(acceleration)
+        accelerate_time = velocity / acceleration
+        cruise_time = 1 / velocity - accelerate_time
+        # Same phases as the S-curve, the jerk phases take no time
+        return (np.array([accelerate_time, 0, 0, cruise_time, accelerate_time, 0, 0]),
+                np.array([acceleration, 0, 0, 0, -acceleration, 0, 0]), np.zeros(_PHASES_NUM))
+    if velocity * jerk < acceleration * acceleration:
+        # The acceleration limit is not reached before the velocity limit
+        acceleration = np.sqrt(velocity * jerk)
+    if velocity * (velocity / acceleration + acceleration / jerk) > 1:
+        # The cruise velocity is not reached, the largest one which stops in time with the constant acceleration
+        velocity = acceleration / 2 * (-acceleration / jerk + np.sqrt((acceleration / jerk) ** 2 + 4 / acceleration))
+        if velocity * jerk < acceleration * acceleration:
+            # Not even the constant acceleration phase
+            velocity = (jerk / 4) ** (1 / 3)
+            acceleration = np.sqrt(velocity * jerk)
+    jerk_time = acceleration / jerk
+    constant_time = max(velocity / acceleration - jerk_time, 0.0)
+    cruise_time = max(1 / velocity - constant_time - 2 * jerk_time, 0.0)
+    return (np.array([jerk_time, constant_time, jerk_time, cruise_time, jerk_time, constant_time, jerk_time]),
+            np.array([0, acceleration, acceleration, 0, 0, -acceleration, -acceleration]),
+            np.array([jerk, 0, -jerk, 0, -jerk, 0, jerk]))
+
+
+class JointTrajectory:
+    def __init__(self, waypoints, max_velocity, max_acceleration, max_jerk=None, blend: float = 0.0):
+        """
+        :param waypoints: (K + 1, J) joint angles, the first one is the start
+        :param max_velocity: scalar or (J,) velocity limits, per second in the unit of the waypoints
+        :param max_acceleration: scalar or (J,) acceleration limits
+        :param max_jerk: scalar or (J,) jerk limits for S-curves, None for trapezoidal profiles
+        :param blend: 0 stops at every waypoint, up to 1 overlaps the slowing down of a segment with the speeding up
+        of the next one
+        """
+        self.waypoints = np.array(waypoints, dtype=np.float64)
+        if self.waypoints.ndim != 2 or len(self.waypoints) < 2:
+            raise ValueError("waypoints must be (K + 1, J) with at least a start and a target")
+        if not 0 <= blend <= 1:
+            raise ValueError("blend must be in [0, 1]")
+        joints_num = self.waypoints.shape[1]
+        self.max_velocity = np.broadcast_to(np.asarray(max_velocity, dtype=np.float64), (joints_num,))
+        self.max_acceleration = np.broadcast_to(np.asarray(max_acceleration, dtype=np.float64), (joints_num,))
+        self.max_jerk = None if max_jerk is None else \
+            np.broadcast_to(np.asarray(max_jerk, dtype=np.float64), (joints_num,))
+        self.blend = blend
+        self._distances = np.diff(self.waypoints, axis=0)
+        self._plan()
+
+    @classmethod
+    def from_dynamic_param(cls, dynamic_param: DynamicArmParam, targets, max_velocity, max_acceleration,
+                           max_jerk=None, blend: float = 0.0) -> "JointTrajectory":
+        """Trajectory from the current joint angles of the arm through the (K, J) or (J,) targets"""
+        waypoints = np.vstack((dynamic_param.joint_angle,
+                               np.atleast_2d(np.asarray(targets, dtype=np.float64))))
+        return cls(waypoints, max_velocity, max_acceleration, max_jerk, blend)
+
+    def _plan(self):
+        segments_num = len(self._distances)
+        # Per segment and phase: start time in the segment, s, ds/dt and d2s/dt2 at the start, jerk
+        self._phase_starts = np.zeros((segments_num, _PHASES_NUM))
+        self._phase_s = np.zeros((segments_num, _PHASES_NUM))
+        self._phase_v = np.zeros((segments_num, _PHASES_NUM))
+        self._phase_a = np.zeros((segments_num, _PHASES_NUM))
+        self._phase_j = np.zeros((segments_num, _PHASES_NUM))
+        self._durations = np.zeros(segments_num)
+        ramp_times = np.zeros(segments_num)
+        for k, distance in enumerate(np.abs(self._distances)):
+            moving = distance > 0
+            if not np.any(moving):
+                self._phase_s[k] = 1.0
+                continue
+            velocity = np.min(self.max_velocity[moving] / distance[moving])
+            acceleration = np.min(self.max_acceleration[moving] / distance[moving])
+            jerk = None if self.max_jerk is None else np.min(self.max_jerk[moving] / distance[moving])
+            durations, accelerations, jerks = _normalised_profile(velocity, acceleration, jerk)
+            starts = np.concatenate(([0.0], np.cumsum(durations)[:-1]))
+            s, v = 0.0, 0.0
+            for phase in range(_PHASES_NUM):
+                self._phase_s[k, phase], self._phase_v[k, phase] = s, v
+                dt, a, j = durations[phase], accelerations[phase], jerks[phase]
+                s += v * dt + a * dt * dt / 2 + j * dt ** 3 / 6
+                v += a * dt + j * dt * dt / 2
+            self._phase_starts[k] = starts
+            self._phase_a[k] = accelerations
+            self._phase_j[k] = jerks
+            self._durations[k] = np.sum(durations)
+            # Speeding up (and slowing down) time, the blends overlap them
+            ramp_times[k] = durations[0] + durations[1] + durations[2]
+        overlaps = self.blend * np.minimum(ramp_times[:-1], ramp_times[1:])
+        self._starts = np.concatenate(([0.0], np.cumsum(self._durations[:-1] - overlaps)))
+        self._ends = self._starts + self._durations
+
+    @property
+    def duration(self) -> float:
+        return float(self._ends[-1])
+
+    @property
+    def segment_times(self):
+        """(K, 2) start and end time of every segment"""
+        return np.stack((self._starts, self._ends), axis=1)
+
+    def _profile(self, segments, local_times):
+        """s, ds/dt, d2s/dt2 of the segments at their local times, (N,) each"""
+        local_times = np.clip(local_times, 0.0, self._durations[segments])
+        phases = np.sum(local_times[:, None] >= self._phase_starts[segments, 1:], axis=1)
+        dt = local_times - self._phase_starts[segments, phases]
+        s0, v0 = self._phase_s[segments, phases], self._phase_v[segments, phases]
+        a0, j = self._phase_a[segments, phases], self._phase_j[segments, phases]
+        s = s0 + dt * (v0 + dt * (a0 / 2 + dt * j / 6))
+        v = v0 + dt * (a0 + dt * j / 2)
+        a = a0 + dt * j
+        finished = local_times >= self._durations[segments]
+        s[finished], v[finished], a[finished] = 1.0, 0.0, 0.0
+        return s, v, a
+
+    def evaluate(self, times):
+        """
+        :param times: (N,) times from the start of the trajectory, clipped to [0, duration]
+        :return: positions, velocities, accelerations, (N, J) each
+        """
+        times = np.atleast_1d(np.asarray(times, dtype=np.float64))
+        segments = np.clip(np.searchsorted(self._starts, times, side="right") - 1, 0, len(self._starts) - 1)
+        s, v, a = self._profile(segments, times - self._starts[segments])
+        distances = self._distances[segments]
+        positions = self.waypoints[segments] + distances * s[:, None]
+        velocities = distances * v[:, None]
+        accelerations = distances * a[:, None]
+        # The previous segment still slows down in the blend
+        blending = np.flatnonzero((segments > 0) & (times < self._ends[np.maximum(segments - 1, 0)]))
+        if len(blending):
+            previous = segments[blending] - 1
+            s, v, a = self._profile(previous, times[blending] - self._starts[previous])
+            distances = self._distances[previous]
+            positions[blending] += distances * (s - 1)[:, None]
+            velocities[blending] += distances * v[:, None]
+            accelerations[blending] += distances * a[:, None]
+        return positions, velocities, accelerations
+
+    def _sample_times(self, dt: float, start: int, stop: int):
+        # index * dt does not add up rounding like a running sum, the last sample is the end
+        return np.minimum(np.arange(start, stop) * dt, self.duration)
+
+    def samples_num(self, dt: float) -> int:
+        return int(np.ceil(self.duration / dt - 1e-9)) + 1
+
+    def sample(self, dt: float):
+        """Whole trajectory every dt: times (N,), positions, velocities, accelerations (N, J)"""
+        times = self._sample_times(dt, 0, self.samples_num(dt))
+        return (times,) + self.evaluate(times)
+
+    def stream(self, dt: float, chunk_size: int = 512):
+        """Yield the samples of sample() in chunks of chunk_size: times (n,), positions, velocities, accelerations"""
+        samples_num = self.samples_num(dt)
+        for start in range(0, samples_num, chunk_size):
+            times = self._sample_times(dt, start, min(start + chunk_size, samples_num))
+            yield (times,) + self.evaluate(times)
+
+    def setpoints(self, dt: float, chunk_size: int = 512):
+        """Yield (time, (J,) positions) one by one, computed chunk by chunk"""
+        for times, positions, _, _ in self.stream(dt, chunk_size):
+            yield from zip(times.tolist(), positions)
+
+    @staticmethod
+    def benchmark(dt: float = 0.002):
+        """Long S-curve move through random waypoints, sampled at once and streamed"""
+        np.random.seed(42)
+        waypoints = np.cumsum(np.random.uniform(-60, 60, (200, 6)), axis=0)
+        start_time = time.perf_counter()
+        trajectory = JointTrajectory(waypoints, max_velocity=60, max_acceleration=120, max_jerk=600, blend=1.0)
+        plan_cost = time.perf_counter() - start_time
+
+        start_time = time.perf_counter()
+        times, positions, velocities, accelerations = trajectory.sample(dt)
+        sample_cost = time.perf_counter() - start_time
+        print(f"{len(waypoints) - 1} segments, {trajectory.duration:.1f} s, {len(times)} setpoints: plan "
+              f"{plan_cost * 1e3:.2f} ms, sample {sample_cost * 1e3:.2f} ms "
+              f"({sample_cost / len(times) * 1e6:.3f} us/setpoint, {positions.nbytes * 4 / 1e6:.1f} MB)")
+
+        start_time = time.perf_counter()
+        for time_stamp, joint_angles in trajectory.setpoints(dt):
+            pass
+        stream_cost = time.perf_counter() - start_time
+        print(f"streamed setpoints: {stream_cost / len(times) * 1e6:.3f} us/setpoint, "
+              f"last {np.max(np.abs(joint_angles - waypoints[-1])):.2e} from the target")
+
+        fixed = JointTrajectory(waypoints[:20], max_velocity=60, max_acceleration=120, max_jerk=600)
+        _, _, velocities, accelerations = fixed.sample(dt / 10)
+        jerks = np.diff(accelerations, axis=0) / (dt / 10)
+        print(f"no blend, max |v| {np.max(np.abs(velocities)):.2f} <= 60, max |a| {np.max(np.abs(accelerations)):.2f}"
+              f" <= 120, max |j| {np.max(np.abs(jerks)):.2f} <= 600")
+
+
+if __name__ == "__main__":
+    JointTrajectory.benchmark()
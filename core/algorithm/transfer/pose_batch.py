@@ -0,0 +1,226 @@
+"""
+Many poses in contiguous arrays, for example the candidate end effector poses of one planning cycle.
+
+positions and orientations are (N, 3) arrays, the orientations are the ZYX Euler angles in degrees of
+TransformMatrix (alpha around Z, beta around Y, gamma around X). The (N, 4, 4) transforms, their inverses and the
+compositions are computed by a few NumPy calls for all the poses, instead of one TransformMatrix object and its trig
+per pose.
+
+Example:
+    >>> poses = PoseBatch(np.random.rand(5000, 3), np.random.uniform(-180, 180, (5000, 3)))
+    >>> matrices = poses.get_transform_matrices()  # (5000, 4, 4)
+    >>> tool_poses = poses.compose(PoseBatch.from_transforms([TransformMatrix([0, 0, 0.1], [0, 0, 0])]))
+    >>> first = poses[0]  # TransformMatrix
+"""
+
+import time
+import numpy as np
+from algorithm.transfer.rotation import euler_to_quaternion, quaternion_to_euler, slerp
+from algorithm.transfer.transform_matrix import TransformMatrix
+
+
+class PoseBatch:
+    def __init__(self, positions, orientations):
+        """
+        :param positions: (N, 3) positions
+        :param orientations: (N, 3) ZYX Euler angles in degrees, same as TransformMatrix
+        """
+        self.define_dtype = np.float64
+        self._positions = self._read_only(positions)
+        self._orientations = self._read_only(orientations)
+        if self._positions.shape != self._orientations.shape:
+            raise ValueError("positions and orientations must have the same shape")
+        # Cached (N, 4, 4) matrices, dropped by the setters
+        self._transform_matrices = None
+        self._inverse_transform_matrices = None
+
+    def _read_only(self, values):
+        # An in place change of the array would not drop the cached matrices, so it is not allowed
+        array = np.array(values, dtype=self.define_dtype).reshape(-1, 3)
+        array.flags.writeable = False
+        return array
+
+    def __len__(self):
+        return len(self._positions)
+
+    def __getitem__(self, index):
+        """TransformMatrix of one pose, or a PoseBatch of a slice / index array"""
+        if isinstance(index, (int, np.integer)):
+            return TransformMatrix(self._positions[index], self._orientations[index])
+        return PoseBatch(self._positions[index], self._orientations[index])
+
+    def __iter__(self):
+        return (self[i] for i in range(len(self)))
+
+    @property
+    def positions(self):
+        return self._positions
+
+    @positions.setter
+    def positions(self, new_positions):
+        self._positions = self._read_only(new_positions)
+        self._transform_matrices = None
+        self._inverse_transform_matrices = None
+
+    @property
+    def orientations(self):
+        return self._orientations
+
+    @orientations.setter
+    def orientations(self, new_orientations):
+        self._orientations = self._read_only(new_orientations)
+        self._transform_matrices = None
+        self._inverse_transform_matrices = None
+
+    @classmethod
+    def from_transforms(cls, transforms):
+        """Create a batch of the poses of TransformMatrix instances"""
+        transforms = list(transforms)
+        return cls([transform.position for transform in transforms],
+                   [transform.orientation for transform in transforms])
+
+    def to_transforms(self) -> list:
+        return list(self)
+
+    @classmethod
+    def from_matrices(cls, matrices):
+        """
+        Create a batch of (N, 4, 4) rigid transforms, the Euler angles are extracted in the ZYX convention.
+        At beta = +-90 degrees gamma is set to 0 and alpha takes the whole rotation around Z.
+        """
+        matrices = np.asarray(matrices, dtype=np.float64).reshape(-1, 4, 4)
+        rotations = matrices[:, :3, :3]
+        cos_beta = np.hypot(rotations[:, 0, 0], rotations[:, 1, 0])
+        # arctan2 keeps the precision near +-90 degrees where arcsin does not
+        beta = np.arctan2(-rotations[:, 2, 0], cos_beta)
+        locked = cos_beta < 1e-9
+        alpha = np.where(locked, np.arctan2(-rotations[:, 0, 1], rotations[:, 1, 1]),
+                         np.arctan2(rotations[:, 1, 0], rotations[:, 0, 0]))
+        gamma = np.where(locked, 0.0, np.arctan2(rotations[:, 2, 1], rotations[:, 2, 2]))
+        orientations = np.degrees(np.stack((alpha, beta, gamma), axis=1))
+        return cls(matrices[:, :3, 3], orientations)
+
+    @classmethod
+    def from_quaternions(cls, positions, quaternions):
+        """Create a batch of (N, 3) positions and (N, 4) [w, x, y, z] quaternions"""
+        return cls(positions, quaternion_to_euler(quaternions))
+
+    def get_quaternions(self):
+        """(N, 4) [w, x, y, z] quaternions of the orientations"""
+        return euler_to_quaternion(self._orientations)
+
+    def interpolate(self, other: "PoseBatch", fractions) -> "PoseBatch":
+        """
+        Linear between the positions, SLERP between the rotations, pose by pose
+        :param other: PoseBatch of N or 1 poses
+        :param fractions: scalar or (N,) fractions, 0 is self and 1 is other
+        """
+        fractions = np.asarray(fractions, dtype=self.define_dtype)
+        positions = self._positions + fractions[..., None] * (other.positions - self._positions)
+        return PoseBatch.from_quaternions(positions, slerp(self.get_quaternions(), other.get_quaternions(), fractions))
+
+    def get_transform_matrices(self):
+        """(N, 4, 4) transforms, Rz @ Ry @ Rx written out like TransformMatrix"""
+        if self._transform_matrices is None:
+            radians = np.radians(self._orientations)
+            cos = np.cos(radians)
+            sin = np.sin(radians)
+            ca, cb, cg = cos.T
+            sa, sb, sg = sin.T
+            matrices = np.zeros((len(self), 4, 4), dtype=self.define_dtype)
+            sb_sg = sb * sg
+            sb_cg = sb * cg
+            matrices[:, 0, 0] = ca * cb
+            matrices[:, 0, 1] = ca * sb_sg - sa * cg
+            matrices[:, 0, 2] = ca * sb_cg + sa * sg
+            matrices[:, 1, 0] = sa * cb
+            matrices[:, 1, 1] = sa * sb_sg + ca * cg
+            matrices[:, 1, 2] = sa * sb_cg - ca * sg
+            matrices[:, 2, 0] = -sb
+            matrices[:, 2, 1] = cb * sg
+            matrices[:, 2, 2] = cb * cg
+            matrices[:, :3, 3] = self._positions
+            matrices[:, 3, 3] = 1.0
+            matrices.flags.writeable = False
+            self._transform_matrices = matrices
+        return self._transform_matrices
+
+    def get_inverse_transform_matrices(self):
+        """(N, 4, 4) rigid inverses [R^T, -R^T t]"""
+        if self._inverse_transform_matrices is None:
+            matrices = self.get_transform_matrices()
+            inverses = np.zeros_like(matrices)
+            rotations_t = matrices[:, :3, :3].transpose(0, 2, 1)
+            inverses[:, :3, :3] = rotations_t
+            inverses[:, :3, 3] = -np.matmul(rotations_t, matrices[:, :3, 3, None])[:, :, 0]
+            inverses[:, 3, 3] = 1.0
+            inverses.flags.writeable = False
+            self._inverse_transform_matrices = inverses
+        return self._inverse_transform_matrices
+
+    def inverse(self) -> "PoseBatch":
+        return PoseBatch.from_matrices(self.get_inverse_transform_matrices())
+
+    def compose_matrices(self, other):
+        """
+        (N, 4, 4) self[i] @ other[i]
+        :param other: PoseBatch of N or 1 poses, TransformMatrix, or (N, 4, 4) / (4, 4) matrices
+        """
+        if isinstance(other, PoseBatch):
+            other = other.get_transform_matrices()
+        elif isinstance(other, TransformMatrix):
+            other = other.get_transform_matrix()
+        matrices = self.get_transform_matrices()
+        other = np.asarray(other, dtype=self.define_dtype)
+        composed = np.zeros(np.broadcast_shapes(matrices.shape, other.shape), dtype=self.define_dtype)
+        # Only the 3 x 4 part is multiplied, the last row stays [0, 0, 0, 1]
+        np.matmul(matrices[..., :3, :3], other[..., :3, :], out=composed[..., :3, :])
+        composed[..., :3, 3] += matrices[..., :3, 3]
+        composed[..., 3, 3] = 1.0
+        return composed
+
+    def compose(self, other) -> "PoseBatch":
+        """self[i] then other[i] in the frame of self[i], see compose_matrices"""
+        return PoseBatch.from_matrices(self.compose_matrices(other))
+
+    def transform_coordinates(self, point):
+        """
+        One point in the frame of every pose
+        :param point: (3,) point, or (N, 3) points with one point per pose
+        :return: (N, 3) points
+        """
+        matrices = self.get_transform_matrices()
+        point = np.asarray(point, dtype=self.define_dtype)
+        return np.matmul(matrices[:, :3, :3], point[..., None])[:, :, 0] + matrices[:, :3, 3]
+
+    @staticmethod
+    def benchmark(poses_num: int = 5000):
+        """One TransformMatrix per pose against PoseBatch"""
+        np.random.seed(42)
+        positions = np.random.rand(poses_num, 3)
+        orientations = np.random.uniform(-180, 180, (poses_num, 3))
+        tool = TransformMatrix([0, 0, 0.1], [10, 20, 30])
+
+        start_time = time.perf_counter()
+        transforms = [TransformMatrix(position, orientation) for position, orientation in zip(positions, orientations)]
+        loop_matrices = np.array([transform.get_transform_matrix() for transform in transforms])
+        loop_inverses = np.array([transform.get_inverse_transform_matrix() for transform in transforms])
+        loop_composed = loop_matrices @ tool.get_transform_matrix()
+        loop_cost = time.perf_counter() - start_time
+
+        start_time = time.perf_counter()
+        poses = PoseBatch(positions, orientations)
+        batch_matrices = poses.get_transform_matrices()
+        batch_inverses = poses.get_inverse_transform_matrices()
+        batch_composed = poses.compose_matrices(tool)
+        batch_cost = time.perf_counter() - start_time
+
+        print(f"{poses_num} poses, matrices + inverses + compositions: TransformMatrix objects "
+              f"{loop_cost * 1e3:.2f} ms, PoseBatch {batch_cost * 1e3:.2f} ms, speed up {loop_cost / batch_cost:.1f}")
+        print(f"max diff: matrices {np.max(np.abs(loop_matrices - batch_matrices)):.2e}, "
+              f"inverses {np.max(np.abs(loop_inverses - batch_inverses)):.2e}, "
+              f"compositions {np.max(np.abs(loop_composed - batch_composed)):.2e}")
+
+
+if __name__ == "__main__":
+    PoseBatch.benchmark()
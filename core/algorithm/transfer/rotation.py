@@ -0,0 +1,191 @@
+"""
+Conversions and operations of rotations, every function takes one rotation or a batch (leading dimensions).
+
+- Quaternion: [w, x, y, z], unit length, w is the scalar part.
+- Rotation vector: axis * angle in radians, the representation of the UR controllers (rx, ry, rz).
+- Euler angles: ZYX in degrees (alpha around Z, beta around Y, gamma around X) like TransformMatrix,
+  R = Rz(alpha) @ Ry(beta) @ Rx(gamma).
+
+Composing and interpolating quaternions needs no trig (composition) or one arccos (SLERP), instead of building and
+multiplying matrices from Euler angles.
+
+Example:
+    >>> q = euler_to_quaternion([30, 45, 60])
+    >>> rotation_vector = quaternion_to_rotation_vector(q)  # for the UR controller
+    >>> halfway = slerp(q, euler_to_quaternion([0, 0, 0]), 0.5)
+    >>> np.allclose(quaternion_to_euler(euler_to_quaternion([[30, 45, 60], [10, 0, 0]])), [[30, 45, 60], [10, 0, 0]])
+    True
+"""
+
+import time
+import numpy as np
+
+# cos(beta) under it is treated as the gimbal lock of the ZYX angles
+_GIMBAL_LOCK = 1e-9
+
+
+def _components(values, size):
+    values = np.asarray(values, dtype=np.float64)
+    if values.shape[-1:] != (size,):
+        raise ValueError(f"The last dimension must be {size}")
+    return tuple(values[..., i] for i in range(size))
+
+
+def euler_to_quaternion(orientations):
+    """(..., 3) ZYX Euler angles in degrees -> (..., 4) quaternions"""
+    half = np.radians(np.asarray(orientations, dtype=np.float64)) / 2
+    ca, cb, cg = _components(np.cos(half), 3)
+    sa, sb, sg = _components(np.sin(half), 3)
+    return np.stack((ca * cb * cg + sa * sb * sg,
+                     ca * cb * sg - sa * sb * cg,
+                     ca * sb * cg + sa * cb * sg,
+                     sa * cb * cg - ca * sb * sg), axis=-1)
+
+
+def quaternion_to_euler(quaternions):
+    """(..., 4) quaternions -> (..., 3) ZYX Euler angles in degrees, gamma is 0 at the gimbal lock"""
+    w, x, y, z = _components(quaternions, 4)
+    r00 = 1 - 2 * (y * y + z * z)
+    r10 = 2 * (x * y + w * z)
+    # arctan2 keeps the precision near +-90 degrees where arcsin does not
+    cos_beta = np.hypot(r00, r10)
+    beta = np.arctan2(2 * (w * y - x * z), cos_beta)
+    locked = cos_beta < _GIMBAL_LOCK
+    alpha = np.where(locked, np.arctan2(2 * (w * z - x * y), 1 - 2 * (x * x + z * z)), np.arctan2(r10, r00))
+    gamma = np.where(locked, 0.0, np.arctan2(2 * (w * x + y * z), 1 - 2 * (x * x + y * y)))
+    return np.degrees(np.stack((alpha, beta, gamma), axis=-1))
+
+
+def quaternion_to_matrix(quaternions):
+    """(..., 4) quaternions -> (..., 3, 3) rotation matrices, no trig"""
+    w, x, y, z = _components(quaternions, 4)
+    xx, yy, zz = x * x, y * y, z * z
+    xy, xz, yz = x * y, x * z, y * z
+    wx, wy, wz = w * x, w * y, w * z
+    return np.stack((np.stack((1 - 2 * (yy + zz), 2 * (xy - wz), 2 * (xz + wy)), axis=-1),
+                     np.stack((2 * (xy + wz), 1 - 2 * (xx + zz), 2 * (yz - wx)), axis=-1),
+                     np.stack((2 * (xz - wy), 2 * (yz + wx), 1 - 2 * (xx + yy)), axis=-1)), axis=-2)
+
+
+def matrix_to_quaternion(matrices):
+    """(..., 3, 3) rotation matrices (or (..., 4, 4) transforms) -> (..., 4) quaternions with w >= 0"""
+    matrices = np.asarray(matrices, dtype=np.float64)[..., :3, :3]
+    r00, r11, r22 = matrices[..., 0, 0], matrices[..., 1, 1], matrices[..., 2, 2]
+    # Four times the square of every component, the largest one is divided by without loss
+    candidates = np.stack((1 + r00 + r11 + r22, 1 + r00 - r11 - r22, 1 - r00 + r11 - r22, 1 - r00 - r11 + r22),
+                          axis=-1)
+    largest = np.argmax(candidates, axis=-1)
+    scale = 2 * np.sqrt(np.maximum(np.take_along_axis(candidates, largest[..., None], axis=-1)[..., 0], 1e-300))
+    m21_m12 = matrices[..., 2, 1] - matrices[..., 1, 2]
+    m02_m20 = matrices[..., 0, 2] - matrices[..., 2, 0]
+    m10_m01 = matrices[..., 1, 0] - matrices[..., 0, 1]
+    m10_p01 = matrices[..., 1, 0] + matrices[..., 0, 1]
+    m02_p20 = matrices[..., 0, 2] + matrices[..., 2, 0]
+    m21_p12 = matrices[..., 2, 1] + matrices[..., 1, 2]
+    quaternions = np.select(
+        [largest[..., None] == 0, largest[..., None] == 1, largest[..., None] == 2],
+        [np.stack((scale * scale / 4, m21_m12, m02_m20, m10_m01), axis=-1),
+         np.stack((m21_m12, scale * scale / 4, m10_p01, m02_p20), axis=-1),
+         np.stack((m02_m20, m10_p01, scale * scale / 4, m21_p12), axis=-1)],
+        np.stack((m10_m01, m02_p20, m21_p12, scale * scale / 4), axis=-1)) / scale[..., None]
+    return quaternions * np.where(quaternions[..., :1] < 0, -1.0, 1.0)
+
+
+def rotation_vector_to_quaternion(rotation_vectors):
+    """(..., 3) rotation vectors in radians -> (..., 4) quaternions"""
+    rotation_vectors = np.asarray(rotation_vectors, dtype=np.float64)
+    angle = np.linalg.norm(rotation_vectors, axis=-1)
+    small = angle < 1e-6
+    # sin(angle / 2) / angle, its series near 0
+    scale = np.where(small, 0.5 - angle * angle / 48, np.sin(angle / 2) / np.where(small, 1.0, angle))
+    return np.concatenate((np.cos(angle / 2)[..., None], rotation_vectors * scale[..., None]), axis=-1)
+
+
+def quaternion_to_rotation_vector(quaternions):
+    """(..., 4) quaternions -> (..., 3) rotation vectors in radians, the angle is in [0, pi]"""
+    quaternions = np.asarray(quaternions, dtype=np.float64)
+    # q and -q are the same rotation, the one with w >= 0 has the shorter angle
+    quaternions = quaternions * np.where(quaternions[..., :1] < 0, -1.0, 1.0)
+    w = quaternions[..., 0]
+    vector = quaternions[..., 1:]
+    sin_half = np.linalg.norm(vector, axis=-1)
+    angle = 2 * np.arctan2(sin_half, w)
+    small = sin_half < 1e-12
+    scale = np.where(small, 2 / np.where(small, np.maximum(w, 1e-300), 1.0), angle / np.where(small, 1.0, sin_half))
+    return vector * scale[..., None]
+
+
+def quaternion_multiply(q1, q2):
+    """(..., 4) q1 * q2, the rotation q2 then q1 (as R1 @ R2)"""
+    w1, x1, y1, z1 = _components(q1, 4)
+    w2, x2, y2, z2 = _components(q2, 4)
+    return np.stack((w1 * w2 - x1 * x2 - y1 * y2 - z1 * z2,
+                     w1 * x2 + x1 * w2 + y1 * z2 - z1 * y2,
+                     w1 * y2 - x1 * z2 + y1 * w2 + z1 * x2,
+                     w1 * z2 + x1 * y2 - y1 * x2 + z1 * w2), axis=-1)
+
+
+def quaternion_conjugate(quaternions):
+    """(..., 4) inverse of unit quaternions"""
+    return np.asarray(quaternions, dtype=np.float64) * np.array([1.0, -1.0, -1.0, -1.0])
+
+
+def quaternion_rotate(quaternions, points):
+    """(..., 3) points rotated by the (..., 4) quaternions, v + 2 u x (u x v + w v)"""
+    w, x, y, z = _components(quaternions, 4)
+    px, py, pz = _components(points, 3)
+    tx = 2 * (y * pz - z * py)
+    ty = 2 * (z * px - x * pz)
+    tz = 2 * (x * py - y * px)
+    return np.stack((px + w * tx + y * tz - z * ty,
+                     py + w * ty + z * tx - x * tz,
+                     pz + w * tz + x * ty - y * tx), axis=-1)
+
+
+def slerp(q0, q1, fraction):
+    """
+    Spherical linear interpolation, the rotation goes the shorter way
+    :param q0: (..., 4) quaternions at fraction 0
+    :param q1: (..., 4) quaternions at fraction 1
+    :param fraction: scalar or (...) fractions, broadcast with the quaternions
+    :return: (..., 4) quaternions
+    """
+    q0 = np.asarray(q0, dtype=np.float64)
+    q1 = np.asarray(q1, dtype=np.float64)
+    fraction = np.asarray(fraction, dtype=np.float64)[..., None]
+    dot = np.sum(q0 * q1, axis=-1, keepdims=True)
+    q1 = q1 * np.where(dot < 0, -1.0, 1.0)
+    dot = np.abs(dot)
+    # Nearly the same rotation, the linear interpolation is normalised instead of dividing by sin(theta) ~ 0
+    close = dot > 0.9995
+    theta = np.arccos(np.minimum(dot, 1.0))
+    sin_theta = np.where(close, 1.0, np.sin(theta))
+    weight0 = np.where(close, 1 - fraction, np.sin((1 - fraction) * theta) / sin_theta)
+    weight1 = np.where(close, fraction, np.sin(fraction * theta) / sin_theta)
+    result = weight0 * q0 + weight1 * q1
+    return result / np.linalg.norm(result, axis=-1, keepdims=True)
+
+
+def benchmark(rotations_num: int = 100000):
+    """Batched conversions, composition and SLERP of many rotations"""
+    np.random.seed(42)
+    orientations = np.random.uniform(-90, 90, (rotations_num, 3))
+    quaternions = euler_to_quaternion(orientations)
+    others = euler_to_quaternion(np.random.uniform(-90, 90, (rotations_num, 3)))
+    matrices = quaternion_to_matrix(quaternions)
+    for name, call in (("euler_to_quaternion", lambda: euler_to_quaternion(orientations)),
+                       ("quaternion_to_euler", lambda: quaternion_to_euler(quaternions)),
+                       ("quaternion_to_matrix", lambda: quaternion_to_matrix(quaternions)),
+                       ("matrix_to_quaternion", lambda: matrix_to_quaternion(matrices)),
+                       ("quaternion_to_rotation_vector", lambda: quaternion_to_rotation_vector(quaternions)),
+                       ("quaternion_multiply", lambda: quaternion_multiply(quaternions, others)),
+                       ("matrix @ matrix", lambda: matrices @ matrices),
+                       ("slerp", lambda: slerp(quaternions, others, 0.3))):
+        start_time = time.perf_counter()
+        call()
+        cost = time.perf_counter() - start_time
+        print(f"{name}: {cost / rotations_num * 1e9:.1f} ns/rotation")
+
+
+if __name__ == "__main__":
+    benchmark()
@@ -41,16 +41,107 @@ Example:
     >>> point_a_recovered = arm_transform.inverse_transform_coordinates(point_b)
     >>> print(point_a_recovered)
     [4. 5. 6.]
+    >>> cloud = np.random.rand(300000, 3).astype(np.float32)  # (N, 3) points, e.g. a depth camera frame
+    >>> cloud_b = arm_transform.transform_points(cloud)  # float32, same as the input
+    >>> arm_transform.transform_points(cloud, out=cloud) is cloud  # in place
+    True
+    >>> tcp = TransformMatrix.from_rotation_vector([0.1, 0.2, 0.3], [0, 0, np.pi / 2])  # pose of a UR controller
+    >>> chained = arm_transform.compose(tcp)  # by the quaternions
+    >>> halfway = arm_transform.interpolate(chained, 0.5)  # SLERP
+
+The rotation is kept as the Euler angles or as a quaternion, whichever was given, the other one is computed when
+it is asked. See algorithm.transfer.rotation for the batched conversions.
 """
 
+import math
+import time
 import numpy as np
+from algorithm.transfer.rotation import (matrix_to_quaternion, quaternion_to_euler, quaternion_to_rotation_vector,
+                                         rotation_vector_to_quaternion)
+
+
+# Float versions of algorithm.transfer.rotation for one transform, NumPy calls cost more than the arithmetic here
+def _euler_to_quaternion(orientation):
+    alpha, beta, gamma = (math.radians(angle) / 2 for angle in orientation)
+    ca, sa = math.cos(alpha), math.sin(alpha)
+    cb, sb = math.cos(beta), math.sin(beta)
+    cg, sg = math.cos(gamma), math.sin(gamma)
+    return (ca * cb * cg + sa * sb * sg, ca * cb * sg - sa * sb * cg,
+            ca * sb * cg + sa * cb * sg, sa * cb * cg - ca * sb * sg)
+
+
+def _quaternion_multiply(q1, q2):
+    w1, x1, y1, z1 = q1
+    w2, x2, y2, z2 = q2
+    return (w1 * w2 - x1 * x2 - y1 * y2 - z1 * z2, w1 * x2 + x1 * w2 + y1 * z2 - z1 * y2,
+            w1 * y2 - x1 * z2 + y1 * w2 + z1 * x2, w1 * z2 + x1 * y2 - y1 * x2 + z1 * w2)
+
+
+def _quaternion_rotate(quaternion, point):
+    w, x, y, z = quaternion
+    px, py, pz = point
+    tx = 2 * (y * pz - z * py)
+    ty = 2 * (z * px - x * pz)
+    tz = 2 * (x * py - y * px)
+    return px + w * tx + y * tz - z * ty, py + w * ty + z * tx - x * tz, pz + w * tz + x * ty - y * tx
+
+
+def _slerp(q0, q1, fraction):
+    dot = sum(a * b for a, b in zip(q0, q1))
+    if dot < 0:
+        q1 = tuple(-value for value in q1)
+        dot = -dot
+    if dot > 0.9995:
+        weight0, weight1 = 1 - fraction, fraction
+    else:
+        theta = math.acos(min(dot, 1.0))
+        sin_theta = math.sin(theta)
+        weight0 = math.sin((1 - fraction) * theta) / sin_theta
+        weight1 = math.sin(fraction * theta) / sin_theta
+    return _normalize(tuple(weight0 * a + weight1 * b for a, b in zip(q0, q1)))
+
+
+def _normalize(quaternion):
+    w, x, y, z = quaternion
+    norm = math.sqrt(w * w + x * x + y * y + z * z)
+    if norm == 0:
+        raise ValueError("The quaternion must not be zero")
+    return w / norm, x / norm, y / norm, z / norm
 
 
 class TransformMatrix:
-    def __init__(self, position, orientation):
+    def __init__(self, position, orientation=None, quaternion=None):
+        """
+        :param position: [x, y, z]
+        :param orientation: ZYX Euler angles in degrees [alpha, beta, gamma]
+        :param quaternion: [w, x, y, z] instead of the orientation, no rotation if both are None
+        """
         self.define_dtype = np.float64
-        self._position = np.array(position, dtype=self.define_dtype)
-        self._orientation = np.array(orientation, dtype=self.define_dtype)
+        self._position = self._read_only(position)
+        # One of them is kept, the other one is computed when it is asked
+        self._orientation = None
+        self._quaternion = None
+        if quaternion is not None:
+            self._quaternion = _normalize(quaternion if isinstance(quaternion, tuple) else
+                                          np.asarray(quaternion, dtype=self.define_dtype).tolist())
+        else:
+            self._orientation = self._read_only([0, 0, 0] if orientation is None else orientation)
+        # Cached matrices, dropped by the setters
+        self._transform_matrix = None
+        self._inverse_transform_matrix = None
+        # Views of the cached matrices, and their 12 values as floats for single points
+        self._rotation = None
+        self._translation = None
+        self._coefficients = None
+        self._inverse_rotation = None
+        self._inverse_translation = None
+        self._inverse_coefficients = None
+
+    def _read_only(self, values):
+        # An in place change of the array would not drop the cached matrices, so it is not allowed
+        array = np.array(values, dtype=self.define_dtype)
+        array.flags.writeable = False
+        return array
 
     @property
     def position(self):
@@ -58,15 +149,62 @@ class TransformMatrix:
 
     @position.setter
     def position(self, new_position):
-        self._position = np.array(new_position, dtype=self.define_dtype)
+        self._position = self._read_only(new_position)
+        self._transform_matrix = None
+        self._inverse_transform_matrix = None
 
     @property
     def orientation(self):
+        if self._orientation is None:
+            self._orientation = self._read_only(quaternion_to_euler(self._quaternion))
         return self._orientation
 
     @orientation.setter
     def orientation(self, new_orientation):
-        self._orientation = np.array(new_orientation, dtype=self.define_dtype)
+        self._orientation = self._read_only(new_orientation)
+        self._quaternion = None
+        self._transform_matrix = None
+        self._inverse_transform_matrix = None
+
+    def _get_quaternion(self) -> tuple:
+        if self._quaternion is None:
+            self._quaternion = _euler_to_quaternion(self._orientation.tolist())
+        return self._quaternion
+
+    @property
+    def quaternion(self):
+        """[w, x, y, z] of the rotation"""
+        return self._read_only(self._get_quaternion())
+
+    @quaternion.setter
+    def quaternion(self, new_quaternion):
+        self._quaternion = _normalize(np.asarray(new_quaternion, dtype=self.define_dtype).tolist())
+        self._orientation = None
+        self._transform_matrix = None
+        self._inverse_transform_matrix = None
+
+    @property
+    def rotation_vector(self):
+        """Axis * angle in radians [rx, ry, rz], as the UR controllers use"""
+        return self._read_only(quaternion_to_rotation_vector(self.quaternion))
+
+    @rotation_vector.setter
+    def rotation_vector(self, new_rotation_vector):
+        self.quaternion = rotation_vector_to_quaternion(new_rotation_vector)
+
+    @classmethod
+    def from_quaternion(cls, position, quaternion):
+        return cls(position, quaternion=quaternion)
+
+    @classmethod
+    def from_rotation_vector(cls, position, rotation_vector):
+        return cls(position, quaternion=rotation_vector_to_quaternion(rotation_vector))
+
+    @classmethod
+    def from_matrix(cls, matrix):
+        """Create an instance of a 4 x 4 rigid transform"""
+        matrix = np.asarray(matrix, dtype=np.float64)
+        return cls(matrix[:3, 3], quaternion=matrix_to_quaternion(matrix))
 
     @classmethod
     def from_dict(cls, data):
@@ -75,51 +213,174 @@ class TransformMatrix:
         orientation = data.get('orientation', [0, 0, 0])
         return cls(position, orientation)
 
+    def _matrix(self):
+        """The cached transform matrix, Rz @ Ry @ Rx written out, or of the quaternion without trig"""
+        if self._transform_matrix is None:
+            x, y, z = self._position.tolist()
+            if self._quaternion is not None:
+                qw, qx, qy, qz = self._quaternion
+                rotation = ((1 - 2 * (qy * qy + qz * qz), 2 * (qx * qy - qw * qz), 2 * (qx * qz + qw * qy)),
+                            (2 * (qx * qy + qw * qz), 1 - 2 * (qx * qx + qz * qz), 2 * (qy * qz - qw * qx)),
+                            (2 * (qx * qz - qw * qy), 2 * (qy * qz + qw * qx), 1 - 2 * (qx * qx + qy * qy)))
+            else:
+                alpha, beta, gamma = (math.radians(angle) for angle in self._orientation.tolist())
+                ca, sa = math.cos(alpha), math.sin(alpha)
+                cb, sb = math.cos(beta), math.sin(beta)
+                cg, sg = math.cos(gamma), math.sin(gamma)
+                rotation = ((ca * cb, ca * sb * sg - sa * cg, ca * sb * cg + sa * sg),
+                            (sa * cb, sa * sb * sg + ca * cg, sa * sb * cg - ca * sg),
+                            (-sb, cb * sg, cb * cg))
+            transform_matrix = np.array([rotation[0] + (x,), rotation[1] + (y,), rotation[2] + (z,),
+                                         (0, 0, 0, 1)], dtype=self.define_dtype)
+            transform_matrix.flags.writeable = False
+            self._transform_matrix = transform_matrix
+            self._rotation = transform_matrix[:3, :3]
+            self._translation = transform_matrix[:3, 3]
+            self._coefficients = tuple(transform_matrix[:3].ravel().tolist())
+        return self._transform_matrix
+
+    def _inverse_matrix(self):
+        """The cached inverse, [R^T, -R^T t] of a rigid transform, no general inverse is needed"""
+        if self._inverse_transform_matrix is None:
+            self._matrix()
+            inverse_transform_matrix = np.eye(4, dtype=self.define_dtype)
+            inverse_transform_matrix[:3, :3] = self._rotation.T
+            inverse_transform_matrix[:3, 3] = -(self._rotation.T @ self._translation)
+            inverse_transform_matrix.flags.writeable = False
+            self._inverse_transform_matrix = inverse_transform_matrix
+            self._inverse_rotation = inverse_transform_matrix[:3, :3]
+            self._inverse_translation = inverse_transform_matrix[:3, 3]
+            self._inverse_coefficients = tuple(inverse_transform_matrix[:3].ravel().tolist())
+        return self._inverse_transform_matrix
+
     def get_transform_matrix(self):
-        alpha, beta, gamma = np.radians(self._orientation)
-        Rz = np.array([[np.cos(alpha), -np.sin(alpha), 0, 0],
-                       [np.sin(alpha), np.cos(alpha), 0, 0],
-                       [0, 0, 1, 0],
-                       [0, 0, 0, 1]])
+        return self._matrix().copy()
 
-        Ry = np.array([[np.cos(beta), 0, np.sin(beta), 0],
-                       [0, 1, 0, 0],
-                       [-np.sin(beta), 0, np.cos(beta), 0],
-                       [0, 0, 0, 1]])
+    def get_inverse_transform_matrix(self):
+        return self._inverse_matrix().copy()
 
-        Rx = np.array([[1, 0, 0, 0],
-                       [0, np.cos(gamma), -np.sin(gamma), 0],
-                       [0, np.sin(gamma), np.cos(gamma), 0],
-                       [0, 0, 0, 1]])
+    def compose(self, other: "TransformMatrix") -> "TransformMatrix":
+        """self @ other, by the quaternions without 4 x 4 matrices"""
+        quaternion = self._get_quaternion()
+        x, y, z = _quaternion_rotate(quaternion, other.position.tolist())
+        x0, y0, z0 = self._position.tolist()
+        return TransformMatrix((x + x0, y + y0, z + z0),
+                               quaternion=_quaternion_multiply(quaternion, other._get_quaternion()))
 
-        translation_matrix = np.eye(4)
-        translation_matrix[:3, 3] = self._position
+    def inverse(self) -> "TransformMatrix":
+        self._inverse_matrix()
+        w, x, y, z = self._get_quaternion()
+        return TransformMatrix(self._inverse_translation, quaternion=(w, -x, -y, -z))
 
-        rotation_matrix = Rz @ Ry @ Rx
-        transform_matrix = translation_matrix @ rotation_matrix
+    def interpolate(self, other: "TransformMatrix", fraction: float) -> "TransformMatrix":
+        """Linear between the positions, SLERP between the rotations, fraction 0 is self and 1 is other"""
+        position = tuple((1 - fraction) * a + fraction * b
+                         for a, b in zip(self._position.tolist(), other.position.tolist()))
+        return TransformMatrix(position, quaternion=_slerp(self._get_quaternion(), other._get_quaternion(), fraction))
 
-        return transform_matrix
+    def _apply_point(self, coefficients, point):
+        # For one point the float arithmetic is faster than the NumPy calls
+        r00, r01, r02, x0, r10, r11, r12, y0, r20, r21, r22, z0 = coefficients
+        x, y, z = point.tolist() if isinstance(point, np.ndarray) else point
+        return np.array((r00 * x + r01 * y + r02 * z + x0,
+                         r10 * x + r11 * y + r12 * z + y0,
+                         r20 * x + r21 * y + r22 * z + z0), dtype=self.define_dtype)
 
     def transform_coordinates(self, point_a):
         # Assuming point_a is a 3D point in the form of a list or a NumPy array
-        point_a_homogeneous = np.append(np.array(point_a), 1)  # Convert to homogeneous coordinates
-        transform_matrix = self.get_transform_matrix()
-        point_b_homogeneous = transform_matrix @ point_a_homogeneous  # Transform the point
-        point_b = point_b_homogeneous[:3]  # Convert back to 3D coordinates from homogeneous coordinates
-        return point_b
+        self._matrix()
+        return self._apply_point(self._coefficients, point_a)
 
     def inverse_transform_coordinates(self, point_b):
-        transform_matrix = self.get_transform_matrix()
-        # Checking determinants to avoid singular matrices
-        if np.linalg.det(transform_matrix) == 0:
-            raise ValueError("Transform matrix is singular, cannot compute its inverse.")
-        # Calculate the condition number to assess the numerical stability of the inverse matrix
-        cond_number = np.linalg.cond(transform_matrix)
-        if cond_number > 1e12:
-            raise Warning(f"Warning: The condition number of the transform matrix is high ({cond_number}), which may "
-                          f"lead to numerical instability in the inverse transformation.")
-        inverse_transform_matrix = np.linalg.inv(transform_matrix)
-        point_b_homogeneous = np.append(np.array(point_b, dtype=self.define_dtype), 1)
-        point_a_homogeneous = inverse_transform_matrix @ point_b_homogeneous
-        point_a = point_a_homogeneous[:3]
-        return point_a
+        # A rotation matrix is never singular, its inverse is its transpose
+        self._inverse_matrix()
+        return self._apply_point(self._inverse_coefficients, point_b)
+
+    def _apply_points(self, points, rotation, translation, out, chunk_size):
+        """points @ rotation^T + translation in chunks which stay in the cache"""
+        points = np.asarray(points)
+        if points.shape[-1:] != (3,):
+            raise ValueError("The points must be (N, 3) or (3,)")
+        # float32 stays float32, others (int) become float64
+        dtype = points.dtype if np.issubdtype(points.dtype, np.floating) else self.define_dtype
+        if out is None:
+            out = np.empty(points.shape, dtype=dtype)
+        elif out.shape != points.shape:
+            raise ValueError("out must have the shape of the points")
+        rotation_t = rotation.T.astype(out.dtype)
+        flat_points = points.reshape(-1, 3)
+        flat_out = out.reshape(-1, 3)
+        if not out.flags.c_contiguous:
+            np.matmul(flat_points, rotation_t, out=flat_out)
+            flat_out += translation.astype(out.dtype)
+            return out
+        # Adding a (3,) row to (n, 3) is slow, the translation is tiled and added to the flat chunk
+        rows = min(chunk_size, len(flat_points))
+        tiled_translation = np.tile(translation.astype(out.dtype), rows)
+        values = out.reshape(-1)
+        for start in range(0, len(flat_points), chunk_size):
+            end = min(start + chunk_size, len(flat_points))
+            np.matmul(flat_points[start:end], rotation_t, out=flat_out[start:end])
+            chunk = values[3 * start:3 * end]
+            np.add(chunk, tiled_translation[:len(chunk)], out=chunk)
+        return out
+
+    def transform_points(self, points, out=None, chunk_size=0x2000):
+        """
+        Transform many points, R p + t for every row without the homogeneous copies
+        :param points: (N, 3) points (or (3,)), float32 points give float32 results
+        :param out: buffer of the same shape for the results, could be the points to transform in place
+        :param chunk_size: rows per step
+        :return: (N, 3) transformed points
+        """
+        self._matrix()
+        return self._apply_points(points, self._rotation, self._translation, out, chunk_size)
+
+    def inverse_transform_points(self, points, out=None, chunk_size=0x2000):
+        """
+        The inverse of transform_points, R^T p - R^T t for every row
+        :param points: (N, 3) points (or (3,))
+        :param out: buffer of the same shape for the results, could be the points to transform in place
+        :param chunk_size: rows per step
+        :return: (N, 3) transformed points
+        """
+        self._inverse_matrix()
+        return self._apply_points(points, self._inverse_rotation, self._inverse_translation, out, chunk_size)
+
+    @staticmethod
+    def benchmark(points_num: int = 300000):
+        """transform_coordinates per point against transform_points for a whole point cloud"""
+        np.random.seed(42)
+        arm_transform = TransformMatrix(position=[1, 2, 3], orientation=[30, 45, 60])
+        cloud = np.random.rand(points_num, 3)
+        loop_num = min(points_num, 10000)
+        for function in (arm_transform.transform_coordinates, arm_transform.inverse_transform_coordinates):
+            start_time = time.perf_counter()
+            for point in cloud[:loop_num]:
+                function(point)
+            loop_cost = (time.perf_counter() - start_time) / loop_num
+            print(f"{function.__name__}: {loop_cost * 1e9:.0f} ns/point")
+        for dtype in (np.float64, np.float32):
+            points = cloud.astype(dtype)
+            out = np.empty_like(points)
+            for name, call in (("new array", lambda: arm_transform.transform_points(points)),
+                               ("out", lambda: arm_transform.transform_points(points, out=out)),
+                               ("in place", lambda: arm_transform.transform_points(points, out=points)),
+                               ("homogeneous", lambda: (np.hstack((points, np.ones((len(points), 1), dtype))) @
+                                                        arm_transform.get_transform_matrix().T)[:, :3])):
+                call()
+                runs = 20
+                start_time = time.perf_counter()
+                for _ in range(runs):
+                    result = call()
+                cost = (time.perf_counter() - start_time) / runs
+                print(f"{np.dtype(dtype).name} {name}: {cost * 1e3:.2f} ms per cloud, "
+                      f"{cost / points_num * 1e9:.2f} ns/point, {2 * points.nbytes / cost / 1e9:.2f} GB/s read + write, "
+                      f"result {result.dtype}")
+        check = arm_transform.transform_points(cloud[:100])
+        expected = np.array([arm_transform.transform_coordinates(point) for point in cloud[:100]])
+        print(f"max diff to transform_coordinates: {np.max(np.abs(check - expected)):.2e}")
+
+
+if __name__ == "__main__":
+    TransformMatrix.benchmark()
@@ -0,0 +1,304 @@
+"""
+Tree of named frames, e.g. world -> base -> link1 ... link6 -> tool -> camera.
+
+Every frame has its transform in the parent frame. The transform of a frame in the root frame is cached, a new
+transform of a frame marks its subtree dirty and only the dirty frames on the path of a lookup are recomputed, from
+the nearest clean ancestor down. The lookups of a (target, source) pair are cached too and checked by the versions of
+the two root transforms, so a lookup of an unchanged chain costs two dictionary reads.
+
+A frame could also keep the stamped transforms it had (e.g. joint states with their time), a lookup at a time between
+two of them interpolates them (positions linearly, rotations by SLERP), like the buffers of ROS tf2.
+
+Example:
+    >>> tree = TransformTree("world")
+    >>> tree.set_transform("base", "world", TransformMatrix([0, 0, 0.5], [0, 0, 0]))
+    >>> tree.set_transform("tool", "base", TransformMatrix([0.3, 0, 0.2], [90, 0, 0]))
+    >>> matrix = tree.lookup_matrix("world", "tool")  # maps points in tool to world
+    >>> print(np.round(matrix[:3, 3], 3))
+    [0.3 0.  0.7]
+    >>> tree.set_transform("tool", "base", TransformMatrix([0.3, 0, 0.2], [90, 0, 0]), stamp=0.0)
+    >>> tree.set_transform("tool", "base", TransformMatrix([0.3, 0, 0.25], [90, 0, 0]), stamp=1.0)
+    >>> halfway = tree.lookup("world", "tool", stamp=0.5)  # between the two stamped transforms
+    >>> print(np.round(halfway.position, 3))
+    [0.3   0.    0.725]
+"""
+
+import time
+from bisect import bisect_left
+from typing import Dict, List, Tuple
+import numpy as np
+from algorithm.transfer.transform_matrix import TransformMatrix
+
+
+def _rigid_inverse(matrix):
+    inverse = np.eye(4)
+    rotation_t = matrix[:3, :3].T
+    inverse[:3, :3] = rotation_t
+    inverse[:3, 3] = -(rotation_t @ matrix[:3, 3])
+    return inverse
+
+
+class _Frame:
+    __slots__ = ("name", "parent", "children", "transform", "local", "to_root", "dirty", "root_version", "depth",
+                 "stamps", "buffer")
+
+    def __init__(self, name: str, parent):
+        self.name = name
+        self.parent = parent
+        self.children = []
+        # Transform in the parent frame, and its 4 x 4 matrix
+        self.transform = None
+        self.local = np.eye(4)
+        self.to_root = np.eye(4)
+        self.dirty = True
+        # Changed when to_root is recomputed
+        self.root_version = 0
+        self.depth = 0 if parent is None else parent.depth + 1
+        # Stamped transforms, sorted by the stamps
+        self.stamps: List[float] = []
+        self.buffer: List[TransformMatrix] = []
+
+
+class TransformTree:
+    def __init__(self, root: str = "world", buffer_length: int = 100):
+        """
+        :param root: name of the root frame
+        :param buffer_length: stamped transforms kept per frame
+        """
+        self._root = _Frame(root, None)
+        self._root.dirty = False
+        self._frames: Dict[str, _Frame] = {root: self._root}
+        self._buffer_length = buffer_length
+        # (target, source) -> (target root version, source root version, matrix)
+        self._lookups: Dict[Tuple[str, str], tuple] = {}
+        # Frames recomputed since the tree was created
+        self.recompute_count = 0
+
+    def __len__(self):
+        return len(self._frames)
+
+    def __contains__(self, frame):
+        return frame in self._frames
+
+    @property
+    def root(self) -> str:
+        return self._root.name
+
+    def parent(self, frame: str) -> str | None:
+        parent = self._frames[frame].parent
+        return None if parent is None else parent.name
+
+    def chain(self, frame: str) -> List[str]:
+        """Frames from the root to the frame"""
+        node = self._frames[frame]
+        names = []
+        while node is not None:
+            names.append(node.name)
+            node = node.parent
+        return names[::-1]
+
+    def set_transform(self, frame: str, parent: str, transform, stamp: float = None) -> None:
+        """
+        Add the frame or give it a new transform (or a new parent)
+        :param frame: name of the frame
+        :param parent: name of the parent frame, it must exist
+        :param transform: TransformMatrix or 4 x 4 matrix of the frame in the parent frame
+        :param stamp: time of the transform, it is also kept in the buffer of the frame for the stamped lookups
+        """
+        if parent not in self._frames:
+            raise KeyError(f"The parent frame {parent} does not exist")
+        if not isinstance(transform, TransformMatrix):
+            transform = TransformMatrix.from_matrix(transform)
+        parent_node = self._frames[parent]
+        node = self._frames.get(frame)
+        if node is None:
+            node = _Frame(frame, parent_node)
+            parent_node.children.append(node)
+            self._frames[frame] = node
+        elif node is self._root:
+            raise ValueError("The root frame has no parent")
+        elif node.parent is not parent_node:
+            ancestor = parent_node
+            while ancestor is not None:
+                if ancestor is node:
+                    raise ValueError(f"{parent} is under {frame}, the tree would have a loop")
+                ancestor = ancestor.parent
+            node.parent.children.remove(node)
+            parent_node.children.append(node)
+            node.parent = parent_node
+            self._set_depth(node)
+        if stamp is not None:
+            self._insert_stamped(node, stamp, transform)
+            # A late stamped transform does not replace the newest one
+            transform = node.buffer[-1]
+        node.transform = transform
+        node.local = transform.get_transform_matrix()
+        self._invalidate(node)
+
+    def remove_frame(self, frame: str) -> None:
+        """Remove the frame and its subtree"""
+        node = self._frames[frame]
+        if node is self._root:
+            raise ValueError("The root frame could not be removed")
+        node.parent.children.remove(node)
+        stack = [node]
+        while stack:
+            node = stack.pop()
+            del self._frames[node.name]
+            stack.extend(node.children)
+        self._lookups = {key: value for key, value in self._lookups.items()
+                         if key[0] in self._frames and key[1] in self._frames}
+
+    @staticmethod
+    def _set_depth(node: _Frame) -> None:
+        stack = [node]
+        while stack:
+            node = stack.pop()
+            node.depth = node.parent.depth + 1
+            stack.extend(node.children)
+
+    def _insert_stamped(self, node: _Frame, stamp: float, transform: TransformMatrix) -> None:
+        if not node.stamps or stamp > node.stamps[-1]:
+            node.stamps.append(stamp)
+            node.buffer.append(transform)
+        else:
+            index = bisect_left(node.stamps, stamp)
+            if index < len(node.stamps) and node.stamps[index] == stamp:
+                node.buffer[index] = transform
+            else:
+                node.stamps.insert(index, stamp)
+                node.buffer.insert(index, transform)
+        if len(node.stamps) > self._buffer_length:
+            del node.stamps[0]
+            del node.buffer[0]
+
+    @staticmethod
+    def _invalidate(node: _Frame) -> None:
+        # A dirty frame has only dirty frames under it, so the subtree of a dirty frame is skipped
+        node.dirty = True
+        stack = list(node.children)
+        while stack:
+            node = stack.pop()
+            if not node.dirty:
+                node.dirty = True
+                stack.extend(node.children)
+
+    def _to_root(self, node: _Frame):
+        """Transform of the frame in the root frame, the dirty frames from the nearest clean ancestor are recomputed"""
+        if not node.dirty:
+            return node.to_root
+        path = []
+        while node.dirty:
+            path.append(node)
+            node = node.parent
+        for node in reversed(path):
+            node.to_root = node.parent.to_root @ node.local
+            node.dirty = False
+            node.root_version += 1
+        self.recompute_count += len(path)
+        return node.to_root
+
+    def lookup_matrix(self, target: str, source: str, stamp: float = None):
+        """
+        4 x 4 transform which maps points in the source frame to the target frame, read only
+        :param stamp: interpolate the buffered transforms of the frames at this time, the frames without a buffer use
+        their transform
+        """
+        target_node = self._frames[target]
+        source_node = self._frames[source]
+        if stamp is not None:
+            return self._lookup_stamped(target_node, source_node, stamp)
+        target_to_root = self._to_root(target_node)
+        source_to_root = self._to_root(source_node)
+        key = (target, source)
+        cached = self._lookups.get(key)
+        if cached is not None and cached[0] == target_node.root_version and cached[1] == source_node.root_version:
+            return cached[2]
+        matrix = _rigid_inverse(target_to_root) @ source_to_root
+        matrix.flags.writeable = False
+        self._lookups[key] = (target_node.root_version, source_node.root_version, matrix)
+        return matrix
+
+    def lookup(self, target: str, source: str, stamp: float = None) -> TransformMatrix:
+        """TransformMatrix of the source frame in the target frame, see lookup_matrix"""
+        return TransformMatrix.from_matrix(self.lookup_matrix(target, source, stamp))
+
+    def transform_points(self, target: str, source: str, points, stamp: float = None, out=None):
+        """(N, 3) points in the source frame to the target frame, see TransformMatrix.transform_points"""
+        matrix = self.lookup_matrix(target, source, stamp)
+        return TransformMatrix.from_matrix(matrix).transform_points(points, out=out)
+
+    def _transform_at(self, node: _Frame, stamp: float):
+        if not node.stamps:
+            return node.local
+        stamps = node.stamps
+        index = bisect_left(stamps, stamp)
+        if index < len(stamps) and stamps[index] == stamp:
+            return node.buffer[index].get_transform_matrix()
+        if index == 0 or index == len(stamps):
+            raise ValueError(f"The stamp {stamp} of the frame {node.name} is out of [{stamps[0]}, {stamps[-1]}]")
+        fraction = (stamp - stamps[index - 1]) / (stamps[index] - stamps[index - 1])
+        return node.buffer[index - 1].interpolate(node.buffer[index], fraction).get_transform_matrix()
+
+    def _lookup_stamped(self, target_node: _Frame, source_node: _Frame, stamp: float):
+        # Only the chains up to the common ancestor are interpolated and multiplied
+        target_chain = np.eye(4)
+        source_chain = np.eye(4)
+        while target_node is not source_node:
+            if target_node.depth >= source_node.depth:
+                target_chain = self._transform_at(target_node, stamp) @ target_chain
+                target_node = target_node.parent
+            else:
+                source_chain = self._transform_at(source_node, stamp) @ source_chain
+                source_node = source_node.parent
+        matrix = _rigid_inverse(target_chain) @ source_chain
+        matrix.flags.writeable = False
+        return matrix
+
+    @staticmethod
+    def benchmark(links_num: int = 6, lookups_num: int = 10000):
+        """Lookups of the camera in the world frame against the chain composed by hand"""
+        np.random.seed(42)
+        names = ["base"] + [f"link{i + 1}" for i in range(links_num)] + ["tool", "camera"]
+        transforms = [TransformMatrix(np.random.rand(3), np.random.uniform(-180, 180, 3)) for _ in names]
+        tree = TransformTree("world")
+        parent = "world"
+        for name, transform in zip(names, transforms):
+            tree.set_transform(name, parent, transform)
+            parent = name
+
+        start_time = time.perf_counter()
+        for _ in range(lookups_num):
+            matrix = np.eye(4)
+            for transform in transforms:
+                matrix = matrix @ transform.get_transform_matrix()
+        hand_cost = (time.perf_counter() - start_time) / lookups_num
+        tree_matrix = tree.lookup_matrix("world", "camera")
+        print(f"{len(names)} frames, by hand: {hand_cost * 1e6:.2f} us/lookup, "
+              f"max diff {np.max(np.abs(matrix - tree_matrix)):.2e}")
+
+        start_time = time.perf_counter()
+        for _ in range(lookups_num):
+            tree.lookup_matrix("world", "camera")
+        print(f"unchanged tree: {(time.perf_counter() - start_time) / lookups_num * 1e6:.2f} us/lookup")
+
+        for moved in ("link1", f"link{links_num}"):
+            recompute_count = tree.recompute_count
+            start_time = time.perf_counter()
+            for i in range(lookups_num):
+                tree.set_transform(moved, tree.parent(moved), TransformMatrix([0, 0, 0.1], [i % 360, 0, 0]))
+                tree.lookup_matrix("world", "camera")
+            cost = (time.perf_counter() - start_time) / lookups_num
+            print(f"{moved} moves before every lookup: {cost * 1e6:.2f} us/update + lookup, "
+                  f"{(tree.recompute_count - recompute_count) / lookups_num:.0f} frames recomputed")
+
+        for i in range(10):
+            tree.set_transform("link1", "base", TransformMatrix([0, 0, 0.1], [i * 10, 0, 0]), stamp=float(i))
+        start_time = time.perf_counter()
+        for i in range(lookups_num // 10):
+            tree.lookup_matrix("world", "camera", stamp=(i % 90) / 10)
+        print(f"stamped: {(time.perf_counter() - start_time) / (lookups_num // 10) * 1e6:.2f} us/lookup")
+
+
+if __name__ == "__main__":
+    TransformTree.benchmark()
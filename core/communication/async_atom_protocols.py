@@ -0,0 +1,316 @@
+"""
+asyncio front-end of the AtomProtocols (SPP).
+
+The link runs on asyncio streams, so one event loop serves many links: every link has one reading task and one
+resending task which sleeps until some request waits for its reply, no thread per direction. The encoding, the
+decoding and the reply window are the ones of AtomProtocols (SppProtocolMixin), only the I/O is here.
+
+Example:
+    link = await AsyncAtomProtocols.open_connection("192.168.1.2", 30002)
+    await link.send([0x01, 0x02], b"data")
+    reply = await link.request([0x01, 0x03], b"data")
+    async for uuid, message in link:
+        await link.reply(uuid, message)
+"""
+
+import asyncio
+import logging
+from typing import List, Tuple
+from communication.frame_parser import FrameStreamParser
+from communication.spp_protocol import SppProtocolMixin
+from communication.protocol_status import ProtocolStatus
+
+# DecodeErrorType value -> name, for the log
+_DECODE_ERROR_NAMES = {value: name for name, value in vars(ProtocolStatus.DecodeErrorType).items()
+                       if not name.startswith("_")}
+
+
+class AsyncAtomProtocols(SppProtocolMixin):
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter,
+                 header: Tuple[int] = (0xE5, 0x5E, 0xF2, 0x2F),
+                 package_length: int = 1024,
+                 function: ProtocolStatus.Functions = ProtocolStatus.Functions.SPP,
+                 authentication_info: str = "atom_default",
+                 reply_window: int = 0x40,
+                 reply_timeout: float = 1.0,
+                 reply_retries: int = 3,
+                 read_size: int = 0x10000):
+        """
+        :param reader: stream of the received data, e.g. from asyncio.open_connection
+        :param writer: stream of the send data
+        :param header: default is (0xE5, 0x5E, 0xF2, 0x2F)
+        :param package_length: default package length per send
+        :param function: only SPP is supported
+        :param authentication_info: This info should be same in receiver and sender
+        :param reply_window: max requests waiting for the reply
+        :param reply_timeout: seconds to wait for the reply before the request is resent
+        :param reply_retries: resend times (with backoff) before the request fails with TimeoutError
+        :param read_size: max bytes read from the stream at once
+        """
+        self.logger = logging.getLogger(self.__class__.__name__)
+        if function is not ProtocolStatus.Functions.SPP:
+            raise ValueError("Only the SPP function is supported")
+        self._reader = reader
+        self._writer = writer
+        self._reply_timeout = reply_timeout
+        self._reply_retries = reply_retries
+        self._read_size = read_size
+        self._init_spp(header, package_length, function, authentication_info, reply_window, reply_timeout,
+                       reply_retries)
+        self._authentication_future: asyncio.Future | None = None
+
+        # Sender
+        self._reply_slots = asyncio.Semaphore(reply_window)
+        self._reply_waiting = asyncio.Event()
+
+        # Receiver
+        self._frame_parser = FrameStreamParser(self._codec)
+        self._message_ready = asyncio.Event()
+
+        self._tasks: List[asyncio.Task] = []
+        self._closed = False
+
+    @classmethod
+    async def open_connection(cls, host: str, port: int, **kwargs) -> "AsyncAtomProtocols":
+        """Connect by TCP and start the link, kwargs go to the constructor"""
+        reader, writer = await asyncio.open_connection(host, port)
+        protocols = cls(reader, writer, **kwargs)
+        protocols.start()
+        return protocols
+
+    async def __aenter__(self):
+        self.start()
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.close()
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self) -> Tuple[int, dict]:
+        """
+        Next completed message, it ends when the link is closed
+        :return: (uuid, {"seq", "cmd", "data", "total_package", "total_data"})
+        """
+        while True:
+            ready = self._decode_data_stack.get()
+            if ready is not None:
+                return ready[0], self._to_user_message(ready[1])
+            if self._closed:
+                raise StopAsyncIteration
+            self._message_ready.clear()
+            await self._message_ready.wait()
+
+    @property
+    def closed(self) -> bool:
+        return self._closed
+
+    def start(self) -> None:
+        """Start the reading and resending tasks in the running loop"""
+        if self._tasks:
+            return None
+        self._tasks = [asyncio.create_task(self._task_decode_receiving()),
+                       asyncio.create_task(self._task_resending())]
+
+    async def close(self) -> None:
+        """Stop the tasks, fail the waiting requests and close the stream"""
+        if self._closed and not self._tasks:
+            return None
+        self._set_closed()
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        self._writer.close()
+        try:
+            await self._writer.wait_closed()
+        except ConnectionError:
+            pass
+
+    def _set_closed(self) -> None:
+        self._closed = True
+        self._reply_data_stack.cancel_all()
+        if self._authentication_future is not None and not self._authentication_future.done():
+            self._authentication_future.cancel()
+        self._message_ready.set()
+
+    @staticmethod
+    def _to_user_message(message: dict) -> dict:
+        return {"seq": bytes(message["seq"]),
+                "cmd": bytes(message["cmd"]),
+                "data": message["data"],
+                "total_package": message["total_package"],
+                "total_data": message["total_data"]}
+
+    #########################################
+    # Sender
+    def _write(self, datas: List[memoryview]) -> None:
+        if not self._closed:
+            self._writer.writelines(datas)
+
+    def _send_boosted(self, datas: List[memoryview], block: bool) -> None:
+        # The stream buffers the frames, the writer never blocks
+        self._write(datas)
+
+    def _on_authentication_reply(self) -> None:
+        if self._authentication_future is not None and not self._authentication_future.done():
+            self._authentication_future.set_result(self._authentication_status_sender)
+
+    async def authenticate(self) -> bool:
+        """
+        Send the authentication until the receiver replies or the retries run out
+        Concurrent callers share one authentication
+        :return: authentication status of the sender
+        """
+        if self._authentication_status_sender:
+            return True
+        if self._authentication_future is not None and not self._authentication_future.done():
+            return await asyncio.shield(self._authentication_future)
+        self._authentication_future = asyncio.get_running_loop().create_future()
+        datas = self._encode_authentication()
+        for _ in range(self._reply_retries + 1):
+            self._write(datas)
+            try:
+                return await asyncio.wait_for(asyncio.shield(self._authentication_future), self._reply_timeout)
+            except asyncio.TimeoutError:
+                self.logger.debug("No reply of the authentication, resend it")
+        self._authentication_future.set_result(False)
+        self.logger.warning("Fail to authenticate")
+        return False
+
+    async def send(self, cmd, data, send_seq_user_cmd: int = 0x00) -> int:
+        """
+        Send the data with send_need_none_feedback, waits while the stream buffer is full
+        :param cmd: 2 bytes
+        :param data: bytes-like or List[int]
+        :param send_seq_user_cmd: send_ways and seq
+        :return: ProtocolStatus.p_ture / ProtocolStatus.p_false (not authenticated or closed)
+        """
+        if self._closed or not await self.authenticate():
+            return ProtocolStatus.p_false
+        datas = self._encode_data(cmd, data, ProtocolStatus.Direction.send_need_none_feedback, send_seq_user_cmd)
+        self._write(datas)
+        await self._writer.drain()
+        return ProtocolStatus.p_ture
+
+    async def request(self, cmd, data, send_seq_user_cmd: int = 0x00) -> dict | None:
+        """
+        Send the data with send_need_sync_feedback and wait for the reply
+        At most reply_window requests wait for the reply, the others wait here for a free place
+        :param cmd: 2 bytes
+        :param data: bytes-like or List[int]
+        :param send_seq_user_cmd: send_ways and seq
+        :return: the reply {"seq", "cmd", "data", "total_package", "total_data"}, None if not authenticated, closed or
+        the reply window is full. TimeoutError is raised when there is no reply after the retries
+        """
+        if self._closed or not await self.authenticate():
+            return None
+        async with self._reply_slots:
+            if self._closed:
+                return None
+            # The semaphore and the window have the same size, checked anyway so a full window is never over-committed
+            if not self._reply_data_stack.acquire(block=False):
+                self.logger.warning("The reply window is full, drop the request")
+                return None
+            uuid, datas, future = self._encode_request(cmd, data, send_seq_user_cmd)
+            try:
+                self._reply_waiting.set()
+                self._write(datas)
+                await self._writer.drain()
+                return await asyncio.wrap_future(future)
+            except asyncio.CancelledError:
+                if self._closed:
+                    return None
+                raise
+            finally:
+                # Cancelled (e.g. by wait_for) or failed to write: the uuid leaves the window with the semaphore slot,
+                # otherwise it is resent and holds its place. No-op when the reply or the TimeoutError already came
+                self._reply_data_stack.complete(uuid, None)
+
+    async def reply(self, uuid: int, message: dict) -> int:
+        """
+        Reply a received message
+        :param uuid: uuid of the received message
+        :param message: the message from the async iterator with the reply data, {"seq", "cmd", "data"}
+        :return: ProtocolStatus.p_ture / ProtocolStatus.p_false (closed)
+        """
+        datas = self._encode_reply(uuid, message["seq"], message["cmd"], message["data"])
+        if self._closed:
+            return ProtocolStatus.p_false
+        self._write(datas)
+        await self._writer.drain()
+        return ProtocolStatus.p_ture
+
+    async def _task_resending(self):
+        try:
+            while True:
+                timeout = self._reply_data_stack.next_timeout()
+                if timeout is None:
+                    # Sleep until a request is sent
+                    self._reply_waiting.clear()
+                    await self._reply_waiting.wait()
+                    continue
+                await asyncio.sleep(timeout)
+                for uuid, datas in self._reply_data_stack.expire():
+                    self.logger.debug(f"No reply of {uuid}, resend it")
+                    self._write(datas)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            self.logger.exception("An exception occurred" + str(e))
+
+    #########################################
+    # Receiver
+    async def _task_decode_receiving(self):
+        try:
+            while True:
+                chunk = await self._reader.read(self._read_size)
+                if not chunk:
+                    self.logger.info("The stream is closed by the peer")
+                    break
+                for frame in self._frame_parser.feed(chunk):
+                    error = self._decode_spp(frame)
+                    if error != ProtocolStatus.DecodeErrorType.no_error:
+                        self.logger.warning(_DECODE_ERROR_NAMES.get(error, error))
+                if self._decode_data_stack.ready_length:
+                    self._message_ready.set()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            self.logger.exception("An exception occurred" + str(e))
+        finally:
+            self._set_closed()
+
+    @staticmethod
+    async def demo(links_num: int = 4, requests_num: int = 100):
+        """Serve several links on one loop, every server side link echoes the requests"""
+        served = []
+
+        async def serve(reader, writer):
+            served.append(asyncio.current_task())
+            async with AsyncAtomProtocols(reader, writer) as link:
+                async for uuid, message in link:
+                    await link.reply(uuid, message)
+
+        server = await asyncio.start_server(serve, "127.0.0.1", 0)
+        port = server.sockets[0].getsockname()[1]
+        links = [await AsyncAtomProtocols.open_connection("127.0.0.1", port) for _ in range(links_num)]
+        loop = asyncio.get_running_loop()
+        start_time = loop.time()
+        replies = await asyncio.gather(*(link.request([0x01, 0x02], bytes(range(256)) * 8)
+                                         for link in links for _ in range(requests_num)))
+        cost = loop.time() - start_time
+        print(f"links: {links_num}, requests: {len(replies)}, "
+              f"all echoed: {all(reply['data'] == bytes(range(256)) * 8 for reply in replies)}, "
+              f"per request: {cost / len(replies) * 1e6:.1f} us")
+        for link in links:
+            await link.close()
+        # The server side links end when they read the end of the stream
+        await asyncio.gather(*served)
+        server.close()
+        await server.wait_closed()
+
+
+if __name__ == "__main__":
+    asyncio.run(AsyncAtomProtocols.demo())
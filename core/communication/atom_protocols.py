@@ -7,18 +7,20 @@
 # @Software: PyCharm
 # @Blog ：https://github.com/alfredzhang98
 
-import math
 import logging
-import time
-import numpy as np
-from enum import Enum, auto
+import selectors
+import socket
 from threading import Thread, Event
-from typing import List, Tuple, Callable, Dict
-from crccheck.crc import Crc16
+from typing import List, Tuple, Callable
+from queue import Full, Empty
+from concurrent.futures import Future
 from utils.type_switch import TypeSwitch
-from utils.locker import singletonDecorator
+from communication.frame_queue import FrameQueue
+from communication.frame_codec import calculate_crc16
+from communication.frame_parser import FrameStreamParser
+from communication.spp_protocol import SppProtocolMixin
+from communication.protocol_status import ProtocolStatus
 import threading
-from AtomEncryption import atom_Hash
 
 '''
 See this guide: https://alfredzhang98.notion.site/1ebabd414334452586bec7ad4c06f983?pvs=4
@@ -30,60 +32,12 @@ logging.basicConfig(level=logging.INFO,
                     format='%(asctime)s - %(levelname)s - %(name)s - %(message)s')
 
 
-class ProtocolStatus:
-    p_ture = 1
-    p_false = 0
-    p_error = -1
-
-    class DecodeErrorType:
-        no_error = 0
-        header_error = -1
-        seq_error = -2
-        uuid_error = -3
-        package_num_error = -4
-        data_num_per_error = -5
-        vpp_error = -6  # crc16
-        cmd_error = -7
-
-    class Functions(Enum):
-        SPP = 0x10
-        STEAM = 0x20
-        RADIO = 0x30
-        VIDEO = 0x40
-
-    class Direction:
-        send_start = 0x00
-        send_end = 0x7F
-        send_need_none_feedback = 0x00
-        send_need_sync_feedback = 0x10
-        receive_start = 0x80
-        receive_end = 0xFF
-
-    class SeqSysCMD:
-        class SPP(Enum):
-            send_cmd_None = auto()
-            send_authentication = auto()
-            send_total_info = auto()
-            send_lost_package = auto()
-            send_wrong_data = auto()
-
-    class ProtocolsLength:
-        header_length = 4
-        seq_length = 2
-        uuid_length = 2
-        package_num_length = 4
-        data_num_per_package_length = 2
-        vpp_length = 2  # crc16
-        cmd_length = 2
-        total_crc_length = header_length + seq_length + uuid_length + package_num_length + data_num_per_package_length + vpp_length
-        total_length = header_length + seq_length + uuid_length + package_num_length + data_num_per_package_length + vpp_length + cmd_length
-
-
-@singletonDecorator
-class AtomProtocols:
+class AtomProtocols(SppProtocolMixin):
     """
     SPP:
         SPP Decode:
+    Every instance is an independent link, use communication.link_manager.AtomLinkManager to run many of them
+    The SPP encoding and decoding are in SppProtocolMixin, this class runs them on threads
     """
 
     def __init__(self, send_interface: Callable[[List[int], int], bool],
@@ -91,7 +45,14 @@ class AtomProtocols:
                  header: Tuple[int] = (0xE5, 0x5E, 0xF2, 0x2F),
                  package_length: int = 1024,
                  function: ProtocolStatus.Functions = ProtocolStatus.Functions.SPP,
-                 authentication_info: str = "atom_default"):
+                 authentication_info: str = "atom_default",
+                 receive_mode: ProtocolStatus.ReceiveMode = ProtocolStatus.ReceiveMode.POLL,
+                 receive_fileno=None,
+                 byte_interface: bool = False,
+                 reply_window: int = 0x40,
+                 reply_timeout: float = 1.0,
+                 reply_retries: int = 3,
+                 worker_pool=None):
         """
         :param header: default is (0xE5, 0x5E, 0xF2, 0x2F)
         :param package_length: default package length per send
@@ -99,77 +60,88 @@ class AtomProtocols:
         :param authentication_info: This info should be same in receiver and sender
         :param send_interface: Must put in by user Callable[[List[int], int], int] input: Data and Data_len Return: Int
         :param receive_interface: Must put in by user Callable[] input: Data and Data_len Return: Int
+        Could be None in the PUSH receive mode
+        :param receive_mode: POLL / PUSH (call feed_data) / SELECT (wait on receive_fileno)
+        :param receive_fileno: file descriptor or object with fileno() of the transport, SELECT mode only
+        :param byte_interface: the interfaces use bytes-like data instead of List[int], the decoded data is kept
+        as bytearray, this skips the List[int] conversion on both sides
+        :param reply_window: max send_need_sync_feedback messages waiting for the reply
+        :param reply_timeout: seconds to wait for the reply before the message is resent
+        :param reply_retries: resend times (with backoff) before the message fails with TimeoutError
+        :param worker_pool: communication.link_manager.LinkWorkerPool, it drives the sending and receiving of this
+        link instead of the own threads
         """
         # Logger
         self.logger = self.logger = logging.getLogger(self.__class__.__name__)
 
-        if send_interface is None or receive_interface is None:
+        if send_interface is None or (receive_interface is None and
+                                      receive_mode is not ProtocolStatus.ReceiveMode.PUSH):
             raise ValueError("Please input your own send and receive interface")
+        if receive_mode is ProtocolStatus.ReceiveMode.SELECT and receive_fileno is None:
+            raise ValueError("Please input the receive_fileno for the SELECT receive mode")
         self._send_callable = send_interface
         self._receive_callable = receive_interface
-        self._header = header
-        self._package_length = package_length
-        self._function = function
-        self._authentication_info = authentication_info
-
-        # Flags
-        self._authentication_status_sender = False
-        self._authentication_status_receiver = False
-
-        # Common
-        self._package_split_num = package_length - ProtocolStatus.ProtocolsLength.total_length
+        self._receive_mode = receive_mode
+        self._receive_fileno = receive_fileno
+        self._byte_interface = byte_interface
+        self._worker_pool = worker_pool
+        self._init_spp(header, package_length, function, authentication_info, reply_window, reply_timeout,
+                       reply_retries)
         self._send_seq_sys_cmd = ProtocolStatus.SeqSysCMD.SPP.send_cmd_None
 
         # Sender
-        # This stack is used for store encoded send data
-        self._encode_data_stack: List[List[int]] = []
+        # This queue is used for store encoded send data, producers block (or fail fast) when it is full
         self._max_encode_data_stack_length = 0xFF
-        # This stack is used for store the send data with uuid those data need a reply
-        # When a reply come please del the uuid
-        self._reply_data_stack: Dict[int, Dict[str, List[int]]] = {}
-        self._max_reply_data_stack_length = 0xFFFF
-        self._package_uuid = 0x00
+        self._encode_data_stack = FrameQueue(self._max_encode_data_stack_length,
+                                             on_put=None if worker_pool is None else
+                                             lambda: worker_pool.notify_send(self))
         # This is a thread for send data
         self._thread_sending = False
         self._u_thread_sending_stop_event = threading.Event()
         self._u_thread_sending = threading.Thread(target=self._thread_encode_sending,
                                                   args=(self._u_thread_sending_stop_event,))
         self.init_sending_thread()
-        time.sleep(1)
         # Receiver
-        self._last_package_num = 0x00
-        self._decode_data_stack: Dict[int, Dict[str, List[int]]] = {}
-        self._max_decode_data_stack_length = 0xFFFF
+        # The transport could give part of a frame or several frames in one read
+        self._frame_parser = FrameStreamParser(self._codec)
+        # feed_data could be called from any transport thread
+        self._decode_lock = threading.Lock()
         self._thread_receiving = False
         self._u_thread_receiving_stop_event = threading.Event()
-        self._u_thread_receiving = threading.Thread(target=self._thread_decode_receiving,
+        match self._receive_mode:
+            case ProtocolStatus.ReceiveMode.SELECT if worker_pool is None:
+                # The socket pair wakes the selector when the thread should stop
+                self._receive_wakeup_r, self._receive_wakeup_w = socket.socketpair()
+                receiving_target = self._thread_select_receiving
+            case _:
+                receiving_target = self._thread_decode_receiving
+        self._u_thread_receiving = threading.Thread(target=receiving_target,
                                                     args=(self._u_thread_receiving_stop_event,))
 
         self.init_receiving_thread()
 
     @property
-    def package_length(self):
-        return self._package_length
-
-    @package_length.setter
-    def package_length(self, value):
-        self._package_length = value
-
-    @property
-    def reply_data_stack(self):
-        return self._reply_data_stack
-
-    @property
-    def decode_data_stack(self):
-        return self._decode_data_stack
+    def receive_mode(self) -> ProtocolStatus.ReceiveMode:
+        return self._receive_mode
 
     @property
-    def function(self):
-        return self._function
+    def receive_fileno(self):
+        return self._receive_fileno
 
     @staticmethod
     def calculate_crc16(data: List[int]):
-        return TypeSwitch.int_to_int_list(Crc16.calc(data))
+        return TypeSwitch.int_to_int_list(calculate_crc16(bytes(data)), 2)
+
+    def _to_user_data(self, data) -> List[int] | bytearray:
+        # Compatibility adapter between the byte buffers and the List[int] interfaces
+        if self._byte_interface:
+            return bytearray(data)
+        return list(data)
+
+    def _send_frame(self, frame: memoryview):
+        if self._byte_interface:
+            return self._send_callable(frame, len(frame))
+        return self._send_callable(frame.tolist(), len(frame))
 
     #########################################
     # Sender
@@ -181,6 +153,9 @@ class AtomProtocols:
         match self._function.value:
             case ProtocolStatus.Functions.SPP.value:
                 self._thread_sending = True
+                if self._worker_pool is not None:
+                    self._worker_pool.register_sender(self)
+                    return None
                 self._u_thread_sending.start()
                 self.logger.info("You start the sending thread")
                 return None
@@ -196,9 +171,17 @@ class AtomProtocols:
         """
         match self._function.value:
             case ProtocolStatus.Functions.SPP.value:
+                if not self._thread_sending:
+                    return None
                 self._thread_sending = False
                 self._u_thread_sending_stop_event.set()
-                self._u_thread_sending.join()
+                # Wake the sending thread which is blocked on the empty queue
+                self._encode_data_stack.close()
+                if self._worker_pool is not None:
+                    self._worker_pool.unregister_sender(self)
+                else:
+                    self._u_thread_sending.join()
+                self._reply_data_stack.cancel_all()
                 self.logger.info("You stop the sending thread")
                 return None
             case ProtocolStatus.Functions.STEAM.value:
@@ -209,124 +192,139 @@ class AtomProtocols:
     def _thread_encode_sending(self, stop_event):
         try:
             while not stop_event.is_set():
-                if self._encode_data_stack:
-                    data = self._encode_data_stack.pop(0)
-                    self._send_callable(data, len(data))
-                else:
-                    pass
+                # Block until there is data, None means the queue is closed
+                # Wake up by the timer wheel tick only when some messages wait for the reply
+                try:
+                    data = self._encode_data_stack.get(timeout=self._reply_data_stack.next_timeout())
+                except Empty:
+                    data = False
+                if data is None:
+                    break
+                if data:
+                    self._send_frame(data)
+                self._resend_expired()
         except Exception as e:
             self.logger.exception("An exception occurred" + str(e))
 
-    def _insert_send(self, data: List[int], boost: bool = False):
-        while len(self._encode_data_stack) > self._max_encode_data_stack_length:
-            self._encode_data_stack.pop(0)
-        if boost:
-            self._encode_data_stack.insert(0, data)
-        else:
-            self._encode_data_stack.append(data)
-
-    def _encode_basic(self, seq: List[int], cmd: List[int], data: List[int], uuid: int = None) -> List[List[int]]:
-        full_data_list = []
-        package_count = 0
-        # UUID insert in the reply stack
-        if uuid is not None:
-            uuid_temp = uuid
-        else:
-            if self._package_uuid >= self._max_reply_data_stack_length:
-                self._package_uuid = 0x00
-            self._package_uuid = self._package_uuid + 1
-            uuid_temp = self._package_uuid
-        if (seq[0] & 0xF0) in [ProtocolStatus.Direction.send_need_sync_feedback]:
-            self._reply_data_stack[self._package_uuid] = {"seq": seq, "cmd": cmd, "data": data}
-        for i in range(0, len(data), self._package_split_num):
-            uuid = TypeSwitch.int_to_int_list(uuid_temp, 2)
-            crc = self.calculate_crc16(cmd + data[i:i + self._package_split_num])
-            package_count = package_count + 1
-            package_count_list = TypeSwitch.int_to_int_list(package_count, 4)
-            data_length_per_package_list = TypeSwitch.int_to_int_list(ProtocolStatus.ProtocolsLength.cmd_length +
-                                                                      len(data[i:i + self._package_split_num]), 2)
-            full_data_list.append(
-                list(self._header) + seq + uuid + package_count_list + data_length_per_package_list + crc +
-                cmd + data[i:i + self._package_split_num])
-        return full_data_list
+    def drain_send(self) -> None:
+        """
+        Send all the queued frames and resend the messages without reply, without waiting
+        Called by the LinkWorkerPool, one worker at a time
+        """
+        while True:
+            try:
+                data = self._encode_data_stack.get(block=False)
+            except Empty:
+                break
+            if data is None:
+                break
+            self._send_frame(data)
+        self._resend_expired()
+
+    def next_send_timeout(self) -> float | None:
+        """Max seconds before drain_send should be called again, None when nothing waits for the reply"""
+        return self._reply_data_stack.next_timeout()
+
+    def _resend_expired(self) -> None:
+        for uuid, datas in self._reply_data_stack.expire():
+            self.logger.debug(f"No reply of {uuid}, resend it")
+            # This runs in the sending thread, it must not wait for its own queue
+            self._insert_send(datas, block=False)
+
+    def _insert_send(self, datas: List[memoryview], boost: bool = False,
+                     block: bool = True, timeout: float = None) -> int:
+        """
+        Put all the packages of one message in the send queue
+        :param datas: encoded packages
+        :param boost: put in front of the queued data
+        :param block: wait when the queue is full, otherwise fail fast
+        :param timeout: max seconds to wait when block is True
+        :return: ProtocolStatus.p_ture / ProtocolStatus.p_false (queue full or closed)
+        """
+        try:
+            self._encode_data_stack.put_all(datas, boost=boost, block=block, timeout=timeout)
+        except Full:
+            self.logger.warning("The send queue is full, drop the message")
+            return ProtocolStatus.p_false
+        return ProtocolStatus.p_ture
+
+    def _send_boosted(self, datas: List[memoryview], block: bool) -> None:
+        self._insert_send(datas, boost=True, block=block)
 
     def send_data(self, cmd: list[int], data: List[int],
                   feedback_status: int = ProtocolStatus.Direction.send_need_none_feedback,
-                  send_seq_user_cmd: int = 0x00):
+                  send_seq_user_cmd: int = 0x00,
+                  boost: bool = False,
+                  block: bool = True,
+                  timeout: float = None) -> int:
         """
         :param cmd:
         :param data:
         :param feedback_status:  send_need_none_feedback / send_need_async_feedback / send_need_sync_feedback
         :param send_seq_user_cmd: send_ways and seq
+        :param boost: put the packages in front of the send queue
+        :param block: wait when the send queue (or the reply window) is full, otherwise return p_false at once
+        :param timeout: max seconds to wait for the send queue when block is True
         :return: -1 / 0 / 1
         """
+        if feedback_status not in [ProtocolStatus.Direction.send_need_none_feedback,
+                                   ProtocolStatus.Direction.send_need_sync_feedback]:
+            raise ValueError("Not input the right feedback_status, please read the instruction")
+        if feedback_status == ProtocolStatus.Direction.send_need_sync_feedback:
+            future = self.send_request(cmd, data, send_seq_user_cmd, boost, block, timeout)
+            return ProtocolStatus.p_false if future is None else ProtocolStatus.p_ture
         if self._authentication_status_sender:
-            if feedback_status not in [ProtocolStatus.Direction.send_need_none_feedback,
-                                       ProtocolStatus.Direction.send_need_sync_feedback]:
-                raise ValueError("Not input the right feedback_status, please read the instruction")
-            datas = self._encode_basic(seq=[feedback_status | ProtocolStatus.SeqSysCMD.SPP.send_cmd_None.value,
-                                            send_seq_user_cmd | self._function.value],
-                                       cmd=cmd,
-                                       data=data)
-            for data in datas:
-                self._insert_send(data)
+            datas = self._encode_data(cmd, data, feedback_status, send_seq_user_cmd)
+            return self._insert_send(datas, boost=boost, block=block, timeout=timeout)
         else:
             self._init_authentication_send()
+            return ProtocolStatus.p_false
 
-    def _send_internal_reply(self, uuid: int, cmd: List[int], seq: List[int], data: List[int]):
-        # uuid to get the data from the receiver stack
-        feedback_status = seq[0] & 0xF0
-        if feedback_status < 0x80:
-            feedback_status = feedback_status | 0x80
-        datas = self._encode_basic(seq=[feedback_status | (seq[0] & 0x0F),
-                                        seq[1]],
-                                   cmd=cmd,
-                                   data=data,
-                                   uuid=uuid)
-        for data in datas:
-            self._insert_send(data)
-
-    def send_reply(self, uuid: int):
+    def send_request(self, cmd: list[int], data: List[int],
+                     send_seq_user_cmd: int = 0x00,
+                     boost: bool = False,
+                     block: bool = True,
+                     timeout: float = None) -> Future | None:
+        """
+        Send the data with send_need_sync_feedback
+        At most reply_window messages wait for the reply, a message without reply is resent with backoff
+        :param cmd:
+        :param data:
+        :param send_seq_user_cmd: send_ways and seq
+        :param boost: put the packages in front of the send queue
+        :param block: wait when the reply window or the send queue is full, otherwise return None at once
+        :param timeout: max seconds to wait for the reply window, and then for the send queue
+        :return: Future resolved with the reply {"seq", "cmd", "data"}, or failed with TimeoutError after the
+        retries (asyncio.wrap_future to await it). None if the message is not sent
+        """
+        if not self._authentication_status_sender:
+            self._init_authentication_send()
+            return None
+        if not self._reply_data_stack.acquire(block, timeout):
+            self.logger.warning("The reply window is full, drop the message")
+            return None
+        uuid, datas, future = self._encode_request(cmd, data, send_seq_user_cmd)
+        if self._insert_send(datas, boost=boost, block=block, timeout=timeout) != ProtocolStatus.p_ture:
+            self._reply_data_stack.complete(uuid, None)
+            return None
+        return future
+
+    def send_reply(self, uuid: int, message: dict = None):
+        """
+        :param uuid: uuid of the received message
+        :param message: the message got by get_decode_data, default is the one still in the receiver stack
+        """
         # uuid to get the data from the receiver stack
-        seq = self._decode_data_stack[uuid]["seq"]
-        feedback_status = seq[0] & 0xF0
-        if feedback_status < 0x80:
-            feedback_status = feedback_status & 0x80
-        datas = self._encode_basic(seq=[feedback_status | (seq[0] & 0x0F),
-                                        seq[1]],
-                                   cmd=self._decode_data_stack[uuid]["cmd"],
-                                   data=self._decode_data_stack[uuid]["data"],
-                                   uuid=uuid)
-        for data in datas:
-            self._insert_send(data)
+        if message is None:
+            message = self._decode_data_stack[uuid]
+        return self._insert_send(self._encode_reply(uuid, message["seq"], message["cmd"], message["data"]))
 
     def _init_authentication_send(self):
         # Send data
         if not self._authentication_status_sender:
             self._send_seq_sys_cmd = ProtocolStatus.SeqSysCMD.SPP.send_authentication.value
-            seq_data = [0x00, 0x00]
-            seq_data[0] = ProtocolStatus.Direction.send_need_sync_feedback | self._send_seq_sys_cmd
-            seq_data[1] = 0x00 | self._function.value
-            authentication_data = atom_Hash.hash_data(self._authentication_info, "sha256")
-            datas = self._encode_basic(seq=seq_data,
-                                       cmd=[0xFF, 0xFF],
-                                       data=TypeSwitch.hex_string_to_int_list(authentication_data))
-            for data in datas:
-                self._send_callable(data, len(data))
-
-    def _init_send_total_info(self, data: List[int]):
-        self._send_seq_sys_cmd = ProtocolStatus.SeqSysCMD.SPP.send_total_info.value
-        self._total_packages = math.ceil((len(data) - ProtocolStatus.ProtocolsLength.total_length) /
-                                         self._package_split_num)
-        self._total_data = len(data)
-        datas = self._encode_basic(seq=[ProtocolStatus.Direction.send_need_none_feedback | self._send_seq_sys_cmd,
-                                        0x00 | self._function.value],
-                                   cmd=[0xFF, 0xFF],
-                                   data=(TypeSwitch.int_to_int_list(self._total_packages, 16) +
-                                         TypeSwitch.int_to_int_list(self._total_data, 16)))
-        for data in datas:
-            self._send_callable(data, len(data))
-        # Todo wait the receiver to confirm they receive the total info
+            for data in self._encode_authentication():
+                self._send_frame(data)
 
     #########################################
     # Receiver
@@ -337,7 +335,13 @@ class AtomProtocols:
         """
         match self._function.value:
             case ProtocolStatus.Functions.SPP.value:
+                if self._receive_mode is ProtocolStatus.ReceiveMode.PUSH:
+                    # The transport calls feed_data, nothing to run
+                    return None
                 self._thread_receiving = True
+                if self._worker_pool is not None:
+                    self._worker_pool.register_receiver(self)
+                    return None
                 self._u_thread_receiving.start()
                 self.logger.info("You start the receiving thread")
                 return None
@@ -353,9 +357,20 @@ class AtomProtocols:
         """
         match self._function.value:
             case ProtocolStatus.Functions.SPP.value:
+                if not self._thread_receiving:
+                    return None
                 self._thread_receiving = False
                 self._u_thread_receiving_stop_event.set()
+                if self._worker_pool is not None:
+                    self._worker_pool.unregister_receiver(self)
+                    self.logger.info("You stop the receiving thread")
+                    return None
+                if self._receive_mode is ProtocolStatus.ReceiveMode.SELECT:
+                    self._receive_wakeup_w.send(b"\x00")
                 self._u_thread_receiving.join()
+                if self._receive_mode is ProtocolStatus.ReceiveMode.SELECT:
+                    self._receive_wakeup_r.close()
+                    self._receive_wakeup_w.close()
                 self.logger.info("You stop the receiving thread")
                 return None
             case ProtocolStatus.Functions.STEAM.value:
@@ -400,140 +415,10 @@ class AtomProtocols:
             case _:
                 return None
 
-    def _seq_handler(self, uuid: int, seq: List[int], data: List[int]) -> bool:
-        # Todo need to finish this function
-        seq_data_direction = seq[0] & 0xF0
-        seq_sys_cmd = seq[0] & 0x0F
-        match self._function.value:
-            # SPP
-            case ProtocolStatus.Functions.SPP.value:
-                # Receive the send data and so some (Receiver)
-                if seq_data_direction <= ProtocolStatus.Direction.send_end:
-                    match seq_sys_cmd:
-                        case ProtocolStatus.SeqSysCMD.SPP.send_cmd_None.value:
-                            return False
-                        case ProtocolStatus.SeqSysCMD.SPP.send_authentication.value:
-                            # reply inside the function
-                            self._init_authentication_receive(uuid, seq, data)
-                            return True
-                        case ProtocolStatus.SeqSysCMD.SPP.send_total_info.value:
-                            self._init_receive_total_info(uuid, data)
-                            # no reply
-                            return True
-                        case ProtocolStatus.SeqSysCMD.SPP.send_wrong_data.value:
-                            # Todo: need to resend from the wrong data package
-                            return True
-                        case ProtocolStatus.SeqSysCMD.SPP.send_lost_package.value:
-                            # Todo: need to resend from the lost data package
-                            return True
-                        case _:
-                            return False
-                ####################
-                # Receive the reply data (Sender)
-                if seq_data_direction >= ProtocolStatus.Direction.receive_start:
-                    # NOTE: This part is Must do, to pop the sender stack
-                    if seq_data_direction in [(ProtocolStatus.Direction.send_need_sync_feedback |
-                                               ProtocolStatus.Direction.receive_start)]:
-                        if self._reply_data_stack[uuid] is not None:
-                            temp = self._reply_data_stack[uuid]
-                            del self._reply_data_stack[uuid]
-                    match seq_sys_cmd:
-                        case ProtocolStatus.SeqSysCMD.SPP.send_cmd_None.value:
-                            # No feedback
-                            return False
-                        case ProtocolStatus.SeqSysCMD.SPP.send_authentication.value:
-                            self._authentication_status_sender = bool(TypeSwitch.int_list_to_int(data))
-                            self.logger.info("Success authentication")
-                            return True
-                        case ProtocolStatus.SeqSysCMD.SPP.send_total_info.value:
-                            # No feedback
-                            return True
-                        case ProtocolStatus.SeqSysCMD.SPP.send_wrong_data.value:
-                            # No feedback
-                            return False
-                        case ProtocolStatus.SeqSysCMD.SPP.send_lost_package.value:
-                            # No feedback
-                            return False
-                        case _:
-                            return False
-        return False
-
-    def _package_handler(self, package_num: int):
-        if package_num is (self._last_package_num + 1):
-            return True
-        else:
-            # The package is not continuously
-            return False
-
-    def _crc_handler(self, cmd: List[int], data: List[int], crc: List[int]) -> bool:
-        match self._function.value:
-            # SPP
-            case ProtocolStatus.Functions.SPP.value:
-                if crc is self.calculate_crc16(cmd + data):
-                    return True
-                else:
-                    return False
-            case _:
-                return False
-
-    def _decode_basic(self, data: List[int]) -> int:
+    def _decode_basic(self, data) -> int:
         match self._function.value:
             case ProtocolStatus.Functions.SPP.value:
-                header_len = ProtocolStatus.ProtocolsLength.header_length
-                seq_len = ProtocolStatus.ProtocolsLength.seq_length
-                uuid_len = ProtocolStatus.ProtocolsLength.uuid_length
-                package_num_len = ProtocolStatus.ProtocolsLength.package_num_length
-                data_num_per_package_len = ProtocolStatus.ProtocolsLength.data_num_per_package_length
-                vpp_len = ProtocolStatus.ProtocolsLength.vpp_length
-                cmd_len = ProtocolStatus.ProtocolsLength.cmd_length
-
-                data_step = 0
-                if (data[data_step + header_len - 1] != self._header[3] or
-                        data[data_step + header_len - 2] != self._header[2] or
-                        data[data_step + header_len - 3] != self._header[1] or
-                        data[data_step + header_len - 4] != self._header[0]):
-                    return ProtocolStatus.DecodeErrorType.header_error
-                data_step = header_len
-                seq = data[data_step: data_step + seq_len]
-                data_step = data_step + seq_len
-                uuid = TypeSwitch.int_list_to_int(data[data_step: data_step + uuid_len])
-                data_step = data_step + uuid_len
-                package_num = data[data_step: data_step + package_num_len]
-                data_step = data_step + package_num_len
-                data_num_per_package = data[data_step: data_step + data_num_per_package_len]
-                data_step = data_step + data_num_per_package_len
-                vpp = data[data_step: data_step + vpp_len]
-                data_step = data_step + vpp_len
-                cmd = data[data_step: data_step + cmd_len]
-                data_step = data_step + cmd_len
-                main_data = data[data_step::]
-
-                # Seq handler, focus on the seq sys cmd
-                if self._seq_handler(uuid, seq, main_data):
-                    return ProtocolStatus.DecodeErrorType.no_error
-
-                # Package num test
-                if not self._package_handler(TypeSwitch.int_list_to_int(package_num)):
-                    # Todo: Lost Package Data need sth to do send a feedback to sender lost package
-                    return ProtocolStatus.DecodeErrorType.package_num_error
-
-                # not lost data test CRC test
-                if not self._crc_handler(cmd, main_data, vpp):
-                    # Todo: Wrong Data need sth to do send a feedback to sender lost data
-                    return ProtocolStatus.DecodeErrorType.vpp_error
-
-                # Add data
-                if uuid not in self._decode_data_stack:
-                    self._decode_data_stack[uuid] = {}
-                if self._decode_data_stack[uuid] is None or len(self._decode_data_stack[uuid]) <= 2:
-                    self._decode_data_stack[uuid]["seq"] = seq
-                    self._decode_data_stack[uuid]["package_num"] = package_num
-                    self._decode_data_stack[uuid]["data_num_per_package"] = data_num_per_package
-                    self._decode_data_stack[uuid]["cmd"] = cmd
-                    self._decode_data_stack[uuid]["data"] = main_data
-                else:
-                    self._decode_data_stack[uuid]["data"].extend(main_data)
-
+                return self._decode_spp(data)
             case ProtocolStatus.Functions.STEAM.value:
                 pass
             case _:
@@ -542,57 +427,85 @@ class AtomProtocols:
     def _thread_decode_receiving(self, stop_event):
         try:
             while not stop_event.is_set():
-                data = self._receive_callable()
-                self.logger.debug(data)
-                while len(self._decode_data_stack) > self._max_decode_data_stack_length:
-                    # If over the max stack length, lost the oldest data
-                    min_key = min(self._decode_data_stack.keys())
-                    self._decode_data_stack.pop(min_key)
-                if data is not None and data != []:
-                    match self._decode_basic(data):
-                        case ProtocolStatus.DecodeErrorType.no_error:
-                            pass
-                        case ProtocolStatus.DecodeErrorType.header_error:
-                            self.logger.warning("header_error")
-                        case ProtocolStatus.DecodeErrorType.seq_error:
-                            self.logger.warning("seq_error")
-                        case ProtocolStatus.DecodeErrorType.uuid_error:
-                            self.logger.warning("uuid_error")
-                        case ProtocolStatus.DecodeErrorType.package_num_error:
-                            self.logger.warning("package_num_error")
-                        case ProtocolStatus.DecodeErrorType.data_num_per_error:
-                            self.logger.warning("data_num_per_error")
-                        case ProtocolStatus.DecodeErrorType.vpp_error:
-                            self.logger.warning("vpp_error")
-                        case ProtocolStatus.DecodeErrorType.cmd_error:
-                            self.logger.warning("cmd_error")
-                        case _:
-                            pass
-                else:
-                    pass
+                self._handle_received(self._receive_callable())
         except Exception as e:
             self.logger.exception("An exception occurred" + str(e))
 
-    def _init_authentication_receive(self, uuid: int, seq: List[int], data: List[int]) -> None:
-        authentication_data = atom_Hash.hash_data(self._authentication_info, "sha256")
-        if data == TypeSwitch.hex_string_to_int_list(authentication_data):
-            self._authentication_status_receiver = True
-        else:
-            self.logger.warning("Wrong authentication data")
-        self._send_internal_reply(uuid=uuid,
-                                  cmd=[0xFF, 0xFF],
-                                  seq=seq,
-                                  data=[int(self._authentication_status_receiver)])
+    def _thread_select_receiving(self, stop_event):
+        selector = selectors.DefaultSelector()
+        try:
+            selector.register(self._receive_fileno, selectors.EVENT_READ, data=False)
+            selector.register(self._receive_wakeup_r, selectors.EVENT_READ, data=True)
+            while not stop_event.is_set():
+                # Sleep in the kernel until the transport is readable or we are woken to stop
+                for key, _ in selector.select():
+                    if key.data:
+                        self._receive_wakeup_r.recv(64)
+                    else:
+                        self._handle_received(self._receive_callable())
+        except Exception as e:
+            self.logger.exception("An exception occurred" + str(e))
+        finally:
+            selector.close()
+
+    def poll_receive(self) -> None:
+        """
+        Read the receive interface once and decode it, called by the LinkWorkerPool
+        """
+        self._handle_received(self._receive_callable())
 
-    def _init_receive_total_info(self, uuid: int, data: List[int]):
-        if uuid not in self._decode_data_stack:
-            self._decode_data_stack[uuid] = {}
-        self._decode_data_stack[uuid]["total_package"] = data[0:15]
-        self._decode_data_stack[uuid]["total_data"] = data[16:31]
+    def feed_data(self, data: List[int]) -> None:
+        """
+        Push the received data to the decoder, used in the PUSH receive mode
+        The data is decoded in the caller thread at once
+        :param data: received data
+        :return: None
+        """
+        self._handle_received(data)
 
-    def get_decode_data(self) -> Tuple:
-        min_key = min(self._decode_data_stack.keys())
-        return min_key, self._decode_data_stack.pop(min_key)
+    def _handle_received(self, data: List[int]) -> None:
+        with self._decode_lock:
+            self.logger.debug(data)
+            if data is None or len(data) == 0:
+                return None
+            for frame in self._frame_parser.feed(data):
+                match self._decode_basic(frame):
+                    case ProtocolStatus.DecodeErrorType.no_error:
+                        pass
+                    case ProtocolStatus.DecodeErrorType.header_error:
+                        self.logger.warning("header_error")
+                    case ProtocolStatus.DecodeErrorType.seq_error:
+                        self.logger.warning("seq_error")
+                    case ProtocolStatus.DecodeErrorType.uuid_error:
+                        self.logger.warning("uuid_error")
+                    case ProtocolStatus.DecodeErrorType.package_num_error:
+                        self.logger.warning("package_num_error")
+                    case ProtocolStatus.DecodeErrorType.data_num_per_error:
+                        self.logger.warning("data_num_per_error")
+                    case ProtocolStatus.DecodeErrorType.vpp_error:
+                        self.logger.warning("vpp_error")
+                    case ProtocolStatus.DecodeErrorType.cmd_error:
+                        self.logger.warning("cmd_error")
+                    case _:
+                        pass
+
+    def _to_user_message(self, message: dict) -> dict:
+        return {"seq": self._to_user_data(message["seq"]),
+                "cmd": self._to_user_data(message["cmd"]),
+                "data": message["data"] if self._byte_interface else list(message["data"]),
+                "total_package": message["total_package"],
+                "total_data": message["total_data"]}
+
+    def get_decode_data(self) -> Tuple | None:
+        """
+        Oldest completed message, O(1)
+        :return: (uuid, {"seq", "cmd", "data", "total_package", "total_data"}) or None if no message is complete
+        """
+        with self._decode_lock:
+            ready = self._decode_data_stack.get()
+        if ready is None:
+            return None
+        return ready[0], self._to_user_message(ready[1])
 
 
 if __name__ == "__main__":
@@ -620,4 +533,4 @@ if __name__ == "__main__":
 
 
     sender = AtomProtocols(send, receive)
-    sender.send_data([12, 12], [123, 124, 412, 144])
+    sender.send_data([12, 12], [123, 124, 41, 144])
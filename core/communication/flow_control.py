@@ -0,0 +1,210 @@
+"""
+Flow control of the messages sent with send_need_sync_feedback.
+
+- TimerWheel: hashed timer wheel, schedule / cancel are O(1) and advance only visits the slots of the passed ticks.
+- InFlightWindow: at most window_size messages wait for a reply. Every message has a deadline on the wheel, it is
+  resent with an exponential backoff when the deadline passes and failed with TimeoutError after max_retries.
+  The caller gets a concurrent.futures.Future (asyncio.wrap_future to await it) which is resolved by the reply.
+"""
+
+import math
+import threading
+import time
+from concurrent.futures import Future
+from typing import Dict, Hashable, List, Tuple
+
+
+class TimerWheel:
+    def __init__(self, tick: float = 0.01, wheel_size: int = 256):
+        """
+        :param tick: seconds per slot
+        :param wheel_size: slots of the wheel, deadlines further than one turn stay in the slot for more turns
+        """
+        self._tick = tick
+        self._wheel_size = wheel_size
+        self._slots: List[Dict[Hashable, int]] = [{} for _ in range(wheel_size)]
+        # key -> deadline tick
+        self._deadlines: Dict[Hashable, int] = {}
+        self._current_tick = self._to_tick(time.monotonic())
+
+    def __len__(self):
+        return len(self._deadlines)
+
+    def __contains__(self, key):
+        return key in self._deadlines
+
+    @property
+    def tick(self) -> float:
+        return self._tick
+
+    def _to_tick(self, moment: float) -> int:
+        return int(moment / self._tick)
+
+    def schedule(self, key: Hashable, deadline: float) -> None:
+        """(Re)schedule the key at the deadline, time.monotonic() based"""
+        self.cancel(key)
+        # A deadline in the past is fired by the next advance
+        deadline_tick = max(math.ceil(deadline / self._tick), self._current_tick + 1)
+        self._deadlines[key] = deadline_tick
+        self._slots[deadline_tick % self._wheel_size][key] = deadline_tick
+
+    def cancel(self, key: Hashable) -> bool:
+        deadline_tick = self._deadlines.pop(key, None)
+        if deadline_tick is None:
+            return False
+        del self._slots[deadline_tick % self._wheel_size][key]
+        return True
+
+    def advance(self, now: float = None) -> List[Hashable]:
+        """
+        Move the wheel to now
+        :return: keys whose deadline passed, they are removed from the wheel
+        """
+        now_tick = self._to_tick(time.monotonic() if now is None else now)
+        expired = []
+        if now_tick <= self._current_tick:
+            return expired
+        # After a full turn every slot has been passed once
+        first_tick = max(self._current_tick + 1, now_tick - self._wheel_size + 1)
+        for tick in range(first_tick, now_tick + 1):
+            slot = self._slots[tick % self._wheel_size]
+            if not slot:
+                continue
+            for key, deadline_tick in list(slot.items()):
+                if deadline_tick <= now_tick:
+                    del slot[key]
+                    del self._deadlines[key]
+                    expired.append(key)
+        self._current_tick = now_tick
+        return expired
+
+
+class InFlightWindow:
+    def __init__(self, window_size: int = 0x40, timeout: float = 1.0, max_retries: int = 3, backoff: float = 2.0,
+                 tick: float = 0.01):
+        """
+        :param window_size: max messages waiting for a reply
+        :param timeout: seconds to wait for the first reply
+        :param max_retries: resend times before the message fails
+        :param backoff: the wait time is multiplied by this for every retry
+        :param tick: timer wheel resolution
+        """
+        if window_size <= 0:
+            raise ValueError("window_size must be greater than 0")
+        self._window_size = window_size
+        self._timeout = timeout
+        self._max_retries = max_retries
+        self._backoff = backoff
+        self._wheel = TimerWheel(tick)
+        # uuid -> {"record": sent message, "datas": encoded packages, "future": Future, "retries": int}
+        self._in_flight: Dict[int, dict] = {}
+        # Places acquired but not added yet
+        self._reserved = 0
+        self._mutex = threading.Lock()
+        self._not_full = threading.Condition(self._mutex)
+
+    def __len__(self):
+        return len(self._in_flight)
+
+    def __contains__(self, uuid):
+        return uuid in self._in_flight
+
+    def __getitem__(self, uuid):
+        """The sent message of the uuid, {"seq", "cmd", "data"}"""
+        return self._in_flight[uuid]["record"]
+
+    @property
+    def window_size(self) -> int:
+        return self._window_size
+
+    def next_timeout(self) -> float | None:
+        """Max seconds the caller could sleep before expire should be called again, None when nothing is in flight"""
+        return self._wheel.tick if self._in_flight else None
+
+    def acquire(self, block: bool = True, timeout: float = None) -> bool:
+        """
+        Wait for a free place in the window, a successful acquire must be followed by add or release
+        :return: False if the window is still full
+        """
+        with self._mutex:
+            if len(self._in_flight) + self._reserved < self._window_size:
+                self._reserved += 1
+                return True
+            if not block:
+                return False
+            if not self._not_full.wait_for(lambda: len(self._in_flight) + self._reserved < self._window_size,
+                                           timeout):
+                return False
+            self._reserved += 1
+            return True
+
+    def release(self) -> None:
+        """Give back an acquired place which is not used"""
+        with self._mutex:
+            self._reserved -= 1
+            self._not_full.notify()
+
+    def add(self, uuid: int, record: dict, datas: list) -> Future:
+        """
+        Start to wait the reply of the message, the place must be acquired before
+        :param uuid: message uuid
+        :param record: the sent message, returned by __getitem__
+        :param datas: encoded packages, resent when the deadline passes
+        :return: future resolved with the reply
+        """
+        future = Future()
+        with self._mutex:
+            self._reserved -= 1
+            self._in_flight[uuid] = {"record": record, "datas": datas, "future": future, "retries": 0}
+            self._wheel.schedule(uuid, time.monotonic() + self._timeout)
+        return future
+
+    def _remove(self, uuid: int) -> dict | None:
+        # Caller holds the mutex
+        entry = self._in_flight.pop(uuid, None)
+        if entry is not None:
+            self._wheel.cancel(uuid)
+            self._not_full.notify()
+        return entry
+
+    def complete(self, uuid: int, reply) -> bool:
+        """
+        The reply of the uuid arrives
+        :return: False if the uuid is not in flight (late or unknown reply)
+        """
+        with self._mutex:
+            entry = self._remove(uuid)
+        if entry is None:
+            return False
+        if not entry["future"].cancelled():
+            entry["future"].set_result(reply)
+        return True
+
+    def expire(self, now: float = None) -> List[Tuple[int, list]]:
+        """
+        Handle the passed deadlines
+        :return: (uuid, encoded packages) to resend, the messages out of retries are failed with TimeoutError
+        """
+        now = time.monotonic() if now is None else now
+        resend = []
+        failed = []
+        with self._mutex:
+            for uuid in self._wheel.advance(now):
+                entry = self._in_flight[uuid]
+                if entry["retries"] >= self._max_retries:
+                    failed.append(self._remove(uuid))
+                    continue
+                entry["retries"] += 1
+                self._wheel.schedule(uuid, now + self._timeout * self._backoff ** entry["retries"])
+                resend.append((uuid, entry["datas"]))
+        for entry in failed:
+            if not entry["future"].cancelled():
+                entry["future"].set_exception(TimeoutError(f"No reply after {self._max_retries} retries"))
+        return resend
+
+    def cancel_all(self) -> None:
+        """Cancel every message in flight, e.g. when the link stops"""
+        with self._mutex:
+            entries = [self._remove(uuid) for uuid in list(self._in_flight)]
+        for entry in entries:
+            entry["future"].cancel()
@@ -0,0 +1,130 @@
+"""
+Byte buffer based frame layout of the AtomProtocols, see ProtocolStatus.ProtocolsLength.
+
+| header 4 | seq 2 | uuid 2 | package_num 4 | data_num_per_package 2 | vpp 2 | cmd 2 | data |
+
+All the numbers are msb first, data_num_per_package = cmd_length + len(data), vpp is the crc16 of cmd + data.
+Frames of one message are packed with struct.pack_into in one preallocated bytearray and handed out as memoryview
+slices, decoding reads the fields in place and returns the data as a memoryview of the input.
+"""
+
+import struct
+from typing import Iterable, List, NamedTuple
+from utils.crc16 import CRC16_XMODEM
+from communication.protocol_status import ProtocolStatus
+
+# header, seq, uuid, package_num, data_num_per_package, vpp, cmd
+FRAME_STRUCT = struct.Struct(">4s2sHIHH2s")
+# Offset of the data_num_per_package field
+DATA_NUM_OFFSET = (ProtocolStatus.ProtocolsLength.header_length + ProtocolStatus.ProtocolsLength.seq_length +
+                   ProtocolStatus.ProtocolsLength.uuid_length + ProtocolStatus.ProtocolsLength.package_num_length)
+
+assert FRAME_STRUCT.size == ProtocolStatus.ProtocolsLength.total_length
+
+
+def calculate_crc16(*buffers) -> int:
+    """crc16 over several buffers without joining them"""
+    return CRC16_XMODEM.calc(*buffers)
+
+
+class Frame(NamedTuple):
+    seq: bytes
+    uuid: int
+    package_num: int
+    data_num_per_package: int
+    vpp: int
+    cmd: bytes
+    data: memoryview
+
+
+class FrameCodec:
+    def __init__(self, header: tuple = (0xE5, 0x5E, 0xF2, 0x2F), package_length: int = 1024):
+        """
+        :param header: frame header
+        :param package_length: max length of one frame
+        """
+        if len(header) != 4:
+            raise ValueError("The header must be 4 bytes")
+        self._header = bytes(header)
+        self._package_length = 0
+        self._package_split_num = 0
+        self.package_length = package_length
+
+    @property
+    def header(self) -> bytes:
+        return self._header
+
+    @property
+    def package_length(self) -> int:
+        return self._package_length
+
+    @package_length.setter
+    def package_length(self, value: int):
+        if value <= FRAME_STRUCT.size:
+            raise ValueError(f"The package length must be greater than {FRAME_STRUCT.size}")
+        self._package_length = value
+        self._package_split_num = value - FRAME_STRUCT.size
+
+    @property
+    def package_split_num(self) -> int:
+        """Max data length carried by one frame"""
+        return self._package_split_num
+
+    def package_count(self, data_length: int) -> int:
+        # A message without data still needs one frame to carry the cmd
+        return max(1, -(-data_length // self._package_split_num))
+
+    def encode(self, seq, uuid: int, cmd, data) -> List[memoryview]:
+        """
+        :param seq: 2 bytes, list or bytes
+        :param uuid: message uuid
+        :param cmd: 2 bytes, list or bytes
+        :param data: list of int or bytes-like
+        :return: frames of the message
+        """
+        seq = bytes(seq)
+        cmd = bytes(cmd)
+        payload = data if isinstance(data, (bytes, bytearray, memoryview)) else bytes(data)
+        payload = memoryview(payload).cast("B")
+        split = self._package_split_num
+        count = self.package_count(len(payload))
+        buffer = bytearray(count * FRAME_STRUCT.size + len(payload))
+        view = memoryview(buffer)
+        frames = []
+        offset = 0
+        for package_num in range(1, count + 1):
+            chunk = payload[(package_num - 1) * split: package_num * split]
+            data_start = offset + FRAME_STRUCT.size
+            end = data_start + len(chunk)
+            FRAME_STRUCT.pack_into(buffer, offset, self._header, seq, uuid, package_num,
+                                   len(cmd) + len(chunk), calculate_crc16(cmd, chunk), cmd)
+            view[data_start:end] = chunk
+            frames.append(view[offset:end])
+            offset = end
+        return frames
+
+    @staticmethod
+    def verify_frames(frames: Iterable[Frame]) -> List[bool]:
+        """Batch crc16 check of decoded frames, one bool per frame"""
+        return CRC16_XMODEM.verify_many((frame.vpp, (frame.cmd, frame.data)) for frame in frames)
+
+    def frame_length(self, buffer, offset: int = 0) -> int:
+        """Full frame length read from the data_num_per_package field, the buffer must hold the fixed part"""
+        return (ProtocolStatus.ProtocolsLength.total_crc_length +
+                int.from_bytes(buffer[offset + DATA_NUM_OFFSET:offset + DATA_NUM_OFFSET + 2], "big"))
+
+    def decode(self, buffer) -> Frame | int:
+        """
+        :param buffer: one whole frame, bytes-like
+        :return: Frame, or the ProtocolStatus.DecodeErrorType value when the frame is broken
+        """
+        view = memoryview(buffer).cast("B")
+        if len(view) < FRAME_STRUCT.size:
+            return ProtocolStatus.DecodeErrorType.data_num_per_error
+        header, seq, uuid, package_num, data_num_per_package, vpp, cmd = FRAME_STRUCT.unpack_from(view)
+        if header != self._header:
+            return ProtocolStatus.DecodeErrorType.header_error
+        end = ProtocolStatus.ProtocolsLength.total_crc_length + data_num_per_package
+        if data_num_per_package < ProtocolStatus.ProtocolsLength.cmd_length or end > len(view):
+            return ProtocolStatus.DecodeErrorType.data_num_per_error
+        return Frame(seq, uuid, package_num, data_num_per_package, vpp, cmd, view[FRAME_STRUCT.size:end])
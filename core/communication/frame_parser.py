@@ -0,0 +1,110 @@
+"""
+Incremental frame parser for stream transports (serial / TCP).
+
+The transport could give half a frame, several frames, or garbage between frames in one read. The parser keeps the
+unread bytes, searches the header, reads the frame length from the data_num_per_package field and cuts every complete
+frame. A header with an impossible length (or a wrong crc16 when verify_crc is on) is treated as garbage, the parser
+moves one byte on and searches the next header.
+"""
+
+import time
+from typing import List
+from communication.frame_codec import FrameCodec, FRAME_STRUCT, DATA_NUM_OFFSET, calculate_crc16
+from communication.protocol_status import ProtocolStatus
+
+
+class FrameStreamParser:
+    def __init__(self, codec: FrameCodec, verify_crc: bool = False):
+        """
+        :param codec: gives the header and the max package length
+        :param verify_crc: also check the crc16 before a frame is cut, a wrong frame is skipped byte by byte
+        """
+        self._codec = codec
+        self._verify_crc = verify_crc
+        # Unread bytes, deleting from the front of a bytearray only moves its start, so this works as a ring buffer
+        self._buffer = bytearray()
+        self._dropped_bytes = 0
+
+    def __len__(self):
+        return len(self._buffer)
+
+    @property
+    def dropped_bytes(self) -> int:
+        """Bytes thrown away as garbage since the parser is created"""
+        return self._dropped_bytes
+
+    def reset(self) -> None:
+        self._buffer.clear()
+
+    def _check_crc(self, start: int, end: int) -> bool:
+        with memoryview(self._buffer) as view:
+            crc_start = start + ProtocolStatus.ProtocolsLength.total_crc_length
+            vpp = int.from_bytes(view[crc_start - 2:crc_start], "big")
+            return vpp == calculate_crc16(view[crc_start:end])
+
+    def feed(self, chunk) -> List[bytearray]:
+        """
+        :param chunk: received bytes-like data or List[int]
+        :return: all the complete frames in the stream so far, could be empty
+        """
+        buffer = self._buffer
+        buffer += chunk if isinstance(chunk, (bytes, bytearray, memoryview)) else bytes(chunk)
+        header = self._codec.header
+        fixed_length = FRAME_STRUCT.size
+        crc_length = ProtocolStatus.ProtocolsLength.total_crc_length
+        max_length = self._codec.package_length
+        buffer_length = len(buffer)
+        frames = []
+        position = 0
+        while True:
+            start = buffer.find(header, position)
+            if start < 0:
+                # Keep the tail which could be the beginning of a header
+                keep = max(position, buffer_length - len(header) + 1)
+                self._dropped_bytes += keep - position
+                position = keep
+                break
+            self._dropped_bytes += start - position
+            position = start
+            if buffer_length - start < fixed_length:
+                break
+            end = start + crc_length + int.from_bytes(buffer[start + DATA_NUM_OFFSET:start + DATA_NUM_OFFSET + 2],
+                                                      "big")
+            if end - start < fixed_length or end - start > max_length:
+                # Not a real header, search from the next byte
+                self._dropped_bytes += 1
+                position = start + 1
+                continue
+            if end > buffer_length:
+                break
+            if self._verify_crc and not self._check_crc(start, end):
+                self._dropped_bytes += 1
+                position = start + 1
+                continue
+            frames.append(buffer[start:end])
+            position = end
+        if position:
+            del buffer[:position]
+        return frames
+
+    @staticmethod
+    def benchmark(package_length: int = 1024, frames_num: int = 20000, chunk_length: int = 4096):
+        """Feed a stream of full frames in fixed size chunks and print the throughput"""
+        codec = FrameCodec(package_length=package_length)
+        frames = codec.encode([0x00, ProtocolStatus.Functions.SPP.value], 1, [0x01, 0x02],
+                              bytes(codec.package_split_num * frames_num))
+        stream = b"".join(frames)
+        chunks = [stream[i:i + chunk_length] for i in range(0, len(stream), chunk_length)]
+        for verify_crc in (False, True):
+            parser = FrameStreamParser(codec, verify_crc=verify_crc)
+            count = 0
+            start_time = time.perf_counter()
+            for chunk in chunks:
+                count += len(parser.feed(chunk))
+            cost = time.perf_counter() - start_time
+            print(f"verify_crc: {verify_crc}, frames: {count}, "
+                  f"throughput: {len(stream) / cost / 1e6:.1f} MB/s, per frame: {cost / count * 1e6:.2f} us")
+
+
+if __name__ == "__main__":
+    FrameStreamParser.benchmark()
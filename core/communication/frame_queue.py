@@ -0,0 +1,118 @@
+"""
+Bounded FIFO used between the protocol producers (send_data, replies) and the sending thread.
+
+- put / put_all block until there is room, or fail fast with queue.Full when block=False or the timeout runs out.
+- boost=True inserts at the head so priority frames overtake the queued ones.
+- get blocks without polling and returns None once the queue is closed and drained.
+- on_put lets a shared worker pool drain the queue instead of a thread blocked on get.
+"""
+
+import threading
+from collections import deque
+from queue import Full, Empty
+from typing import Callable
+
+
+class FrameQueue:
+    def __init__(self, maxsize: int = 0xFF, on_put: Callable[[], None] = None):
+        """
+        :param maxsize: max frames kept in the queue, must be > 0
+        :param on_put: called after frames are put, e.g. to schedule the consumer. It runs with the queue locked,
+        so it must not call the queue
+        """
+        if maxsize <= 0:
+            raise ValueError("maxsize must be greater than 0")
+        self._maxsize = maxsize
+        self._on_put = on_put
+        self._queue = deque()
+        self._closed = False
+        self._mutex = threading.Lock()
+        self._not_empty = threading.Condition(self._mutex)
+        self._not_full = threading.Condition(self._mutex)
+
+    def __len__(self):
+        return len(self._queue)
+
+    @property
+    def maxsize(self):
+        return self._maxsize
+
+    @property
+    def closed(self):
+        return self._closed
+
+    def _wait_for_room(self, count: int, block: bool, timeout: float | None) -> None:
+        # Caller holds the mutex
+        if self._maxsize - len(self._queue) >= count:
+            return None
+        if not block:
+            raise Full
+        if not self._not_full.wait_for(lambda: self._closed or self._maxsize - len(self._queue) >= count,
+                                       timeout):
+            raise Full
+        return None
+
+    def put(self, item, boost: bool = False, block: bool = True, timeout: float | None = None) -> None:
+        """
+        :param item: frame to send
+        :param boost: insert at the head of the queue
+        :param block: wait for room, otherwise raise queue.Full at once
+        :param timeout: max seconds to wait for room
+        :return: None
+        """
+        self.put_all([item], boost, block, timeout)
+
+    def put_all(self, items: list, boost: bool = False, block: bool = True, timeout: float | None = None) -> None:
+        """
+        Put all the packages of one message. Room is reserved for the whole message so it is never half queued,
+        unless the message is longer than the queue itself, then it is fed in queue sized pieces.
+        """
+        if not items:
+            return None
+        with self._mutex:
+            if self._closed:
+                raise Full
+            step = min(len(items), self._maxsize)
+            for i in range(0, len(items), step):
+                part = items[i:i + step]
+                self._wait_for_room(len(part), block, timeout)
+                if self._closed:
+                    raise Full
+                if boost:
+                    self._queue.extendleft(reversed(part))
+                else:
+                    self._queue.extend(part)
+                self._not_empty.notify()
+                if self._on_put is not None:
+                    self._on_put()
+
+    def get(self, block: bool = True, timeout: float | None = None):
+        """
+        :return: the oldest frame, or None when the queue is closed and empty
+        """
+        with self._mutex:
+            if not self._queue:
+                if self._closed:
+                    return None
+                if not block:
+                    raise Empty
+                if not self._not_empty.wait_for(lambda: self._queue or self._closed, timeout):
+                    raise Empty
+                if not self._queue:
+                    return None
+            item = self._queue.popleft()
+            # Producers wait for different amounts of room, so wake them all to re-check
+            self._not_full.notify_all()
+            return item
+
+    def clear(self) -> None:
+        with self._mutex:
+            self._queue.clear()
+            self._not_full.notify_all()
+
+    def close(self) -> None:
+        """Wake every waiting producer and consumer, the queue refuses new frames after this"""
+        with self._mutex:
+            self._closed = True
+            self._not_empty.notify_all()
+            self._not_full.notify_all()
@@ -0,0 +1,279 @@
+"""
+Many AtomProtocols links in one process.
+
+- LinkWorkerPool: a shared pool which drives the I/O of many links. One I/O thread waits on the receive file
+  descriptors of all the SELECT links (and polls the POLL links), a few send workers drain the send queues of the
+  links which have frames. A link is drained by one worker at a time, so its frames keep their order.
+  N links need 1 + send_workers threads instead of 2N.
+- AtomLinkManager: opens, keeps and closes independent links by name, with or without the shared pool.
+"""
+
+import logging
+import selectors
+import socket
+import threading
+from collections import deque
+from typing import Callable, Dict, List
+from communication.atom_protocols import AtomProtocols
+from communication.protocol_status import ProtocolStatus
+
+
+class LinkWorkerPool:
+    def __init__(self, send_workers: int = 2, poll_interval: float = 0.001):
+        """
+        :param send_workers: threads sending the queued frames of all the links
+        :param poll_interval: seconds between two reads of the POLL links, their receive_interface must not block
+        """
+        if send_workers <= 0:
+            raise ValueError("send_workers must be greater than 0")
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self._poll_interval = poll_interval
+        self._selector = selectors.DefaultSelector()
+        # The socket pair wakes the I/O thread when the links change or the pool stops
+        self._wakeup_r, self._wakeup_w = socket.socketpair()
+        self._wakeup_r.setblocking(False)
+        self._wakeup_w.setblocking(False)
+        self._selector.register(self._wakeup_r, selectors.EVENT_READ, data=None)
+
+        self._lock = threading.Lock()
+        # Sender links, they are checked for the reply timeouts
+        self._send_links: List[AtomProtocols] = []
+        # Links waiting for a send worker
+        self._send_ready = deque()
+        self._send_condition = threading.Condition(self._lock)
+        # Links queued or being drained, a link in it is never queued twice
+        self._send_scheduled = set()
+        # Links which got new frames while they are queued or drained
+        self._send_pending = set()
+        # Receiver links
+        self._poll_links: List[AtomProtocols] = []
+        # Selector changes applied by the I/O thread, (function, done event)
+        self._selector_changes = deque()
+
+        self._stop_event = threading.Event()
+        self._u_thread_io = threading.Thread(target=self._thread_io, args=(self._stop_event,))
+        self._u_threads_send = [threading.Thread(target=self._thread_send, args=(self._stop_event,))
+                                for _ in range(send_workers)]
+        self._u_thread_io.start()
+        for thread in self._u_threads_send:
+            thread.start()
+
+    def __len__(self):
+        return len(self._send_links)
+
+    def _wakeup(self) -> None:
+        try:
+            self._wakeup_w.send(b"\x00")
+        except BlockingIOError:
+            # Already full of wakeups
+            pass
+
+    #########################################
+    # Sender
+    def register_sender(self, link: AtomProtocols) -> None:
+        with self._lock:
+            if link not in self._send_links:
+                self._send_links.append(link)
+        self.notify_send(link)
+
+    def unregister_sender(self, link: AtomProtocols) -> None:
+        """Remove the link, wait until no worker drains it"""
+        with self._lock:
+            if link in self._send_links:
+                self._send_links.remove(link)
+            self._send_pending.discard(link)
+            if link in self._send_scheduled and link in self._send_ready:
+                self._send_ready.remove(link)
+                self._send_scheduled.discard(link)
+            while link in self._send_scheduled and not self._stop_event.is_set():
+                self._send_condition.wait()
+
+    def notify_send(self, link: AtomProtocols) -> None:
+        """The link has frames to send (or expired requests), drain it in a send worker"""
+        with self._lock:
+            if link in self._send_scheduled:
+                self._send_pending.add(link)
+                return None
+            self._send_scheduled.add(link)
+            self._send_ready.append(link)
+            self._send_condition.notify_all()
+
+    def _thread_send(self, stop_event):
+        while True:
+            with self._lock:
+                while not self._send_ready and not stop_event.is_set():
+                    self._send_condition.wait()
+                if stop_event.is_set():
+                    return None
+                link = self._send_ready.popleft()
+            try:
+                link.drain_send()
+            except Exception as e:
+                self.logger.exception("An exception occurred" + str(e))
+            with self._lock:
+                if link in self._send_pending and link in self._send_links:
+                    # New frames came while draining, queue the link again
+                    self._send_pending.discard(link)
+                    self._send_ready.append(link)
+                else:
+                    self._send_pending.discard(link)
+                    self._send_scheduled.discard(link)
+                self._send_condition.notify_all()
+
+    #########################################
+    # Receiver
+    def _change_selector(self, function: Callable[[], None]) -> None:
+        # The selector is only used by the I/O thread, wait until the change is applied
+        if self._stop_event.is_set():
+            return None
+        done = threading.Event()
+        with self._lock:
+            self._selector_changes.append((function, done))
+        self._wakeup()
+        while not done.wait(0.1):
+            if self._stop_event.is_set():
+                return None
+
+    def register_receiver(self, link: AtomProtocols) -> None:
+        match link.receive_mode:
+            case ProtocolStatus.ReceiveMode.SELECT:
+                self._change_selector(lambda: self._selector.register(link.receive_fileno, selectors.EVENT_READ,
+                                                                      data=link))
+            case ProtocolStatus.ReceiveMode.POLL:
+                self._change_selector(lambda: self._poll_links.append(link))
+            case _:
+                # PUSH links are fed by the transport
+                return None
+
+    def unregister_receiver(self, link: AtomProtocols) -> None:
+        """Remove the link, no read of it happens after this returns"""
+        match link.receive_mode:
+            case ProtocolStatus.ReceiveMode.SELECT:
+                self._change_selector(lambda: self._selector.unregister(link.receive_fileno))
+            case ProtocolStatus.ReceiveMode.POLL:
+                self._change_selector(lambda: self._poll_links.remove(link))
+            case _:
+                return None
+
+    def _next_timeout(self) -> float | None:
+        timeout = self._poll_interval if self._poll_links else None
+        with self._lock:
+            links = list(self._send_links)
+        for link in links:
+            link_timeout = link.next_send_timeout()
+            if link_timeout is not None and (timeout is None or link_timeout < timeout):
+                timeout = link_timeout
+        return timeout
+
+    def _thread_io(self, stop_event):
+        try:
+            while not stop_event.is_set():
+                for key, _ in self._selector.select(self._next_timeout()):
+                    if key.data is None:
+                        try:
+                            self._wakeup_r.recv(64)
+                        except BlockingIOError:
+                            pass
+                    else:
+                        key.data.poll_receive()
+                with self._lock:
+                    changes = list(self._selector_changes)
+                    self._selector_changes.clear()
+                for function, done in changes:
+                    try:
+                        function()
+                    except (KeyError, ValueError) as e:
+                        self.logger.warning("Wrong link change " + str(e))
+                    done.set()
+                for link in self._poll_links:
+                    link.poll_receive()
+                # The send workers resend the requests without reply
+                with self._lock:
+                    links = list(self._send_links)
+                for link in links:
+                    if link.next_send_timeout() is not None:
+                        self.notify_send(link)
+        except Exception as e:
+            self.logger.exception("An exception occurred" + str(e))
+
+    def stop(self) -> None:
+        """Stop all the threads of the pool, the links should be closed before"""
+        self._stop_event.set()
+        self._wakeup()
+        with self._lock:
+            self._send_condition.notify_all()
+        self._u_thread_io.join()
+        for thread in self._u_threads_send:
+            thread.join()
+        self._selector.close()
+        self._wakeup_r.close()
+        self._wakeup_w.close()
+
+
+class AtomLinkManager:
+    def __init__(self, shared_workers: bool = True, send_workers: int = 2, poll_interval: float = 0.001):
+        """
+        :param shared_workers: drive the I/O of all the links by one LinkWorkerPool, otherwise every link runs its
+        own sending and receiving threads
+        :param send_workers: send threads of the pool
+        :param poll_interval: seconds between two reads of the POLL links in the pool
+        """
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self._worker_pool = LinkWorkerPool(send_workers, poll_interval) if shared_workers else None
+        self._links: Dict[str, AtomProtocols] = {}
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def __len__(self):
+        return len(self._links)
+
+    def __contains__(self, name):
+        return name in self._links
+
+    def __getitem__(self, name) -> AtomProtocols:
+        return self._links[name]
+
+    def __iter__(self):
+        return iter(list(self._links))
+
+    @property
+    def worker_pool(self) -> LinkWorkerPool | None:
+        return self._worker_pool
+
+    def open_link(self, name: str, send_interface: Callable, receive_interface: Callable = None,
+                  **kwargs) -> AtomProtocols:
+        """
+        Open a new independent link
+        :param name: name of the link, unique in the manager
+        :param send_interface: see AtomProtocols
+        :param receive_interface: see AtomProtocols
+        :param kwargs: other AtomProtocols arguments
+        :return: the link
+        """
+        with self._lock:
+            if name in self._links:
+                raise ValueError(f"The link {name} is already open")
+            link = AtomProtocols(send_interface, receive_interface, worker_pool=self._worker_pool, **kwargs)
+            self._links[name] = link
+        self.logger.info(f"Open the link {name}")
+        return link
+
+    def close_link(self, name: str) -> None:
+        with self._lock:
+            link = self._links.pop(name)
+        link.stop_receiving_thread()
+        link.stop_sending_thread()
+        self.logger.info(f"Close the link {name}")
+
+    def close(self) -> None:
+        """Close all the links and stop the pool"""
+        for name in list(self._links):
+            self.close_link(name)
+        if self._worker_pool is not None:
+            self._worker_pool.stop()
+            self._worker_pool = None
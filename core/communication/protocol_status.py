@@ -0,0 +1,59 @@
+"""
+Status, direction, sys cmd and frame length constants shared by the AtomProtocols modules
+"""
+
+from enum import Enum, auto
+
+
+class ProtocolStatus:
+    p_ture = 1
+    p_false = 0
+    p_error = -1
+
+    class DecodeErrorType:
+        no_error = 0
+        header_error = -1
+        seq_error = -2
+        uuid_error = -3
+        package_num_error = -4
+        data_num_per_error = -5
+        vpp_error = -6  # crc16
+        cmd_error = -7
+
+    class Functions(Enum):
+        SPP = 0x10
+        STEAM = 0x20
+        RADIO = 0x30
+        VIDEO = 0x40
+
+    class Direction:
+        send_start = 0x00
+        send_end = 0x7F
+        send_need_none_feedback = 0x00
+        send_need_sync_feedback = 0x10
+        receive_start = 0x80
+        receive_end = 0xFF
+
+    class ReceiveMode(Enum):
+        POLL = auto()  # the receiving thread calls receive_interface in a loop
+        PUSH = auto()  # the transport pushes the received data by feed_data, no receiving thread
+        SELECT = auto()  # the receiving thread waits on receive_fileno and reads only when it is readable
+
+    class SeqSysCMD:
+        class SPP(Enum):
+            send_cmd_None = auto()
+            send_authentication = auto()
+            send_total_info = auto()
+            send_lost_package = auto()
+            send_wrong_data = auto()
+
+    class ProtocolsLength:
+        header_length = 4
+        seq_length = 2
+        uuid_length = 2
+        package_num_length = 4
+        data_num_per_package_length = 2
+        vpp_length = 2  # crc16
+        cmd_length = 2
+        total_crc_length = header_length + seq_length + uuid_length + package_num_length + data_num_per_package_length + vpp_length
+        total_length = header_length + seq_length + uuid_length + package_num_length + data_num_per_package_length + vpp_length + cmd_length
@@ -0,0 +1,273 @@
+"""
+Reassembly of the multi-package SPP messages.
+
+Every message (uuid) has one buffer which is preallocated from the total info (send_total_info) when it is known.
+A package is copied to (package_num - 1) * package_split_num, so the packages could arrive in any order, the
+received packages are marked in a bitmap. Without the total info the buffer grows, the first package shorter than
+package_split_num is the last one of the message.
+Completed messages are moved to a FIFO ready queue, get is O(1). The uuids of the recently completed messages are
+kept with their encoded replies, so a late resent package does not open a new message and a resent request could get
+its reply again.
+The package num and the total info come from the wire unchecked by the crc, a package num out of 1..total_package
+(1..max_package before the total info is known) is refused, the frame is dropped instead of growing the buffer.
+"""
+
+from collections import OrderedDict, deque
+from typing import Dict, List, Tuple
+
+
+class ReassemblyBuffer:
+    __slots__ = ("uuid", "seq", "cmd", "total_package", "total_data", "data", "bitmap", "received_package",
+                 "highest_package", "reported")
+
+    def __init__(self, uuid: int):
+        self.uuid = uuid
+        self.seq = None
+        self.cmd = None
+        self.total_package = None
+        self.total_data = None
+        self.data = bytearray()
+        # One byte per package, 1 when the package is received
+        self.bitmap = bytearray()
+        self.received_package = 0
+        self.highest_package = 0
+        # Lost packages which are already reported to the sender
+        self.reported = set()
+
+    def set_total(self, total_package: int, total_data: int) -> None:
+        self.total_package = total_package
+        self.total_data = total_data
+        if len(self.bitmap) > total_package:
+            # Packages placed after the end of the message, before its total info came
+            self.received_package -= sum(self.bitmap[total_package:])
+            del self.bitmap[total_package:]
+            self.highest_package = min(self.highest_package, total_package)
+            self.reported = {num for num in self.reported if num <= total_package}
+        if len(self.data) < total_data:
+            self.data.extend(bytes(total_data - len(self.data)))
+        if len(self.bitmap) < total_package:
+            self.bitmap.extend(bytes(total_package - len(self.bitmap)))
+
+    def place(self, package_num: int, data, package_split_num: int) -> bool:
+        """
+        :return: False if the package is already received
+        """
+        if package_num <= len(self.bitmap) and self.bitmap[package_num - 1]:
+            return False
+        if package_num > len(self.bitmap):
+            self.bitmap.extend(bytes(package_num - len(self.bitmap)))
+        start = (package_num - 1) * package_split_num
+        end = start + len(data)
+        if end > len(self.data):
+            self.data.extend(bytes(end - len(self.data)))
+        self.data[start:end] = data
+        self.bitmap[package_num - 1] = 1
+        self.received_package += 1
+        self.highest_package = max(self.highest_package, package_num)
+        self.reported.discard(package_num)
+        if self.total_package is None and len(data) < package_split_num:
+            # A short package must be the last one
+            self.set_total(package_num, end)
+        return True
+
+    def missing(self, up_to: int) -> List[int]:
+        """Package numbers after the highest received one and before up_to, which are not reported yet"""
+        return [num for num in range(self.highest_package + 1, up_to)
+                if not (num <= len(self.bitmap) and self.bitmap[num - 1]) and num not in self.reported]
+
+    @property
+    def complete(self) -> bool:
+        return self.total_package is not None and self.received_package >= self.total_package
+
+
+class ReassemblyIndex:
+    def __init__(self, package_split_num: int, max_length: int = 0xFFFF, completed_length: int = 0x100,
+                 max_package: int = 0xFFFF):
+        """
+        :param package_split_num: max data length of one package
+        :param max_length: max messages kept (incomplete and ready each), the oldest one is dropped
+        :param completed_length: recently completed uuids kept to ignore their late packages. A resent message is
+        recognised while fewer newer messages complete, and the uuids are 16 bits, so a sender reuses one only after
+        going through the others. It should cover the messages of the sender's retry time and stay well below 0xFFFF
+        :param max_package: max packages of one message, larger package nums and total infos are refused
+        """
+        self._package_split_num = package_split_num
+        self._max_length = max_length
+        self._max_package = max_package
+        self._completed_length = completed_length
+        # uuid -> encoded reply, None until it is replied
+        self._completed: OrderedDict[int, list | None] = OrderedDict()
+        self._incomplete: OrderedDict[int, ReassemblyBuffer] = OrderedDict()
+        self._ready: deque = deque()
+        self._ready_messages: Dict[int, dict] = {}
+        self.dropped_messages = 0
+
+    def __len__(self):
+        return len(self._incomplete) + len(self._ready_messages)
+
+    def __contains__(self, uuid):
+        return uuid in self._ready_messages or uuid in self._incomplete
+
+    def __getitem__(self, uuid) -> dict:
+        """The ready message, or the received part of an incomplete message"""
+        if uuid in self._ready_messages:
+            return self._ready_messages[uuid]
+        buffer = self._incomplete[uuid]
+        return {"seq": buffer.seq, "cmd": buffer.cmd, "data": buffer.data,
+                "total_package": buffer.total_package, "total_data": buffer.total_data}
+
+    @property
+    def package_split_num(self) -> int:
+        return self._package_split_num
+
+    @package_split_num.setter
+    def package_split_num(self, value: int):
+        self._package_split_num = value
+
+    @property
+    def ready_length(self) -> int:
+        return len(self._ready)
+
+    def is_completed(self, uuid: int) -> bool:
+        """The message of the uuid is completed recently, its packages are repeated ones"""
+        return uuid in self._completed
+
+    def set_reply(self, uuid: int, reply: list) -> None:
+        """Keep the encoded reply of a completed message, it is sent again when the message is resent"""
+        if uuid in self._completed:
+            self._completed[uuid] = reply
+
+    def completed_reply(self, uuid: int) -> list | None:
+        """The reply of a recently completed message, None if it is not replied (or not completed)"""
+        return self._completed.get(uuid)
+
+    def forget_completed(self, uuid: int = None) -> None:
+        """Forget a completed uuid (or all of them) which is used again for a new message"""
+        if uuid is None:
+            self._completed.clear()
+        else:
+            self._completed.pop(uuid, None)
+
+    def buffer(self, uuid: int) -> ReassemblyBuffer:
+        """The buffer of the uuid, created when it does not exist"""
+        buffer = self._incomplete.get(uuid)
+        if buffer is None:
+            buffer = ReassemblyBuffer(uuid)
+            self._incomplete[uuid] = buffer
+            while len(self._incomplete) > self._max_length:
+                # If over the max length, lost the oldest data
+                self._incomplete.popitem(last=False)
+                self.dropped_messages += 1
+        return buffer
+
+    def set_total(self, uuid: int, total_package: int, total_data: int) -> bool:
+        """
+        :return: False if the total package is out of 1..max_package
+        """
+        if not 1 <= total_package <= self._max_package:
+            return False
+        if uuid in self._completed:
+            # Late total info of a completed message
+            return True
+        buffer = self.buffer(uuid)
+        buffer.set_total(total_package, total_data)
+        self._check_complete(buffer)
+        return True
+
+    def is_valid_package_num(self, uuid: int, package_num: int) -> bool:
+        """The package num is in 1..total_package of the message, or 1..max_package before the total is known"""
+        if package_num < 1:
+            return False
+        buffer = self._incomplete.get(uuid)
+        if buffer is not None and buffer.total_package is not None:
+            return package_num <= buffer.total_package
+        return package_num <= self._max_package
+
+    def place(self, uuid: int, seq, cmd, package_num: int, data) -> Tuple[bool | None, List[int]]:
+        """
+        :return: (False if the package is repeated, None if its package num is not valid and it is dropped,
+        lost package numbers before this package to report)
+        """
+        if uuid in self._completed:
+            return False, []
+        if not self.is_valid_package_num(uuid, package_num):
+            return None, []
+        buffer = self.buffer(uuid)
+        if buffer.seq is None:
+            buffer.seq = seq
+            buffer.cmd = cmd
+        lost = []
+        if package_num > buffer.highest_package + 1:
+            lost = buffer.missing(package_num)
+            buffer.reported.update(lost)
+        placed = buffer.place(package_num, data, self._package_split_num)
+        if placed:
+            self._check_complete(buffer)
+        return placed, lost
+
+    def _check_complete(self, buffer: ReassemblyBuffer) -> None:
+        if not buffer.complete:
+            return None
+        del self._incomplete[buffer.uuid]
+        # Drop the tail of a grown buffer
+        del buffer.data[buffer.total_data:]
+        self._ready_messages[buffer.uuid] = {"seq": buffer.seq, "cmd": buffer.cmd, "data": buffer.data,
+                                             "total_package": buffer.total_package,
+                                             "total_data": buffer.total_data}
+        self._ready.append(buffer.uuid)
+        self._completed[buffer.uuid] = None
+        while len(self._completed) > self._completed_length:
+            self._completed.popitem(last=False)
+        while len(self._ready) > self._max_length:
+            self._ready_messages.pop(self._ready.popleft())
+            self.dropped_messages += 1
+        return None
+
+    def is_ready(self, uuid: int) -> bool:
+        return uuid in self._ready_messages
+
+    def pop(self, uuid: int) -> dict:
+        """Take the ready message of the uuid out of the ready queue"""
+        self._ready.remove(uuid)
+        return self._ready_messages.pop(uuid)
+
+    def get(self) -> Tuple[int, dict] | None:
+        """Oldest completed message (uuid, {"seq", "cmd", "data", "total_package", "total_data"}) or None"""
+        if not self._ready:
+            return None
+        uuid = self._ready.popleft()
+        return uuid, self._ready_messages.pop(uuid)
+
+    def clear(self) -> None:
+        self._incomplete.clear()
+        self._ready.clear()
+        self._ready_messages.clear()
+        self._completed.clear()
+
+    @staticmethod
+    def check(package_split_num: int = 4):
+        """Package nums out of the message are dropped, they must neither raise nor complete a message"""
+        index = ReassemblyIndex(package_split_num)
+        print(f"package num 0 dropped: {index.place(1, 1, 0, 0, b'abcd') == (None, []) and len(index) == 0}")
+        print(f"package num over max_package dropped: "
+              f"{index.place(1, 1, 0, 0x10000, b'abcd') == (None, []) and len(index) == 0}")
+        index.set_total(2, 2, 8)
+        dropped = index.place(2, 1, 0, 3, b"zzzz") == (None, [])
+        index.place(2, 1, 0, 1, b"abcd")
+        print(f"package num over total_package dropped: {dropped and not index.is_ready(2)}")
+        index.place(2, 1, 0, 2, b"efgh")
+        ready = index.get()
+        print(f"message completed with its own packages: {ready is not None and ready[1]['data'] == b'abcdefgh'}")
+        index.set_reply(2, [b"reply"])
+        print(f"repeated package of a completed message keeps its reply: "
+              f"{index.place(2, 1, 0, 1, b'abcd')[0] is False and index.completed_reply(2) == [b'reply']}")
+        index.forget_completed()
+        print(f"forgotten uuid opens a new message: {index.place(2, 1, 0, 1, b'ab')[0] and index.is_ready(2)}")
+        index.place(3, 1, 0, 5, b"zzzz")
+        index.set_total(3, 2, 8)
+        index.place(3, 1, 0, 1, b"abcd")
+        print(f"package placed before a smaller total info not counted: {not index.is_ready(3)}")
+
+
+if __name__ == "__main__":
+    ReassemblyIndex.check()
@@ -0,0 +1,354 @@
+"""
+SPP logic of the AtomProtocols shared by the threaded (AtomProtocols) and the asyncio (AsyncAtomProtocols) links.
+
+SppProtocolMixin keeps everything which does not depend on the transport: the uuids, the encoding of the messages,
+the total info, the replies and the authentication, the retransmit cache, the lost / wrong package reports and the
+decoding of one frame up to the reassembly. The link class only moves the encoded frames:
+
+- _send_boosted(datas, block): send the frames before the queued user data (resent packages, reports, replies)
+- _to_user_message(message): the received message in the data types of the link's users
+- _on_authentication_reply(): called after the sender authentication status is set by the reply
+"""
+
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import List, Tuple
+from communication.frame_codec import FrameCodec, calculate_crc16
+from communication.flow_control import InFlightWindow
+from communication.reassembly import ReassemblyIndex
+from communication.protocol_status import ProtocolStatus
+from AtomEncryption import atom_Hash
+
+
+class SppProtocolMixin:
+    def _init_spp(self, header: Tuple[int], package_length: int, function: ProtocolStatus.Functions,
+                  authentication_info: str, reply_window: int, reply_timeout: float, reply_retries: int) -> None:
+        """The protocol state, called by the __init__ of the link before its threads or tasks start"""
+        self._header = header
+        self._package_length = package_length
+        self._function = function
+        self._authentication_info = authentication_info
+        self._codec = FrameCodec(header, package_length)
+        self._package_split_num = self._codec.package_split_num
+
+        # Flags
+        self._authentication_status_sender = False
+        self._authentication_status_receiver = False
+
+        # Sender
+        # This window is used for store the send data with uuid those data need a reply
+        # The uuid is removed when the reply comes or it fails after the retries
+        self._reply_data_stack = InFlightWindow(reply_window, reply_timeout, reply_retries)
+        self._max_reply_data_stack_length = 0xFFFF
+        self._package_uuid = 0x00
+        self._uuid_lock = threading.Lock()
+        # Encoded packages of the last messages, used to resend the lost or wrong packages reported by the receiver
+        # key: (direction, uuid)
+        self._retransmit_cache: OrderedDict[Tuple[int, int], List[memoryview]] = OrderedDict()
+        self._max_retransmit_cache_length = 0x40
+        self._retransmit_lock = threading.Lock()
+
+        # Receiver
+        # Max package numbers reported in one lost package feedback, the rest are reported by the next gaps
+        self._max_lost_package_report_length = 0x20
+        # Received messages by uuid, completed messages wait in its ready queue
+        self._max_decode_data_stack_length = 0xFFFF
+        # A resent request is recognised (and gets its reply again) until this many newer messages complete, 30 s of
+        # messages at 500 Hz against the 15 s of the default retries, while a uuid comes back only after the peer went
+        # through the other 0xFFFE ones. A peer which starts again authenticates first, its old uuids are forgotten
+        self._max_completed_length = 0x4000
+        self._decode_data_stack = ReassemblyIndex(self._package_split_num, self._max_decode_data_stack_length,
+                                                  self._max_completed_length)
+        # Received replies of the send_need_sync_feedback messages, they use the uuid of our own messages
+        self._reply_reassembly = ReassemblyIndex(self._package_split_num, self._max_decode_data_stack_length)
+
+    @property
+    def package_length(self):
+        return self._package_length
+
+    @package_length.setter
+    def package_length(self, value):
+        self._codec.package_length = value
+        self._package_length = value
+        self._package_split_num = self._codec.package_split_num
+        self._decode_data_stack.package_split_num = self._package_split_num
+        self._reply_reassembly.package_split_num = self._package_split_num
+
+    @property
+    def reply_data_stack(self):
+        return self._reply_data_stack
+
+    @property
+    def decode_data_stack(self):
+        return self._decode_data_stack
+
+    @property
+    def function(self):
+        return self._function
+
+    def _send_boosted(self, datas: List[memoryview], block: bool) -> None:
+        raise NotImplementedError
+
+    def _to_user_message(self, message: dict) -> dict:
+        raise NotImplementedError
+
+    def _on_authentication_reply(self) -> None:
+        pass
+
+    #########################################
+    # Sender
+    def _next_uuid(self) -> int:
+        with self._uuid_lock:
+            while True:
+                if self._package_uuid >= self._max_reply_data_stack_length:
+                    self._package_uuid = 0x00
+                self._package_uuid = self._package_uuid + 1
+                # Skip the uuid which still waits for the reply
+                if self._package_uuid not in self._reply_data_stack:
+                    return self._package_uuid
+
+    def _encode_basic(self, seq: List[int], cmd, data, uuid: int = None) -> List[memoryview]:
+        uuid_temp = uuid if uuid is not None else self._next_uuid()
+        datas = self._codec.encode(seq, uuid_temp, cmd, data)
+        if (seq[0] & 0x0F) == ProtocolStatus.SeqSysCMD.SPP.send_cmd_None.value:
+            self._cache_retransmit(seq[0] & 0xF0, uuid_temp, datas)
+            if len(data) >= self._package_split_num:
+                # The receiver could not find the last package by its length, tell it the total info first
+                return self._init_send_total_info(seq[0] & 0xF0, uuid_temp, len(data)) + datas
+        return datas
+
+    def _encode_data(self, cmd, data, feedback_status: int, send_seq_user_cmd: int) -> List[memoryview]:
+        return self._encode_basic(seq=[feedback_status | ProtocolStatus.SeqSysCMD.SPP.send_cmd_None.value,
+                                       send_seq_user_cmd | self._function.value],
+                                  cmd=cmd,
+                                  data=data)
+
+    def _encode_request(self, cmd, data, send_seq_user_cmd: int) -> Tuple[int, List[memoryview], Future]:
+        """
+        Encode a send_need_sync_feedback message and add it to the reply window
+        The place of the window must be acquired before, it is released if the encoding fails
+        :return: (uuid, encoded packages, future resolved with the reply)
+        """
+        seq = [ProtocolStatus.Direction.send_need_sync_feedback | ProtocolStatus.SeqSysCMD.SPP.send_cmd_None.value,
+               send_seq_user_cmd | self._function.value]
+        try:
+            uuid = self._next_uuid()
+            # The uuid is used again after the wrap, the reply of its last use must not drop the new one
+            self._reply_reassembly.forget_completed(uuid)
+            datas = self._encode_basic(seq=seq, cmd=cmd, data=data, uuid=uuid)
+        except Exception:
+            # A bad cmd or data must not keep the place, the window would fill up with them
+            self._reply_data_stack.release()
+            raise
+        return uuid, datas, self._reply_data_stack.add(uuid, {"seq": seq, "cmd": cmd, "data": data}, datas)
+
+    def _encode_reply(self, uuid: int, seq, cmd, data) -> List[memoryview]:
+        """Encode the reply of the received message with the uuid and the seq"""
+        feedback_status = seq[0] & 0xF0
+        if feedback_status < 0x80:
+            feedback_status = feedback_status | 0x80
+        datas = self._encode_basic(seq=[feedback_status | (seq[0] & 0x0F), seq[1]], cmd=cmd, data=data, uuid=uuid)
+        # Sent again if the request comes again, its sender lost this reply
+        self._decode_data_stack.set_reply(uuid, datas)
+        return datas
+
+    def _encode_authentication(self) -> List[memoryview]:
+        seq = [ProtocolStatus.Direction.send_need_sync_feedback |
+               ProtocolStatus.SeqSysCMD.SPP.send_authentication.value,
+               0x00 | self._function.value]
+        return self._encode_basic(seq=seq,
+                                  cmd=[0xFF, 0xFF],
+                                  data=bytes.fromhex(atom_Hash.hash_data(self._authentication_info, "sha256")))
+
+    def _init_send_total_info(self, direction: int, uuid: int, data_length: int) -> List[memoryview]:
+        """
+        Encode the total info of a message, it is sent before the packages with the same uuid
+        The reply bit of the direction tells the receiver it belongs to a reply
+        :return: encoded total info packages
+        """
+        total_packages = self._codec.package_count(data_length)
+        seq = [(direction & ProtocolStatus.Direction.receive_start) |
+               ProtocolStatus.Direction.send_need_none_feedback |
+               ProtocolStatus.SeqSysCMD.SPP.send_total_info.value,
+               0x00 | self._function.value]
+        return self._codec.encode(seq, uuid, [0xFF, 0xFF],
+                                  total_packages.to_bytes(4, "big") + data_length.to_bytes(4, "big"))
+
+    def _cache_retransmit(self, direction: int, uuid: int, datas: List[memoryview]) -> None:
+        with self._retransmit_lock:
+            self._retransmit_cache[(direction, uuid)] = datas
+            self._retransmit_cache.move_to_end((direction, uuid))
+            while len(self._retransmit_cache) > self._max_retransmit_cache_length:
+                # Lost the oldest message
+                self._retransmit_cache.popitem(last=False)
+
+    def _retransmit(self, uuid: int, data) -> None:
+        """
+        Resend the packages reported by the receiver
+        :param uuid: uuid of the reported message
+        :param data: direction of the reported message (1 byte) + package numbers (4 bytes each)
+        """
+        if len(data) < 1:
+            return None
+        with self._retransmit_lock:
+            datas = self._retransmit_cache.get((data[0], uuid))
+        if datas is None:
+            self.logger.warning(f"Can not resend the message {uuid}, it is not in the retransmit cache")
+            return None
+        resend = []
+        for i in range(1, len(data) - 3, 4):
+            package_num = int.from_bytes(data[i:i + 4], "big")
+            if 1 <= package_num <= len(datas):
+                resend.append(datas[package_num - 1])
+        # Never block the receiving side, if the queue is full the receiver will report again
+        self._send_boosted(resend, block=False)
+
+    def _send_package_report(self, uuid: int, seq, sys_cmd: ProtocolStatus.SeqSysCMD.SPP,
+                             package_nums: List[int]) -> None:
+        """
+        Ask the sender to resend some packages of a message
+        :param uuid: uuid of the message
+        :param seq: seq of the message
+        :param sys_cmd: send_lost_package / send_wrong_data
+        :param package_nums: package numbers to resend
+        """
+        package_nums = package_nums[:self._max_lost_package_report_length]
+        # Every report must fit in one package, it is handled package by package
+        step = max(1, (self._package_split_num - 1) // 4)
+        datas = []
+        for i in range(0, len(package_nums), step):
+            data = bytearray([seq[0] & 0xF0])
+            for package_num in package_nums[i:i + step]:
+                data += package_num.to_bytes(4, "big")
+            datas += self._codec.encode([ProtocolStatus.Direction.send_need_none_feedback | sys_cmd.value,
+                                         self._function.value],
+                                        uuid, [0xFF, 0xFF], data)
+        self._send_boosted(datas, block=False)
+
+    #########################################
+    # Receiver
+    def _decode_spp(self, data) -> int:
+        """
+        Decode one SPP frame, handle its seq sys cmd or place it in the reassembly
+        :return: ProtocolStatus.DecodeErrorType
+        """
+        if not isinstance(data, (bytes, bytearray, memoryview)):
+            data = bytes(data)
+        frame = self._codec.decode(data)
+        if isinstance(frame, int):
+            return frame
+        uuid = frame.uuid
+        seq = frame.seq
+
+        # CRC test, the header fields are trusted so the user package could be asked again
+        if frame.vpp != calculate_crc16(frame.cmd, frame.data):
+            if (seq[0] & 0x0F) == ProtocolStatus.SeqSysCMD.SPP.send_cmd_None.value:
+                self._send_package_report(uuid, seq, ProtocolStatus.SeqSysCMD.SPP.send_wrong_data,
+                                          [frame.package_num])
+            return ProtocolStatus.DecodeErrorType.vpp_error
+
+        # Seq handler, focus on the seq sys cmd
+        if self._seq_handler(uuid, seq, frame.data):
+            return ProtocolStatus.DecodeErrorType.no_error
+
+        # Add data, the package is placed by its package num so it could come in any order
+        reply = bool(seq[0] & ProtocolStatus.Direction.receive_start)
+        reassembly = self._reply_reassembly if reply else self._decode_data_stack
+        placed, lost = reassembly.place(uuid, seq, frame.cmd, frame.package_num, frame.data)
+        if placed is None:
+            # Out of the message, drop the frame
+            return ProtocolStatus.DecodeErrorType.package_num_error
+        if placed is False and not reply and reassembly.is_completed(uuid):
+            self._resend_reply(uuid, seq, frame.package_num)
+        if reply and reassembly.is_ready(uuid):
+            self._receive_reply(uuid, reassembly.pop(uuid))
+        if lost:
+            # A gap is reported to the sender and filled when the packages are resent
+            self._send_package_report(uuid, seq, ProtocolStatus.SeqSysCMD.SPP.send_lost_package, lost)
+            return ProtocolStatus.DecodeErrorType.package_num_error
+        return ProtocolStatus.DecodeErrorType.no_error
+
+    def _resend_reply(self, uuid: int, seq, package_num: int) -> None:
+        """A package of a completed message comes again, a request is resent when its sender lost the reply"""
+        # Once per resent request, by its first package
+        if package_num != 1 or (seq[0] & 0xF0) != ProtocolStatus.Direction.send_need_sync_feedback:
+            return None
+        datas = self._decode_data_stack.completed_reply(uuid)
+        if datas is None:
+            # Not replied yet, the reply goes out when the user sends it
+            return None
+        self.logger.debug(f"The request {uuid} is resent, send its reply again")
+        self._send_boosted(datas, block=False)
+
+    def _seq_handler(self, uuid: int, seq, data) -> bool:
+        """
+        :return: True if the frame is a system message which is handled here, False if it is user data
+        """
+        seq_data_direction = seq[0] & 0xF0
+        seq_sys_cmd = seq[0] & 0x0F
+        # Receive the send data and so some (Receiver)
+        if seq_data_direction <= ProtocolStatus.Direction.send_end:
+            match seq_sys_cmd:
+                case ProtocolStatus.SeqSysCMD.SPP.send_authentication.value:
+                    # reply inside the function
+                    self._init_authentication_receive(uuid, seq, data)
+                    return True
+                case ProtocolStatus.SeqSysCMD.SPP.send_total_info.value:
+                    self._init_receive_total_info(self._decode_data_stack, uuid, data)
+                    # no reply
+                    return True
+                case ProtocolStatus.SeqSysCMD.SPP.send_wrong_data.value | \
+                        ProtocolStatus.SeqSysCMD.SPP.send_lost_package.value:
+                    # Resend the wrong or lost data packages
+                    self._retransmit(uuid, data)
+                    return True
+                case _:
+                    return False
+        # Receive the reply data (Sender), it is reassembled in _decode_spp which pops the sender stack
+        match seq_sys_cmd:
+            case ProtocolStatus.SeqSysCMD.SPP.send_cmd_None.value:
+                return False
+            case ProtocolStatus.SeqSysCMD.SPP.send_authentication.value:
+                self._authentication_status_sender = bool(int.from_bytes(data, "big"))
+                self.logger.info("Success authentication" if self._authentication_status_sender
+                                 else "Authentication is refused")
+                self._on_authentication_reply()
+                return True
+            case ProtocolStatus.SeqSysCMD.SPP.send_total_info.value:
+                # Total info of a reply
+                self._init_receive_total_info(self._reply_reassembly, uuid, data)
+                return True
+            case _:
+                # Reports are never sent as replies, drop them
+                return True
+
+    def _init_authentication_receive(self, uuid: int, seq, data) -> None:
+        if data == bytes.fromhex(atom_Hash.hash_data(self._authentication_info, "sha256")):
+            self._authentication_status_receiver = True
+            # The peer authenticates once per start and its uuids start again from 1, the completed uuids of its last
+            # run must not drop its new messages
+            self._decode_data_stack.forget_completed()
+        else:
+            self.logger.warning("Wrong authentication data")
+        # Internal replies go before the user data
+        self._send_boosted(self._encode_reply(uuid, seq, [0xFF, 0xFF], [int(self._authentication_status_receiver)]),
+                           block=True)
+
+    def _init_receive_total_info(self, reassembly: ReassemblyIndex, uuid: int, data) -> None:
+        # total package (4 bytes) + total data (4 bytes), then preallocate the message buffer
+        if len(data) < 8:
+            self.logger.warning("Wrong total info")
+            return None
+        total_package = int.from_bytes(data[0:4], "big")
+        total_data = int.from_bytes(data[4:8], "big")
+        if total_package != self._codec.package_count(total_data) or \
+                not reassembly.set_total(uuid, total_package, total_data):
+            self.logger.warning("Wrong total info")
+        return None
+
+    def _receive_reply(self, uuid: int, message: dict) -> None:
+        # Pop the sender stack, the reply of a send_need_none_feedback message has nobody waiting
+        if (message["seq"][0] & 0xF0) == (ProtocolStatus.Direction.send_need_sync_feedback |
+                                          ProtocolStatus.Direction.receive_start):
+            self._reply_data_stack.complete(uuid, self._to_user_message(message))
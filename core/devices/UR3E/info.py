@@ -1,10 +1,14 @@
-from devices.configuration import StableArmParam, DynamicArmParam
+from devices.configuration import StableArmParam, DynamicArmParam, DHParam
 from devices.configuration import RoboticArmConfig
 
-armBone_stable_ur3e = StableArmParam(151.8, 243.5, 213.2)
+# mm, d1, -a2, -a3, d4, d5, d6 of the UR3e DH parameters published by Universal Robots
+# (d1 = 0.15185 m, a2 = -0.24355 m, a3 = -0.2132 m, d4 = 0.13105 m, d5 = 0.08535 m, d6 = 0.0921 m)
+armBone_stable_ur3e = StableArmParam(151.85, 243.55, 213.2, 131.05, 85.35, 92.1)
 armBone_dynamic_ur3e = DynamicArmParam(joint_angle_list=[1, 23, 4, 5, 6, 7])
+armDH_ur3e = DHParam.from_ur_bones(armBone_stable_ur3e)
 
 config = RoboticArmConfig(
     armStableParam=armBone_stable_ur3e,
-    armDynamicParam=armBone_dynamic_ur3e
+    armDynamicParam=armBone_dynamic_ur3e,
+    armDHParam=armDH_ur3e
 )
@@ -1,2 +1,3 @@
-from .arm_param import StableArmParam, DynamicArmParam
+from .arm_param import StableArmParam, DynamicArmParam, DHParam
+from .joint_state import JointState, JointStateHistory
 from .robotic_arm_config import RoboticArmConfig
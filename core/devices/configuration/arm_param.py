@@ -1,9 +1,10 @@
 from dataclasses import dataclass, field
-from turtle import position
-from typing import List
+from typing import List, Tuple
+import numpy as np
+from .joint_state import JointState
 
 
-@dataclass(frozen=True)
+@dataclass(frozen=True, slots=True)
 class StableArmParam:
     bone_branch1: float = 0.0
     bone_branch2: float = 0.0
@@ -11,9 +12,12 @@ class StableArmParam:
     bone_branch4: float = 0.0
     bone_small: float = 0.0
     bone_end: float = 0.0
+    # The bones do not change, the tuple is built once
+    _bone_lengths: tuple = field(init=False, repr=False, compare=False)
 
     def __post_init__(self):
-        pass
+        object.__setattr__(self, "_bone_lengths", (self.bone_branch1, self.bone_branch2, self.bone_branch3,
+                                                   self.bone_branch4, self.bone_small, self.bone_end))
 
     def __repr__(self) -> str:
         return f"bone_branch1:{self.bone_branch1}\n" \
@@ -25,27 +29,94 @@ class StableArmParam:
 
     @property
     def bone_lengths_list(self):
-        return self.bone_branch1, self.bone_branch2, self.bone_branch3, \
-            self.bone_branch4, self.bone_small, self.bone_end
+        return self._bone_lengths
 
 
-@dataclass
-class DynamicArmParam:
-    # J1,J2,J3,J4,J5,J6 or more DOF
-    joint_angle_list: List[int]
+@dataclass(frozen=True, slots=True)
+class DHParam:
+    """
+    Standard Denavit-Hartenberg parameters, one value per joint
+    T_i = Rz(theta_i + theta_offset_i) @ Tz(d_i) @ Tx(a_i) @ Rx(alpha_i)
+    :param d: offsets along the previous z, same unit as the bones (mm)
+    :param a: lengths along the new x
+    :param alpha: twists around the new x in degrees
+    :param theta_offset: joint zero offsets in degrees
+    """
+    d: Tuple[float, ...]
+    a: Tuple[float, ...]
+    alpha: Tuple[float, ...]
+    theta_offset: Tuple[float, ...] = ()
 
     def __post_init__(self):
-        pass
+        if not self.theta_offset:
+            object.__setattr__(self, "theta_offset", (0.0,) * len(self.d))
+        if not len(self.d) == len(self.a) == len(self.alpha) == len(self.theta_offset):
+            raise ValueError("d, a, alpha and theta_offset must have one value per joint")
+
+    @property
+    def joints_num(self) -> int:
+        return len(self.d)
+
+    @classmethod
+    def from_ur_bones(cls, stable_param: StableArmParam) -> "DHParam":
+        """
+        DH parameters of the UR arms (UR3/UR5/UR10 and e-Series) from their bones:
+        d1 = bone_branch1, a2 = -bone_branch2, a3 = -bone_branch3, d4 = bone_branch4, d5 = bone_small, d6 = bone_end
+        """
+        return cls(d=(stable_param.bone_branch1, 0.0, 0.0, stable_param.bone_branch4, stable_param.bone_small,
+                      stable_param.bone_end),
+                   a=(0.0, -stable_param.bone_branch2, -stable_param.bone_branch3, 0.0, 0.0, 0.0),
+                   alpha=(90.0, 0.0, 0.0, 90.0, -90.0, 0.0))
+
+
+class DynamicArmParam:
+    """
+    The joint angles are the position of a JointState, float64 and updated in place, the state also has the velocity,
+    the torque and the time stamp
+    """
+    __slots__ = ("state",)
+
+    def __init__(self, joint_angle_list: List[float] = None, state: JointState = None):
+        """
+        :param joint_angle_list: J1,J2,J3,J4,J5,J6 or more DOF
+        :param state: JointState to use without a copy, e.g. a view into a shared buffer
+        """
+        if state is None:
+            if joint_angle_list is None:
+                raise ValueError("joint_angle_list or state is needed")
+            state = JointState(len(joint_angle_list))
+        if joint_angle_list is not None:
+            state.position[:] = joint_angle_list
+        self.state = state
 
     def __repr__(self) -> str:
-        return f"joint_angle_list:{self.joint_angle_list}"
+        return f"joint_angle_list:{self.state.position.tolist()}"
+
+    def __eq__(self, other):
+        if not isinstance(other, DynamicArmParam):
+            return NotImplemented
+        return np.array_equal(self.state.position, other.state.position)
+
+    __hash__ = None
+
+    @property
+    def joint_angle_list(self) -> Tuple[float, ...]:
+        """
+        A copy of the joint angles, a tuple so an item assignment fails instead of changing only the copy.
+        Assign the whole list here, or change joint_angle (the array without a copy) in place.
+        """
+        return tuple(self.state.position.tolist())
+
+    @joint_angle_list.setter
+    def joint_angle_list(self, update_list):
+        self.state.position[:] = update_list
 
     @property
     def joint_angle(self):
-        """This could change the list and certain data"""
-        return self.joint_angle_list
+        """This could change the certain data: the position array of the state, a view"""
+        return self.state.position
 
     @joint_angle.setter
     def joint_angle(self, update_list):
-        """This could change the list and certain data"""
-        self.joint_angle_list = update_list
+        """This could change the certain data, written in place"""
+        self.state.position[:] = update_list
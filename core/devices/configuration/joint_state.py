@@ -0,0 +1,209 @@
+"""
+Joint state of the arm (position, velocity, torque and the time stamp) in one float64 row, and a ring buffer of the
+last seconds of states.
+
+The row is [timestamp, position (J), velocity (J), torque (J)]. position, velocity and torque are views into it, so an
+update writes in place and a state could sit in any buffer without a copy: a row of a bigger array, a
+multiprocessing.shared_memory block or an mmap (JointState.from_buffer). The control loop keeps its objects and
+overwrites them instead of building new lists every tick.
+
+Example:
+    >>> state = JointState(6)
+    >>> state.update(position=[0, -90, 0, -90, 0, 0], velocity=np.zeros(6))  # in place, stamped with time.monotonic()
+    >>> state.position[2] += 1.0  # a view, also in place
+    >>> from multiprocessing import shared_memory
+    >>> shared = shared_memory.SharedMemory(create=True, size=JointState.nbytes_of(6))
+    >>> writer = JointState.from_buffer(shared.buf, joints_num=6)  # another process reads the same memory
+    >>> del writer  # the views must be gone before the block is closed
+    >>> shared.close()
+    >>> shared.unlink()
+    >>> history = JointStateHistory(duration=2.0, rate=500, joints_num=6)
+    >>> history.append(state)
+    >>> timestamps, positions, velocities, torques = history.last(0.5)
+"""
+
+import math
+import time
+import numpy as np
+
+
+class JointState:
+    __slots__ = ("joints_num", "data", "position", "velocity", "torque")
+
+    def __init__(self, joints_num: int = 6, data=None):
+        """
+        :param joints_num: number of joints
+        :param data: float64 array of 1 + 3 * joints_num values used without a copy, None to allocate one
+        """
+        self.joints_num = joints_num
+        if data is None:
+            data = np.zeros(self.size_of(joints_num))
+        elif not isinstance(data, np.ndarray) or data.dtype != np.float64 or data.shape != (self.size_of(joints_num),):
+            raise ValueError(f"data must be a float64 array of {self.size_of(joints_num)} values")
+        self.data = data
+        self.position = data[1:1 + joints_num]
+        self.velocity = data[1 + joints_num:1 + 2 * joints_num]
+        self.torque = data[1 + 2 * joints_num:]
+
+    @staticmethod
+    def size_of(joints_num: int) -> int:
+        return 1 + 3 * joints_num
+
+    @staticmethod
+    def nbytes_of(joints_num: int) -> int:
+        return 8 * JointState.size_of(joints_num)
+
+    @classmethod
+    def from_buffer(cls, buffer, offset: int = 0, joints_num: int = 6) -> "JointState":
+        """State on a writable bytes-like buffer (shared_memory.buf, mmap, bytearray), offset in bytes, no copy"""
+        return cls(joints_num, np.frombuffer(buffer, dtype=np.float64, count=cls.size_of(joints_num), offset=offset))
+
+    @property
+    def timestamp(self) -> float:
+        return float(self.data[0])
+
+    @timestamp.setter
+    def timestamp(self, value: float):
+        self.data[0] = value
+
+    def update(self, position=None, velocity=None, torque=None, timestamp: float = None) -> None:
+        """Write the given values in place, the time stamp is time.monotonic() by default"""
+        if position is not None:
+            self.position[:] = position
+        if velocity is not None:
+            self.velocity[:] = velocity
+        if torque is not None:
+            self.torque[:] = torque
+        self.data[0] = time.monotonic() if timestamp is None else timestamp
+
+    def copy_from(self, other: "JointState") -> None:
+        self.data[:] = other.data
+
+    def copy(self) -> "JointState":
+        return JointState(self.joints_num, self.data.copy())
+
+    def __repr__(self) -> str:
+        return f"timestamp:{self.timestamp}\n" \
+               f"position:{self.position.tolist()}\n" \
+               f"velocity:{self.velocity.tolist()}\n" \
+               f"torque:{self.torque.tolist()}"
+
+
+class JointStateHistory:
+    def __init__(self, duration: float, rate: float, joints_num: int = 6):
+        """
+        Ring buffer of the states of the last duration seconds
+        :param duration: seconds kept
+        :param rate: states per second, e.g. 500 for the control loop
+        """
+        self.joints_num = joints_num
+        self._capacity = max(int(math.ceil(duration * rate)), 1)
+        self._data = np.zeros((self._capacity, JointState.size_of(joints_num)))
+        self._index = 0
+        self._count = 0
+
+    def __len__(self):
+        return self._count
+
+    @property
+    def capacity(self) -> int:
+        return self._capacity
+
+    def clear(self) -> None:
+        self._index = 0
+        self._count = 0
+
+    def append(self, state: JointState) -> None:
+        """Copy one state (one row) into the ring"""
+        self._data[self._index] = state.data
+        self._index = (self._index + 1) % self._capacity
+        self._count = min(self._count + 1, self._capacity)
+
+    def append_values(self, timestamp: float, position, velocity=None, torque=None) -> None:
+        row = self._data[self._index]
+        row[0] = timestamp
+        joints_num = self.joints_num
+        row[1:1 + joints_num] = position
+        row[1 + joints_num:1 + 2 * joints_num] = 0.0 if velocity is None else velocity
+        row[1 + 2 * joints_num:] = 0.0 if torque is None else torque
+        self._index = (self._index + 1) % self._capacity
+        self._count = min(self._count + 1, self._capacity)
+
+    def latest(self) -> JointState:
+        """View of the newest state in the ring, it is overwritten once the ring wraps"""
+        if not self._count:
+            raise IndexError("The history is empty")
+        return JointState(self.joints_num, self._data[(self._index - 1) % self._capacity])
+
+    def _rows(self, count: int):
+        """The newest count rows, oldest first, a view unless they wrap around the end of the ring"""
+        start = (self._index - count) % self._capacity
+        if start + count <= self._capacity:
+            return self._data[start:start + count]
+        return np.concatenate((self._data[start:], self._data[:self._index]))
+
+    def _split(self, rows):
+        joints_num = self.joints_num
+        return (rows[:, 0], rows[:, 1:1 + joints_num], rows[:, 1 + joints_num:1 + 2 * joints_num],
+                rows[:, 1 + 2 * joints_num:])
+
+    def states(self, count: int = None):
+        """(timestamps (n,), positions, velocities, torques (n, J)) of the newest count states, oldest first"""
+        count = self._count if count is None else min(count, self._count)
+        return self._split(self._rows(count))
+
+    def last(self, seconds: float):
+        """States of the last seconds before the newest time stamp, see states"""
+        rows = self._rows(self._count)
+        if len(rows):
+            rows = rows[np.searchsorted(rows[:, 0], rows[-1, 0] - seconds, side="left"):]
+        return self._split(rows)
+
+    def interpolate_position(self, timestamps):
+        """(N, J) positions at the time stamps (e.g. of a camera frame), linear between the kept states"""
+        if not self._count:
+            raise IndexError("The history is empty")
+        times, positions, _, _ = self.states()
+        timestamps = np.asarray(timestamps, dtype=np.float64)
+        return np.stack([np.interp(timestamps, times, positions[:, joint]) for joint in range(self.joints_num)],
+                        axis=-1)
+
+    @staticmethod
+    def benchmark(ticks_num: int = 100000):
+        """Lists and new objects every tick against in place JointState updates and the ring buffer"""
+        from devices.configuration import DynamicArmParam
+        np.random.seed(42)
+        readings = np.random.uniform(-180, 180, (ticks_num, 6))
+
+        start_time = time.perf_counter()
+        history_list = []
+        for reading in readings:
+            history_list.append((time.monotonic(), list(reading), [0.0] * 6, [0.0] * 6))
+            if len(history_list) > 1000:
+                history_list.pop(0)
+        list_cost = (time.perf_counter() - start_time) / ticks_num
+
+        state = JointState(6)
+        history = JointStateHistory(duration=2.0, rate=500, joints_num=6)
+        start_time = time.perf_counter()
+        for reading in readings:
+            state.update(position=reading)
+            history.append(state)
+        state_cost = (time.perf_counter() - start_time) / ticks_num
+
+        param = DynamicArmParam(joint_angle_list=[0.0] * 6)
+        start_time = time.perf_counter()
+        for reading in readings:
+            param.joint_angle = reading
+        param_cost = (time.perf_counter() - start_time) / ticks_num
+
+        start_time = time.perf_counter()
+        for _ in range(1000):
+            history.last(0.5)
+        print(f"per tick: lists + tuple history {list_cost * 1e6:.2f} us, JointState + ring "
+              f"{state_cost * 1e6:.2f} us, DynamicArmParam.joint_angle in place {param_cost * 1e6:.2f} us, "
+              f"last 0.5 s of the ring {(time.perf_counter() - start_time) / 1000 * 1e6:.2f} us")
+
+
+if __name__ == "__main__":
+    JointStateHistory.benchmark()
@@ -1,16 +1,20 @@
 from dataclasses import dataclass
-from .arm_param import StableArmParam, DynamicArmParam
+from .arm_param import StableArmParam, DynamicArmParam, DHParam
 
 
-@dataclass
+@dataclass(slots=True)
 class RoboticArmConfig:
     """
     :param armStableParam: The bone length of the robotic arm
     :param armDynamicParam: The J param
+    :param armDHParam: The DH parameters of the kinematics
     """
     armStableParam: StableArmParam
     armDynamicParam: DynamicArmParam
+    armDHParam: DHParam = None
 
     def print_info(self) -> None:
         print(self.armStableParam)
         print(self.armDynamicParam)
+        if self.armDHParam is not None:
+            print(self.armDHParam)
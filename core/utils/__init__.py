@@ -8,3 +8,4 @@
 # @Blog ：https://github.com/alfredzhang98
 from .locker import singletonDecorator
 from .type_switch import TypeSwitch
+from .crc16 import Crc16Engine, CRC16_XMODEM
@@ -0,0 +1,106 @@
+"""
+Table driven crc16 (msb first polynomials).
+
+The default is CRC-16/XMODEM (poly 0x1021, init 0x0000), the same value as crccheck.crc.Crc16 which is used by the
+AtomProtocols. This polynomial is served by binascii.crc_hqx which runs the table in C, other polynomials run the
+256 entry table in Python.
+
+Example:
+    >>> crc = Crc16Engine()
+    >>> crc.calc(b"123456789") == crc.update(crc.update(crc.init_value, b"1234"), b"56789")
+    True
+    >>> crc.calc_bytes(b"1234", b"56789")
+    b'1\\xc3'
+"""
+
+import binascii
+import time
+from typing import Iterable, List, Tuple
+
+
+class Crc16Engine:
+    def __init__(self, poly: int = 0x1021, init_value: int = 0x0000, xor_output: int = 0x0000):
+        """
+        :param poly: crc16 polynomial, msb first
+        :param init_value: start value of the register
+        :param xor_output: xor with the final register value
+        """
+        self._poly = poly & 0xFFFF
+        self._init_value = init_value & 0xFFFF
+        self._xor_output = xor_output & 0xFFFF
+        self._native = self._poly == 0x1021
+        self._table = self._build_table(self._poly)
+
+    @staticmethod
+    def _build_table(poly: int) -> Tuple[int, ...]:
+        table = []
+        for byte in range(256):
+            crc = byte << 8
+            for _ in range(8):
+                crc = ((crc << 1) ^ poly) if crc & 0x8000 else (crc << 1)
+            table.append(crc & 0xFFFF)
+        return tuple(table)
+
+    @property
+    def init_value(self) -> int:
+        return self._init_value
+
+    @property
+    def table(self) -> Tuple[int, ...]:
+        return self._table
+
+    def update(self, crc: int, data) -> int:
+        """
+        Continue the crc register over one more buffer
+        :param crc: register value, init_value for the first buffer
+        :param data: bytes-like or List[int]
+        :return: register value, call finish to get the crc
+        """
+        if self._native:
+            if not isinstance(data, (bytes, bytearray, memoryview)):
+                data = bytes(data)
+            return binascii.crc_hqx(data, crc)
+        table = self._table
+        for byte in data if not isinstance(data, memoryview) else data.cast("B"):
+            crc = ((crc << 8) & 0xFFFF) ^ table[((crc >> 8) ^ byte) & 0xFF]
+        return crc
+
+    def finish(self, crc: int) -> int:
+        return crc ^ self._xor_output
+
+    def calc(self, *buffers) -> int:
+        """crc16 over the buffers in order, they are not joined"""
+        crc = self._init_value
+        for buffer in buffers:
+            crc = self.update(crc, buffer)
+        return crc ^ self._xor_output
+
+    def calc_bytes(self, *buffers) -> bytes:
+        """crc16 as 2 bytes, msb first like the frame vpp field"""
+        return self.calc(*buffers).to_bytes(2, "big")
+
+    def verify_many(self, items: Iterable[Tuple[int, tuple]]) -> List[bool]:
+        """
+        Batch check of many frames
+        :param items: (expected crc, buffers of the frame)
+        :return: one bool per item
+        """
+        calc = self.calc
+        return [expected == calc(*buffers) for expected, buffers in items]
+
+    def benchmark(self, data_length: int = 1024, repeat: int = 20000):
+        data = bytes(range(256)) * (data_length // 256 + 1)
+        data = memoryview(data)[:data_length]
+        start_time = time.perf_counter()
+        for _ in range(repeat):
+            self.calc(data[:2], data[2:])
+        cost = (time.perf_counter() - start_time) / repeat
+        print(f"poly: {self._poly:#06x}, native: {self._native}, {data_length} bytes: {cost * 1e6:.2f} us")
+
+
+CRC16_XMODEM = Crc16Engine()
+
+
+if __name__ == "__main__":
+    CRC16_XMODEM.benchmark()
+    Crc16Engine(poly=0x8005).benchmark(repeat=200)
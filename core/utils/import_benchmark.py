@@ -0,0 +1,94 @@
+"""
+Import time of the packages against a fixed budget.
+
+Every module is imported by a new interpreter (core is the working directory), the best of some runs is compared with
+its budget. The heavy modules (matplotlib, Tk, numba) must not be imported on the way, so the packages start fast and
+without a display. numba is still required, it is loaded by the first call which needs it.
+The required modules (requirements.txt in the repository root) are checked first.
+
+Example (from core):
+    python -m utils.import_benchmark
+"""
+
+import importlib.util
+import os
+import subprocess
+import sys
+from typing import Dict, Tuple
+
+# Seconds, numpy alone is about 0.1 s
+IMPORT_BUDGETS = {
+    "algorithm.filter": 0.2,
+    "algorithm.transfer.transform_matrix": 0.2,
+    "algorithm.kinematics": 0.2,
+    "algorithm.trajectory": 0.2,
+    "communication.atom_protocols": 0.15,
+    "communication.async_atom_protocols": 0.15,
+}
+
+# Module -> requirements.txt entry, every one of them must be installed
+REQUIRED_MODULES = {
+    "numpy": "numpy",
+    "numba": "numba",
+    "serial": "pyserial",
+}
+
+# Modules which must not be imported by the packages
+FORBIDDEN_MODULES = ("matplotlib", "tkinter", "turtle", "numba")
+
+_MEASURE = """
+import sys, time
+start_time = time.perf_counter()
+import {module}
+cost = time.perf_counter() - start_time
+print(cost, ",".join(name for name in {forbidden!r} if name in sys.modules))
+"""
+
+
+def check_required_modules(modules: Dict[str, str] = None) -> bool:
+    """Print the required modules which are not installed, True if all of them are"""
+    modules = REQUIRED_MODULES if modules is None else modules
+    missing = [requirement for module, requirement in modules.items() if importlib.util.find_spec(module) is None]
+    for requirement in missing:
+        print(f"{requirement}: not installed, run python -m pip install -r requirements.txt")
+    return not missing
+
+
+def measure_import(module: str, repeat: int = 5) -> Tuple[float, list]:
+    """
+    :return: (best import time in seconds, forbidden modules imported by it)
+    """
+    core_path = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    best = None
+    forbidden = []
+    for _ in range(repeat):
+        result = subprocess.run([sys.executable, "-c", _MEASURE.format(module=module, forbidden=FORBIDDEN_MODULES)],
+                                cwd=core_path, capture_output=True, text=True)
+        if result.returncode != 0:
+            raise ImportError(result.stderr.strip().splitlines()[-1])
+        cost, _, loaded = result.stdout.strip().partition(" ")
+        best = float(cost) if best is None else min(best, float(cost))
+        forbidden = loaded.split(",") if loaded else []
+    return best, forbidden
+
+
+def check_import_budgets(budgets: Dict[str, float] = None, repeat: int = 5) -> bool:
+    """Print the import time of every module, True if all of them are in the budget"""
+    budgets = IMPORT_BUDGETS if budgets is None else budgets
+    passed = True
+    for module, budget in budgets.items():
+        try:
+            cost, forbidden = measure_import(module, repeat)
+        except ImportError as e:
+            print(f"{module}: cannot import ({e})")
+            passed = False
+            continue
+        ok = cost <= budget and not forbidden
+        passed = passed and ok
+        print(f"{module}: {cost * 1e3:.1f} ms, budget {budget * 1e3:.0f} ms"
+              f"{', imports ' + ', '.join(forbidden) if forbidden else ''} -> {'ok' if ok else 'over'}")
+    return passed
+
+
+if __name__ == "__main__":
+    sys.exit(0 if check_required_modules() and check_import_budgets() else 1)